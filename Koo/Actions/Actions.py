@@ -28,6 +28,7 @@
 ##############################################################################
 
 from PyQt5.QtWidgets import *
+import copy
 import time
 import datetime
 
@@ -39,107 +40,151 @@ from Koo.Common import Common
 from PyQt5.QtCore import *
 
 
-class ExecuteReportThread(QThread):
-    error = pyqtSignal()
-    warning = pyqtSignal()
+class ReportJob(QObject):
+    """
+    Generates a report in the server without blocking the user interface.
+
+    All calls are asynchronous. The server is asked whether the report is
+    ready first after 'firstDelay' milliseconds and then waiting longer
+    each time (up to 'maxDelay') until 'timeout' seconds have elapsed. Once
+    ready, the report is written to a file and opened or printed.
+
+    finished is emitted with True if the report was opened or printed.
+    """
+    finished = pyqtSignal(bool)
+
+    firstDelay = 250
+    maxDelay = 5000
+    backoff = 1.5
+    timeout = 200
 
     def __init__(self, name, data, context=None, parent=None):
-        QThread.__init__(self, parent)
+        QObject.__init__(self, parent)
         if context is None:
             context = {}
         self.name = name
-        self.datas = data.copy()
-        self.context = context
-        self.status = ''
-        self.session = Rpc.session.copy()
-
-    def run(self):
-        ids = self.datas['ids']
-        del self.datas['ids']
+        # Callers (such as wizards) may keep modifying their data while the
+        # report is generated, so keep it as it was when requested.
+        self.datas = copy.deepcopy(data)
+        self.ids = self.datas.pop('ids')
+        self.context = copy.deepcopy(Rpc.session.context)
+        self.context.update(copy.deepcopy(context))
+        self.reportId = None
+        self.delay = self.firstDelay
+        self.startTime = None
+        self.call = None
+
+    def start(self):
+        self.startTime = time.time()
+        if self.ids:
+            self.report()
+            return
+        self.call = Rpc.session.executeAsync(
+            self.searched, '/object', 'execute', self.datas['model'],
+            'search', [])
+
+    def searched(self, ids, exception):
+        if exception:
+            self.finish(False)
+            return
         if not ids:
-            try:
-                ids = self.session.call(
-                    '/object', 'execute', self.datas['model'], 'search', [])
-            except Rpc.RpcException as e:
-                self.error.emit((_('Error: %s') %
-                                            str(e.type), e.message, e.data))
-                return
-
-            if not ids:
-                self.warning.emit(_('Nothing to print.'))
-                return
-            self.datas['id'] = ids[0]
-        try:
-            ctx = self.session.context.copy()
-            ctx.update(self.context)
-            report_id = self.session.call(
-                '/report', 'report', self.name, ids, self.datas, ctx)
-            state = False
-            attempt = 0
-            while not state:
-                val = self.session.call('/report', 'report_get', report_id)
-                state = val['state']
-                if not state:
-                    time.sleep(1)
-                    attempt += 1
-                if attempt > 200:
-                    self.warning.emit(_(
-                        'Printing aborted. Delay too long.'))
-                    return False
-            Printer.printData(val)
-        except Rpc.RpcException as e:
-            self.error.emit((_('Error: %s') %
-                                        str(e.type), e.message, e.data))
+            QMessageBox.information(
+                None, _('Information'), _('Nothing to print!'))
+            self.finish(False)
+            return
+        self.ids = ids
+        self.datas['id'] = ids[0]
+        self.report()
+
+    def report(self):
+        self.call = Rpc.session.executeAsync(
+            self.reportStarted, '/report', 'report', self.name, self.ids,
+            self.datas, self.context)
+
+    def reportStarted(self, reportId, exception):
+        if exception:
+            self.finish(False)
+            return
+        self.reportId = reportId
+        self.poll()
+
+    def poll(self):
+        self.call = Rpc.session.executeAsync(
+            self.polled, '/report', 'report_get', self.reportId)
+
+    def polled(self, value, exception):
+        if exception:
+            self.finish(False)
+            return
+        if value['state']:
+            Printer.printData(value, self.datas['model'], self.ids)
+            self.finish(True)
+            return
+        if time.time() - self.startTime > self.timeout:
+            QMessageBox.information(None, _('Error'), _(
+                'Printing aborted, too long delay !'))
+            self.finish(False)
+            return
+        QTimer.singleShot(int(self.delay), self.poll)
+        self.delay = min(self.delay * self.backoff, self.maxDelay)
+
+    def finish(self, success):
+        self.call = None
+        self.finished.emit(success)
+
+
+class ReportManager(QObject):
+    """
+    Keeps track of the reports being generated, so several of them can be
+    run at the same time and the user can be shown how many are pending.
+
+    jobsChanged is emitted with the number of pending reports.
+    """
+    jobsChanged = pyqtSignal(int)
+
+    _instance = None
+
+    @staticmethod
+    def instance():
+        if not ReportManager._instance:
+            ReportManager._instance = ReportManager()
+        return ReportManager._instance
+
+    def __init__(self, parent=None):
+        QObject.__init__(self, parent)
+        self.jobs = []
+
+    def add(self, job):
+        """
+        Starts the given ReportJob.
+        """
+        self.jobs.append(job)
+        job.finished.connect(lambda success: self.remove(job))
+        self.jobsChanged.emit(len(self.jobs))
+        job.start()
+
+    def remove(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+        self.jobsChanged.emit(len(self.jobs))
+
+    def count(self):
+        return len(self.jobs)
 
 
 def executeReport(name, data, context=None):
     """
     Executes the given report.
 
+    The report is generated in the background (see ReportJob), so the
+    function returns as soon as it has been queued.
+
     :param name:
     :param data:
     :param context:
     :return:
     """
-
-    if context is None:
-        context = {}
-    QApplication.setOverrideCursor(Qt.WaitCursor)
-    datas = data.copy()
-    ids = datas['ids']
-    del datas['ids']
-    try:
-        if not ids:
-            ids = Rpc.session.execute(
-                '/object', 'execute', datas['model'], 'search', [])
-            if not ids:
-                QApplication.restoreOverrideCursor()
-                QMessageBox.information(
-                    None, _('Information'), _('Nothing to print!'))
-                return False
-            datas['id'] = ids[0]
-        ctx = Rpc.session.context.copy()
-        ctx.update(context)
-        report_id = Rpc.session.execute(
-            '/report', 'report', name, ids, datas, ctx)
-        state = False
-        attempt = 0
-        while not state:
-            val = Rpc.session.execute('/report', 'report_get', report_id)
-            state = val['state']
-            if not state:
-                time.sleep(1)
-                attempt += 1
-            if attempt > 200:
-                QApplication.restoreOverrideCursor()
-                QMessageBox.information(None, _('Error'), _(
-                    'Printing aborted, too long delay !'))
-                return False
-        Printer.printData(val, datas['model'], ids)
-    except Rpc.RpcException as e:
-        QApplication.restoreOverrideCursor()
-        return False
-    QApplication.restoreOverrideCursor()
+    ReportManager.instance().add(ReportJob(name, data, context))
     return True
 
 
@@ -144,7 +144,8 @@ class Wizard(QObject):
         ctx = self.context.copy()
         ctx.update(Rpc.session.context)
         self.thread = Rpc.session.executeAsync(
-            self.finishedStep, '/wizard', 'execute', self.wizardId, self.datas, self.state, ctx)
+            self.finishedStep, '/wizard', 'execute', self.wizardId, self.datas, self.state, ctx,
+            priority=Rpc.AsynchronousSessionCall.HighPriority)
 
     def finishedStep(self, res, exception):
         self.progress.stop()
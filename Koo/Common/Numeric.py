@@ -91,20 +91,38 @@ def floatToText(number, digits=None, thousands=False):
         number = float(number)
     if not isinstance(number, float):
         number = 0.0
-    if digits:
-        # Digits might come from the server as a tuple, list or a string
-        # So: (14,2), [14,2], '(14,2)' and '[14,2]' are all valid forms
-        if isinstance(digits, list) or isinstance(digits, tuple):
-            d = str(digits[1])
-        else:
-            d = digits.split(',')[1].strip(' )]')
-    else:
-        d = '2'
-
+    format = digitsFormat(digits)
     if thousands:
-        return locale.format('%.' + d + 'f', number, True, True)
+        return locale.format(format, number, True, True)
     else:
-        return ('%.' + d + 'f') % number
+        return format % number
+
+
+_digitsFormats = {}
+
+
+def digitsFormat(digits=None):
+    """
+    Returns the format string ('%.2f' by default) for the given digits
+    attribute of a float field. Formats are cached as they're needed every
+    time a float is shown.
+    :param digits:
+    :return:
+    """
+    key = tuple(digits) if isinstance(digits, list) else digits
+    format = _digitsFormats.get(key)
+    if format is None:
+        if digits:
+            # Digits might come from the server as a tuple, list or a string
+            # So: (14,2), [14,2], '(14,2)' and '[14,2]' are all valid forms
+            if isinstance(digits, list) or isinstance(digits, tuple):
+                d = str(digits[1])
+            else:
+                d = digits.split(',')[1].strip(' )]')
+        else:
+            d = '2'
+        format = _digitsFormats[key] = '%.' + d + 'f'
+    return format
 
 
 def integerToText(number):
@@ -69,11 +69,17 @@ class Settings(object):
         'koo.tabs_closable': True,
         'koo.show_toolbar': True,
         'koo.sort_mode': 'all_items',
+        'koo.search_limit': 1000,
+        'koo.rpc_workers': 4,
+        'koo.load_chunk_size': 500,
+        'koo.completion_limit': 20,
         'koo.pos_mode': False,
         'koo.enter_as_tab': False,
         'kde.enabled': True,
         'koo.attachments_dialog': False,
         'koo.load_on_open': True,
+        'koo.persistent_cache': True,
+        'koo.cache_file': '',
         'koo.smtp_server': 'mail.nan-tic.com',
         'koo.smtp_from': 'koo@nan-tic.com',
         'koo.smtp_backtraces_to': 'backtraces@nan-tic.com',
@@ -25,6 +25,7 @@
 #
 ##############################################################################
 
+from PyQt5.QtCore import QTimer
 from Koo import Rpc
 
 
@@ -37,8 +38,18 @@ class ViewSettings:
     end up converted to/from a QByteArray; hence the need of ensuring
     we use str instead of unicode. That's why we enforce str() in a
     couple of places.
+
+    The settings of all views of the user are loaded with a single call
+    the first time they're needed (or at login, see preload()). Stored
+    settings are kept in a queue and sent to the server all at once when
+    the application is idle or the user logs out (see flush()).
     """
     cache = {}
+    pending = {}
+    loaded = False
+    flushScheduled = False
+    # Milliseconds to wait after a store before sending settings to the server
+    flushDelay = 2000
     databaseName = None
     uid = None
     hasSettingsModule = True
@@ -73,29 +84,81 @@ class ViewSettings:
         if not ViewSettings.hasSettingsModule:
             return
 
+        ViewSettings.pending[id] = settings
+        if not ViewSettings.flushScheduled:
+            ViewSettings.flushScheduled = True
+            QTimer.singleShot(ViewSettings.flushDelay, ViewSettings.flush)
+
+    @staticmethod
+    def flush():
+        """
+        Sends the settings stored since the last flush to the server in a
+        single call.
+        :return:
+        """
+        ViewSettings.flushScheduled = False
+        ViewSettings.checkConnection()
+        if not ViewSettings.pending or not ViewSettings.hasSettingsModule:
+            ViewSettings.pending = {}
+            return
+        pending = ViewSettings.pending
+        settings = [(id, data or False) for id, data in pending.items()]
+        ViewSettings.pending = {}
         try:
             # We don't want to crash if the koo module is not installed on the server
-            # but we do want to crash if there are mistakes in setViewSettings() code.
-            ids = Rpc.session.call('/object', 'execute', 'nan.koo.view.settings', 'search', [
-                ('user', '=', Rpc.session.uid), ('view', '=', id)
-            ])
-        except:
-            ViewSettings.hasSettingsModule = False
+            Rpc.session.call('/object', 'execute', 'nan.koo.view.settings',
+                             'set_user_settings', settings)
+        except Rpc.RpcException as exception:
+            if ViewSettings.isUnsupported(exception, 'set_user_settings'):
+                ViewSettings.hasSettingsModule = False
+                return
+            # Keep the settings, unless newer ones were stored meanwhile, and
+            # try again later.
+            for id, data in pending.items():
+                ViewSettings.pending.setdefault(id, data)
+            if not ViewSettings.flushScheduled:
+                ViewSettings.flushScheduled = True
+                QTimer.singleShot(ViewSettings.flushDelay, ViewSettings.flush)
+
+    @staticmethod
+    def preload():
+        """
+        Loads the settings of all the views of the user with a single call
+        to the server.
+        :return:
+        """
+        ViewSettings.checkConnection()
+        if ViewSettings.loaded or not ViewSettings.hasSettingsModule:
+            return
+        try:
+            # We don't want to crash if the koo module is not installed on the server
+            settings = Rpc.session.call('/object', 'execute',
+                                        'nan.koo.view.settings',
+                                        'get_user_settings')
+        except Rpc.RpcException as exception:
+            # If the error is transient settings will be loaded next time
+            if ViewSettings.isUnsupported(exception, 'get_user_settings'):
+                ViewSettings.hasSettingsModule = False
             return
-        # As 'nan.koo.view.settings' is proved to exist we don't need try-except here. And we
-        # can use execute() instead of call().
-        if ids:
-            Rpc.session.execute('/object', 'execute', 'nan.koo.view.settings', 'write', ids, {
-                'data': settings
-            })
-        else:
-            Rpc.session.execute('/object', 'execute', 'nan.koo.view.settings', 'create', {
-                'user': Rpc.session.uid,
-                'view': id,
-                'data': settings
-            })
-
-    # @brief
+        for id, data in settings:
+            # Ensure it's a string and not unicode
+            data = data and str(data) or None
+            # Settings stored during this session take precedence
+            ViewSettings.cache.setdefault(id, data)
+        ViewSettings.loaded = True
+
+    @staticmethod
+    def isUnsupported(exception, method):
+        """
+        Returns True if the exception means the koo module is not installed
+        on the server, or doesn't provide the given method.
+        :param exception:
+        :param method:
+        :return:
+        """
+        return (isinstance(exception, Rpc.RpcServerException) and
+                exception.isUnsupported(method, 'nan.koo.view.settings'))
+
     @staticmethod
     def load(id):
         """
@@ -106,40 +169,10 @@ class ViewSettings:
         if not id:
             return None
 
-        ViewSettings.checkConnection()
-        if id in ViewSettings.cache:
-            # Restore settings from the cache. Note that even if the required koo
-            # module is not installed in the server view settings will be kept
-            # during user session.
-            return ViewSettings.cache[id]
-
-        if not ViewSettings.hasSettingsModule:
-            return None
-
-        try:
-            # We don't want to crash if the koo module is not installed on the server
-            # but we do want to crash if there are mistakes in setViewSettings() code.
-            ids = Rpc.session.call('/object', 'execute', 'nan.koo.view.settings', 'search', [
-                ('user', '=', Rpc.session.uid), ('view', '=', id)
-            ])
-        except:
-            ViewSettings.hasSettingsModule = False
-            return None
-
-        # As 'nan.koo.view.settings' is proved to exist we don't need try-except here.
-        if not ids:
-            ViewSettings.cache[id] = None
-            return None
-        settings = Rpc.session.execute(
-            '/object', 'execute', 'nan.koo.view.settings', 'read', ids, ['data'])[0]['data']
-
-        if settings:
-            # Ensure it's a string and not unicode
-            settings = str(settings)
-
-        ViewSettings.cache[id] = settings
-
-        return settings
+        ViewSettings.preload()
+        # Note that even if the required koo module is not installed in the
+        # server view settings will be kept during user session.
+        return ViewSettings.cache.get(id)
 
     @staticmethod
     def checkConnection():
@@ -156,9 +189,14 @@ class ViewSettings:
         Clears cache and resets state. This means that after installing the koo
         module you don't have to close session and login again because
         hasSettingsModule is reset to True.
+
+        Settings not sent to the server yet are discarded, so call flush()
+        before if they should be kept.
         :return:
         """
         ViewSettings.databaseName = Rpc.session.databaseName
         ViewSettings.uid = Rpc.session.uid
         ViewSettings.hasSettingsModule = True
+        ViewSettings.loaded = False
         ViewSettings.cache = {}
+        ViewSettings.pending = {}
@@ -461,11 +461,15 @@ class StoredExportsModel(QStandardItemModel):
         if self.rowCount() > 0:
             self.removeRows(0, self.rowCount())
         ir_export = Rpc.RpcProxy('ir.exports')
-        ir_export_line = Rpc.RpcProxy('ir.exports.line')
         export_ids = ir_export.search([('resource', '=', model)])
-        for export in ir_export.read(export_ids):
-            fields = ir_export_line.read(export['export_fields'])
-
+        exports = ir_export.read(export_ids)
+        # Read the lines of all exports in a single round trip
+        lines = Rpc.session.executeMany([
+            ('ir.exports.line', 'read', (export['export_fields'],))
+            for export in exports
+        ])
+        for export, fields in zip(exports, lines):
+            fields = fields or []
             allFound = True
             for f in fields:
                 if not f['name'] in fieldsInfo:
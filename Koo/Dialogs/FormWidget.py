@@ -134,6 +134,7 @@ class FormWidget(QWidget, FormWidgetUi):
         self.group = RecordGroup(self.model, context=self.context)
         if Settings.value('koo.sort_mode') == 'visible_items':
             self.group.setSortMode(RecordGroup.SortVisibleItems)
+        self.group.setSearchLimit(Settings.value('koo.search_limit', 0, int))
         self.group.setDomain(domain)
         self.group.modified.connect(self.notifyRecordModified)
 
@@ -258,6 +259,7 @@ class FormWidget(QWidget, FormWidgetUi):
         dialog = GoToIdDialog(self)
         if dialog.exec_() == QDialog.Rejected:
             return
+        self.group.fetchAll()
         if not dialog.result in self.group.ids():
             QMessageBox.information(self, _('Go To Id'), _(
                 "Resouce with ID '%s' not found.") % dialog.result)
@@ -100,8 +100,7 @@ if isWebKitAvailable:
 
         def accepted(self):
             for thread in self.queryThreads:
-                thread.terminate()
-                thread.wait()
+                thread.cancel()
 
         def showHelp(self, link):
             QApplication.postEvent(self.sender(), QEvent(QEvent.WhatsThis))
@@ -158,7 +157,8 @@ if isWebKitAvailable:
 
             # We always query for limit+1 items so we can know if there will be more records in the next page
             thread = Rpc.session.executeAsync(self.showResults, '/fulltextsearch', 'search',
-                                              self.textToQuery(), self.limit + 1, self.offset, model, Rpc.session.context)
+                                              self.textToQuery(), self.limit + 1, self.offset, model, Rpc.session.context,
+                                              priority=Rpc.AsynchronousSessionCall.HighPriority)
             self.queryThreads.append(thread)
 
             QApplication.restoreOverrideCursor()
@@ -43,6 +43,7 @@ from .AdministratorPasswordDialog import *
 
 from Koo.Common.Settings import Settings
 from Koo.Common import Api
+from Koo import Actions
 from Koo.Common import ViewSettings
 from Koo.Common import RemoteHelp
 
@@ -104,6 +105,11 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
 
         self.uiServerInformation.setText(_('Press Ctrl+O to login'))
 
+        # Reports are generated in the background, show how many are pending
+        self.uiReports.hide()
+        Actions.ReportManager.instance().jobsChanged[int].connect(
+            self.updateReportsStatus)
+
         self.tabWidget = MainTabWidget(self. centralWidget())
         self.tabWidget.currentChanged[int].connect(self.currentChanged)
         self.tabWidget.middleClicked[int].connect(self.closeTab)
@@ -448,6 +454,11 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
         self.pendingRequests = len(ids)
         return (ids, ids2)
 
+    def updateReportsStatus(self, count):
+        if count:
+            self.uiReports.setText(_('Printing %d report(s)...') % count)
+        self.uiReports.setVisible(bool(count))
+
     def help(self):
         widget = self.tabWidget.currentWidget()
         if widget:
@@ -457,7 +468,8 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
         from Koo.Common import Version
 
         Rpc.session.callAsync(self.newReleaseInformation, '/object', 'execute', 'nan.koo.release',
-                              'needs_update', Version.Version, os.name, True, Rpc.session.context)
+                              'needs_update', Version.Version, os.name, True, Rpc.session.context,
+                              priority=Rpc.AsynchronousSessionCall.LowPriority)
 
     def newReleaseInformation(self, value, exception):
         if exception:
@@ -506,10 +518,13 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
                 if Settings.value('koo.stylesheet_code'):
                     QApplication.instance().setStyleSheet(Settings.value('koo.stylesheet_code'))
                 if Settings.value('koo.use_cache'):
-                    Rpc.session.cache = Rpc.Cache.ActionViewCache()
+                    Rpc.session.cache = self.createCache()
                 else:
                     Rpc.session.cache = None
 
+                # Load the settings of all views at once
+                ViewSettings.ViewSettings.preload()
+
                 iconVisible = Settings.value('koo.show_system_tray_icon', True)
                 self.systemTrayIcon.setVisible(iconVisible)
 
@@ -572,6 +587,7 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
         self.uiUserName.setText(_('Not logged !'))
         self.uiServerInformation.setText(_('Press Ctrl+O to login'))
         self.setWindowTitle(self.fixedWindowTitle)
+        ViewSettings.ViewSettings.flush()
         Rpc.session.logout()
         self.updateEnabledActions()
         self.updateUserShortcuts()
@@ -725,10 +741,41 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
             return
         Api.instance.execute(id, {'window': self})
 
+    def createCache(self):
+        """
+        Returns the cache to use for the current session.
+
+        If the koo server module provides a cache stamp, views and actions
+        are also stored on disk so they're reused across restarts while the
+        stamp doesn't change. Otherwise they're kept in memory only.
+        :return: Cache
+        """
+        if not Settings.value('koo.persistent_cache', True):
+            return Rpc.Cache.ActionViewCache()
+        try:
+            stamp = Rpc.session.call('/koo', 'cache_stamp',
+                                     Rpc.session.context)
+        except Exception:
+            stamp = None
+        if not stamp:
+            return Rpc.Cache.ActionViewCache()
+        path = Settings.value('koo.cache_file')
+        if not path:
+            directory = os.path.dirname(Settings.rcFile or '') or \
+                str(QDir.homePath())
+            path = os.path.join(directory, '.koo_cache.sqlite')
+        cache = Rpc.Cache.PersistentViewCache(path)
+        scope = (Rpc.session.url, Rpc.session.databaseName, Rpc.session.uid,
+                 Rpc.session.context.get('lang'))
+        if not cache.open(scope, stamp):
+            return Rpc.Cache.ActionViewCache()
+        return cache
+
     def clearCache(self):
+        ViewSettings.ViewSettings.flush()
         ViewSettings.ViewSettings.clear()
         if Rpc.session.cache:
-            Rpc.session.cache.clear()
+            Rpc.session.cache.purge()
 
     def closeEvent(self, event):
         if QMessageBox.question(
@@ -743,6 +790,7 @@ class KooMainWindow(QMainWindow, KooMainWindowUi):
             if not wid.canClose():
                 event.ignore()
                 return
+        ViewSettings.ViewSettings.flush()
         Rpc.session.logout()
         self.systemTrayIcon.setVisible(False)
 
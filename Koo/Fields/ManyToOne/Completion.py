@@ -0,0 +1,158 @@
+##############################################################################
+#
+# Copyright (c) 2008 Albert Cervera i Areny <albert@nan-tic.com>
+#
+# WARNING: This program as such is intended to be used by professional
+# programmers who take the whole responsability of assessing all potential
+# consequences resulting from its eventual inadequacies and bugs
+# End users who are looking for a ready-to-use solution with commercial
+# garantees and support are strongly adviced to contract a Free Software
+# Service Company
+#
+# This program is Free Software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+##############################################################################
+
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from collections import OrderedDict
+
+from Koo import Rpc
+from Koo.Common.Settings import Settings
+
+
+class CompletionSource(QObject):
+    """
+    Provides name completion for the many2one fields of a relation.
+
+    There's a single source per relation and session (see instance()) and
+    the completers of all widgets of the relation share its model. As the
+    user types, name_search is called asynchronously with a limit once no
+    more keys have been pressed for 'delay' milliseconds. Results are kept
+    by text, domain and context, discarding the least recently used ones
+    when there are more than 'maxEntries'.
+    """
+    # Emitted with the text whose results have just been set in the model.
+    completed = pyqtSignal(str)
+
+    IdRole = Qt.UserRole
+
+    sources = {}
+    session = None
+
+    def __init__(self, relation, parent=None):
+        QObject.__init__(self, parent)
+        self.relation = relation
+        self.limit = Settings.value('koo.completion_limit', 20, int)
+        self.delay = 250
+        self.maxEntries = 200
+        self.cache = OrderedDict()
+        self.model = QStandardItemModel(self)
+        self.request = None
+        self.call = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.query)
+
+    @staticmethod
+    def instance(relation):
+        """
+        Returns the completion source of the given relation for the current
+        session.
+        """
+        session = (Rpc.session.url, Rpc.session.databaseName, Rpc.session.uid)
+        if session != CompletionSource.session:
+            CompletionSource.session = session
+            CompletionSource.sources = {}
+        source = CompletionSource.sources.get(relation)
+        if not source:
+            source = CompletionSource(relation)
+            CompletionSource.sources[relation] = source
+        return source
+
+    @staticmethod
+    def displayName(name):
+        # Don't show the code (as in '[CODE] Name') used by some models
+        if name and name[0] == '[':
+            return name[name.find(']') + 2:]
+        return name
+
+    @staticmethod
+    def setModelValues(model, values):
+        """
+        Fills 'model' with the (id, name) pairs of the 'values' list, as
+        returned by name_search.
+        """
+        model.clear()
+        for ident, name in values:
+            item = QStandardItem(CompletionSource.displayName(name or ''))
+            item.setData(ident, CompletionSource.IdRole)
+            model.appendRow(item)
+
+    def complete(self, text, domain=None, context=None):
+        """
+        Requests the completions for 'text'. If they're cached the model is
+        updated immediately, otherwise the server is queried after 'delay'
+        milliseconds unless another request arrives in the meanwhile.
+        """
+        domain = domain or []
+        context = context or {}
+        key = (text, repr(domain), repr(context))
+        self.request = (key, text, domain, context)
+        if key in self.cache:
+            self.timer.stop()
+            self.cache.move_to_end(key)
+            self.setValues(text, self.cache[key])
+            return
+        self.timer.start(self.delay)
+
+    def query(self):
+        if not self.request:
+            return
+        if self.call:
+            self.call.cancel()
+        key, text, domain, context = self.request
+
+        def received(result, exception):
+            self.call = None
+            # Completion is only a help to the user so errors are ignored
+            if exception:
+                return
+            self.store(key, result or [])
+            if self.request and self.request[0] == key:
+                self.setValues(text, result or [])
+
+        self.call = Rpc.session.callAsync(
+            received, '/object', 'execute', self.relation, 'name_search',
+            text, domain, 'ilike', context, self.limit,
+            priority=Rpc.AsynchronousSessionCall.HighPriority)
+
+    def store(self, key, values):
+        self.cache[key] = values
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.maxEntries:
+            self.cache.popitem(last=False)
+
+    def setValues(self, text, values):
+        CompletionSource.setModelValues(self.model, values)
+        self.completed.emit(text)
+
+    def clear(self):
+        self.timer.stop()
+        if self.call:
+            self.call.cancel()
+            self.call = None
+        self.request = None
+        self.cache = OrderedDict()
@@ -42,6 +42,7 @@ from Koo import Rpc
 
 from Koo.Fields.AbstractFieldWidget import *
 from Koo.Fields.AbstractFieldDelegate import *
+from .Completion import CompletionSource
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from Koo.Common.Ui import *
@@ -102,33 +103,39 @@ class ManyToOneFieldWidget(AbstractFieldWidget, ManyToOneFieldWidgetUi):
     def delayedInitGui(self):
         # Name completion can be delayied without side effects.
         if self.attrs.get('completion'):
-            ids = Rpc.session.execute(
-                '/object', 'execute', self.attrs['relation'], 'name_search', '', [], 'ilike', Rpc.session.context, False)
-            if ids:
-                self.loadCompletion(ids)
+            # Names are searched as the user types, sharing the model (and
+            # the results) with all the fields of the same relation.
+            self.completionSource = CompletionSource.instance(
+                self.attrs['relation'])
+            self.completionSource.completed.connect(self.showCompletion)
+            self.uiText.textEdited.connect(self.requestCompletion)
+            self.setCompletionModel(self.completionSource.model)
         elif self.attrs.get('selection'):
             self.loadCompletion(self.attrs.get('selection'))
 
     def loadCompletion(self, ids):
+        model = QStandardItemModel(self)
+        CompletionSource.setModelValues(model, ids)
+        self.setCompletionModel(model)
+
+    def setCompletionModel(self, model):
         self.completer = QCompleter()
         self.completer.setCaseSensitivity(Qt.CaseInsensitive)
         self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
         self.completer.activated[QModelIndex].connect(self.completerActivated)
+        self.completer.setModel(model)
         self.uiText.setCompleter(self.completer)
 
-        model = QStandardItemModel(self)
-        self.completerList = []
-        for key, value in enumerate(ids):
-            if value[1] and value[1][0] == '[':
-                i = value[1].find(']')
-                text = value[1][i + 2:]
-            else:
-                text = value[1]
-            self.completerList.append((key, text))
-            model.appendRow([QStandardItem(key), QStandardItem(text)])
+    def requestCompletion(self, text):
+        if not self.record or not text.strip():
+            return
+        self.completionSource.complete(str(text),
+                                       self.record.domain(self.name),
+                                       self.record.fieldContext(self.name))
 
-        self.completer.setModel(model)
-        self.completer.setCompletionColumn(1)
+    def showCompletion(self, text):
+        if self.uiText.hasFocus() and str(self.uiText.text()) == text:
+            self.completer.complete()
 
     def clear(self):
         # As the 'clear' button might modify the model we need to be sure all other fields/widgets
@@ -157,8 +164,7 @@ class ManyToOneFieldWidget(AbstractFieldWidget, ManyToOneFieldWidgetUi):
         return self.uiText
 
     def completerActivated(self, index):
-        id = self.completerList[index.row()][0]
-        assert isinstance(id, int), id
+        id = index.data(CompletionSource.IdRole)
         text = str(index.data())
         self.record.setValue(self.name, (id, text))
 
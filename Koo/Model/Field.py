@@ -327,20 +327,37 @@ class ManyToOneField(StringField):
         :return:
         """
 
-        if record.values[self.name]:
-            return record.values[self.name][1]
+        value = record.values[self.name]
+        if value and value[1] is None:
+            # The name is still pending, so resolve it together with all
+            # other pending names of the group. It's queued again in case it
+            # was queued in another group or evicted from the cache.
+            relation = self.attrs['relation']
+            nameCache = Rpc.session.nameCache
+            record.group.queueName(relation, value[0])
+            record.group.resolveNames()
+            if not nameCache.exists(relation, value[0]):
+                # In some very rare cases we may get an empty list from the
+                # server. Keep the id so the value isn't lost.
+                return ''
+            value = [value[0], nameCache.get(relation, value[0])]
+            record.values[self.name] = value
+        if value:
+            return value[1]
         return False
 
     def set(self, record, value, test_state=False, modified=False):
-        if value and isinstance(value, (int, str)):
-            Rpc2 = RpcProxy(self.attrs['relation'])
-            result = Rpc2.name_get([value], Rpc.session.context)
-
-            # In some very rare cases we may get an empty
-            # list from the server so we just check it before
-            # trying to store result[0]
-            if result:
-                record.values[self.name] = result[0]
+        if value and isinstance(value, str):
+            try:
+                value = int(value)
+            except ValueError:
+                value = False
+        if value and isinstance(value, int):
+            # Instead of calling name_get for each value, queue the id in the
+            # group so names are fetched in batch the first time one of them
+            # is needed. See RecordGroup.resolveNames().
+            record.values[self.name] = record.group.queueName(
+                self.attrs['relation'], value)
         else:
             record.values[self.name] = value
         if modified:
@@ -350,7 +367,10 @@ class ManyToOneField(StringField):
     def set_client(self, record, value, test_state=False):
         internal = record.values[self.name]
         self.set(record, value, test_state)
-        if internal != record.values[self.name]:
+        # Only ids are compared as the name may not have been fetched yet
+        # (see RecordGroup.queueName()).
+        current = record.values[self.name]
+        if (internal and internal[0]) != (current and current[0]):
             self.changed(record)
 
 
@@ -66,6 +66,9 @@ class RecordGroup(QObject):
     RecordGroup will emit several kinds of signals on certain events.
     """
     recordsInserted = pyqtSignal(int, int)
+    # Emitted by fetchMore() and fetchAll() before ids are added so models
+    # can notify their views, see KooModel.recordsAboutToBeInserted()
+    recordsAboutToBeInserted = pyqtSignal(int, int)
     recordsRemoved = pyqtSignal(int, int)
     recordChangedSignal = pyqtSignal('PyQt_PyObject')
     # recordChanged = pyqtSignal(QObject)
@@ -73,6 +76,22 @@ class RecordGroup(QObject):
     modified = pyqtSignal()
     # @xtorello toreview signal int type
     sorting = pyqtSignal(int)
+    # Emitted by ensureAllLoaded() and loadAllInBackground() with the number
+    # of records loaded so far and the total to load.
+    loadProgress = pyqtSignal(int, int)
+    # Emitted by loadAllInBackground() with the list of records of each
+    # chunk once they've been loaded.
+    recordsLoaded = pyqtSignal('PyQt_PyObject')
+    # Emitted by loadAllInBackground() when it finishes. The parameter is
+    # False if it was cancelled or an error occurred.
+    loadFinished = pyqtSignal(bool)
+    # Emitted by ensureRecordLoaded() with the list of records whose values
+    # have been read from the server, as recordChangedSignal is not emitted
+    # for each of them.
+    recordsValuesLoaded = pyqtSignal('PyQt_PyObject')
+    # Emitted by setContext(). One2many fields set the context of their group
+    # again whenever their parent record is displayed.
+    contextChanged = pyqtSignal()
 
     SortVisibleItems = 1
     SortAllItems = 2
@@ -117,6 +136,12 @@ class RecordGroup(QObject):
         self.loadFieldObjects(list(self.fields.keys()))
 
         self.records = []
+        # Row index of 'records'. It maps record ids to rows ('_rowById') and
+        # the items stored in 'records' (either Record objects or plain ids)
+        # to rows ('_rowByItem'). Both are kept up to date on appends and
+        # rebuilt lazily (see _ensureIndex()) after any other modification.
+        self._rowById = {}
+        self._rowByItem = {}
 
         # @xtorello toreview signal to method integration
         # self.recordChangedSignal.connect(self.recordChanged)
@@ -145,6 +170,21 @@ class RecordGroup(QObject):
 
         self._allFieldsLoaded = False
 
+        # Ids whose name is pending by relation model. See queueName().
+        self._pendingNames = {}
+
+        # Paged search state. See setSearchLimit() and fetchMore().
+        self._searchLimit = 0
+        self._searchArgs = None
+        self._searchOffset = 0
+        self._searchCount = 0
+
+        # Chunked loading state. See loadAllInBackground().
+        self.loadChunkSize = Settings.value('koo.load_chunk_size', 500, int)
+        self._loadIds = None
+        self._loadCall = None
+        self._loadTotal = 0
+
         self.load(ids)
         self.removedRecords = []
         self._onWriteFunction = ''
@@ -202,6 +242,7 @@ class RecordGroup(QObject):
                 r.recordChanged.disconnect()
             except Exception:
                 pass
+            r.connectedGroup = None
 
             r.__del__()
         self.records = []
@@ -298,25 +339,22 @@ class RecordGroup(QObject):
         # It's expected it'll return a list of ids to be loaded or reloaded.
         new_ids = getattr(self.rpc, self._onWriteFunction)(
             editedId, self.context())
-        record_idx = self.records.index(self.recordById(editedId))
+        record_idx = self.indexOfId(editedId)
         result = False
         indexes = []
         for id in new_ids:
-            cont = False
-            for m in self.records:
+            row = self.indexOfId(id)
+            if row >= 0:
+                m = self.records[row]
                 if isinstance(m, Record):
-                    if m.id == id:
-                        cont = True
-                        # TODO: Shouldn't we just call cancel() so the record
-                        # is reloaded on demand?
-                        m.reload()
-            if cont:
+                    # TODO: Shouldn't we just call cancel() so the record
+                    # is reloaded on demand?
+                    m.reload()
                 continue
             # TODO: Should we reconsider this? Do we need/want to reload.
             # Probably we only want to add the id to the list.
             record = Record(id, self, parent=self.parent)
-            record.recordChanged['PyQt_PyObject'].connect(self.recordChanged)
-            record.recordModified['PyQt_PyObject'].connect(self.recordModified)
+            record.connectedGroup = self
             record.reload()
             if not result:
                 result = record
@@ -342,9 +380,8 @@ class RecordGroup(QObject):
         for value in values:
             record = Record(value['id'], self, parent=self.parent)
             record.set(value)
-            self.records.append(record)
-            record.recordChanged['PyQt_PyObject'].connect(self.recordChanged)
-            record.recordModified['PyQt_PyObject'].connect(self.recordModified)
+            self._appendItem(record)
+            record.connectedGroup = self
         end = len(self.records) - 1
         self.recordsInserted.emit(start, end)
 
@@ -364,6 +401,7 @@ class RecordGroup(QObject):
 
         if not ids:
             return
+        self._ensureIndex()
         if addOnTop:
             start = 0
             # Discard from 'ids' those that are already loaded.
@@ -372,20 +410,23 @@ class RecordGroup(QObject):
             # because when records are actually loaded they're only checked
             # against a single appearance of the id in the list of records.
             #
-            # Note we don't use sets to discard ids, because we want to keep
-            # the order their order and because it can cause infinite recursion.
-            currentIds = self.ids()
+            # Note the id index is only used to check membership, so the
+            # order of 'ids' is kept.
+            newIds = []
             for ident in ids:
-                if ident not in currentIds:
-                    self.records.insert(0, ident)
+                if ident not in self._rowById:
+                    self._rowById[ident] = -1
+                    newIds.append(ident)
+            newIds.reverse()
+            self.records[0:0] = newIds
+            self.invalidateIndex()
             end = len(ids) - 1
         else:
             start = len(self.records)
             # Discard from 'ids' those that are already loaded. Same as above.
-            currentIds = self.ids()
             for ident in ids:
-                if ident not in currentIds:
-                    self.records.append(ident)
+                if ident not in self._rowById:
+                    self._appendItem(ident)
             end = len(self.records) - 1
         # We consider the group is updated because otherwise calling count()
         # would force an update() which would cause one2many relations to
@@ -400,11 +441,17 @@ class RecordGroup(QObject):
         """
         for record in self.records:
             if isinstance(record, Record):
-                record.recordChanged['PyQt_PyObject'].disconnect(self.recordChanged)
-                record.recordModified['PyQt_PyObject'].disconnect(self.recordModified)
+                if record.connectedGroup is self:
+                    record.connectedGroup = None
+        self.cancelLoading()
         last = len(self.records) - 1
         self.records = []
+        self._rowById = {}
+        self._rowByItem = {}
         self.removedRecords = []
+        self._searchArgs = None
+        self._searchOffset = 0
+        self._searchCount = 0
         self.recordsRemoved.emit(0, last)
 
     def context(self):
@@ -425,6 +472,7 @@ class RecordGroup(QObject):
         :return:
         """
         self._context = context.copy()
+        self.contextChanged.emit()
 
     def add(self, record, position=-1):
         """
@@ -443,12 +491,12 @@ class RecordGroup(QObject):
             record.group = self
 
         if position == -1:
-            self.records.append(record)
+            self._appendItem(record)
         else:
             self.records.insert(position, record)
+            self.invalidateIndex()
         record.parent = self.parent
-        record.recordChanged['PyQt_PyObject'].connect(self.recordChanged)
-        record.recordModified['PyQt_PyObject'].connect(self.recordModified)
+        record.connectedGroup = self
         return record
 
     def create(self, default=True, position=-1, domain=None, context=None):
@@ -502,7 +550,7 @@ class RecordGroup(QObject):
         if self._signalsEnabled:
             self.modified.emit()
         if self.parent:
-            self.parent.recordModified.emit(self.parent)
+            self.parent.notifyModified()
 
     def removeRecord(self, record):
         """
@@ -514,12 +562,14 @@ class RecordGroup(QObject):
         :rtype: None
         """
 
-        idx = self.records.index(record)
+        idx = self.indexOfRecord(record)
+        if idx < 0:
+            return
         if isinstance(record, Record):
             ident = record.id
         else:
             ident = record
-        if id:
+        if ident:
             # Only store removedRecords if they have a valid Id.
             # Otherwise we don't need them because they don't have
             # to be removed in the server.
@@ -546,9 +596,9 @@ class RecordGroup(QObject):
         lastIdx = -1
         toRemove = []
         for record in records:
-            if not record in records:
+            idx = self.indexOfRecord(record)
+            if idx < 0:
                 continue
-            idx = self.records.index(record)
             if firstIdx < 0 or idx < firstIdx:
                 firstIdx = idx
             if lastIdx < 0 or idx > lastIdx:
@@ -565,7 +615,8 @@ class RecordGroup(QObject):
             if isinstance(record, Record):
                 if record.parent:
                     record.parent.modified = True
-            self.freeRecord(record)
+            toRemove.append(record)
+        self.freeRecords(toRemove)
         self.modified.emit()
         self.recordsRemoved.emit(firstIdx, lastIdx)
 
@@ -616,24 +667,150 @@ class RecordGroup(QObject):
         self.loadFieldObjects(to_add)
         return to_add
 
+    def queueName(self, relation, ident):
+        """
+        Returns the many2one value ([id, name]) for the given 'relation'
+        model and 'ident'.
+
+        If the name isn't in the session name cache, the id is queued and the
+        returned value has None as name. resolveNames() fetches all queued
+        names with a single name_get per relation.
+        :param relation: Model name
+        :param ident: Record id
+        :return: many2one value
+        :rtype: list
+        """
+        nameCache = Rpc.session.nameCache
+        if nameCache.exists(relation, ident):
+            return [ident, nameCache.get(relation, ident)]
+        self._pendingNames.setdefault(relation, set()).add(ident)
+        return [ident, None]
+
+    def resolveNames(self):
+        """
+        Fetches the names queued by queueName() and stores them in the
+        session name cache.
+        :return: None
+        :rtype: None
+        """
+        pending = self._pendingNames
+        self._pendingNames = {}
+        nameCache = Rpc.session.nameCache
+        for relation, ids in pending.items():
+            ids = [x for x in ids if not nameCache.exists(relation, x)]
+            if not ids:
+                continue
+            names = RpcProxy(relation).name_get(ids, Rpc.session.context)
+            nameCache.add(relation, names or [])
+
     def ensureAllLoaded(self):
         """
         Ensures all records in the group are loaded.
+
+        Records are read in chunks of 'loadChunkSize' records and
+        loadProgress is emitted after each of them. If a background load is
+        in progress it is cancelled and the remaining records are loaded.
         :return: None
         :rtype: None
         """
+        self.cancelLoading()
+        ids = self.unloadedIds()
+        if not ids:
+            return
+        c = self._loadContext()
+        fields = list(self.fields.keys())
+        total = len(ids)
+        for start in range(0, total, self.loadChunkSize):
+            chunk = ids[start:start + self.loadChunkSize]
+            self._setLoadedValues(self.rpc.read(chunk, fields, c))
+            self.loadProgress.emit(min(start + len(chunk), total), total)
+
+    def loadAllInBackground(self):
+        """
+        Loads all records in the group without blocking, one chunk of
+        'loadChunkSize' records at a time.
+
+        Records are updated (and thus views refreshed) as each chunk arrives
+        and loadProgress and recordsLoaded are emitted. loadFinished is
+        emitted at the end. Returns False if there was nothing to load.
+        :return: Whether loading started
+        :rtype: bool
+        """
+        if self.isLoading():
+            return True
         ids = self.unloadedIds()
         if not ids:
+            return False
+        self._loadIds = ids
+        self._loadTotal = len(ids)
+        self._loadNextChunk()
+        return True
+
+    def isLoading(self):
+        """
+        Returns True if loadAllInBackground() is in progress.
+        :rtype: bool
+        """
+        return self._loadIds is not None
+
+    def cancelLoading(self):
+        """
+        Cancels the current loadAllInBackground(), if any. Chunks already
+        loaded are kept.
+        :return: None
+        :rtype: None
+        """
+        if not self.isLoading():
+            return
+        if self._loadCall:
+            self._loadCall.cancel()
+        self._loadCall = None
+        self._loadIds = None
+        self.loadFinished.emit(False)
+
+    def _loadNextChunk(self):
+        chunk = self._loadIds[:self.loadChunkSize]
+        self._loadIds = self._loadIds[self.loadChunkSize:]
+        self._loadCall = Rpc.session.callAsync(
+            self._chunkLoaded, '/object', 'execute', self.resource, 'read',
+            chunk, list(self.fields.keys()), self._loadContext()
+        )
+
+    def _chunkLoaded(self, values, exception):
+        if not self.isLoading():
+            return
+        self._loadCall = None
+        if exception:
+            self._loadIds = None
+            self.loadFinished.emit(False)
             return
+        records = self._setLoadedValues(values)
+        self.loadProgress.emit(self._loadTotal - len(self._loadIds),
+                               self._loadTotal)
+        self.recordsLoaded.emit(records)
+        if self._loadIds:
+            self._loadNextChunk()
+        else:
+            self._loadIds = None
+            self.loadFinished.emit(True)
+
+    def _loadContext(self):
         c = Rpc.session.context.copy()
         c.update(self.context())
         c['bin_size'] = True
-        values = self.rpc.read(ids, list(self.fields.keys()), c)
-        if values:
-            for v in values:
-                #self.recordById( v['id'] ).set(v, signal=False)
-                r = self.recordById(v['id'])
-                r.set(v, signal=False)
+        return c
+
+    def _setLoadedValues(self, values):
+        records = []
+        for v in values or []:
+            # Records may have been removed or loaded by other means while
+            # loading in the background
+            r = self.recordById(v['id'])
+            if not r or r._loaded:
+                continue
+            r.set(v, signal=False)
+            records.append(r)
+        return records
 
     def unloadedIds(self):
         """
@@ -705,6 +882,7 @@ class RecordGroup(QObject):
 
     def __iter__(self):
         self.ensureUpdated()
+        self.fetchAll()
         self.ensureAllLoaded()
         return iter(self.records)
 
@@ -737,10 +915,8 @@ class RecordGroup(QObject):
         :param record:
         :return:
         """
-        if record in self.records:
-            return self.records.index(record)
-        else:
-            return -1
+        self._ensureIndex()
+        return self._rowByItem.get(record, -1)
 
     def indexOfId(self, ident):
         """
@@ -750,15 +926,8 @@ class RecordGroup(QObject):
         :return: Row number of the id, if no exists -1
         :rtype: int
         """
-        i = 0
-        for record in self.records:
-            if isinstance(record, Record):
-                if record.id == ident:
-                    return i
-            elif record == ident:
-                return i
-            i += 1
-        return -1
+        self._ensureIndex()
+        return self._rowById.get(ident, -1)
 
     def recordExists(self, record):
         """
@@ -766,7 +935,8 @@ class RecordGroup(QObject):
         :param record:
         :return:
         """
-        return record in self.records
+        self._ensureIndex()
+        return record in self._rowByItem
 
     def fieldExists(self, fieldName):
         """
@@ -786,17 +956,10 @@ class RecordGroup(QObject):
         :return: record
         :rtype: Record
         """
-        for record in self.records:
-            if isinstance(record, Record):
-                if record.id == id:
-                    return record
-            elif record == id:
-                idx = self.records.index(id)
-                record = Record(id, self, parent=self.parent)
-                record.recordChanged['PyQt_PyObject'].connect(self.recordChanged)
-                record.recordModified['PyQt_PyObject'].connect(self.recordModified)
-                self.records[idx] = record
-                return record
+        idx = self.indexOfId(id)
+        if idx < 0:
+            return None
+        return self.recordByIndex(idx)
 
     def duplicate(self, record):
         if record.id:
@@ -823,10 +986,14 @@ class RecordGroup(QObject):
         if isinstance(record, Record):
             return record
         else:
-            record = Record(record, self, parent=self.parent)
-            record.recordChanged['PyQt_PyObject'].connect(self.recordChanged)
-            record.recordModified['PyQt_PyObject'].connect(self.recordModified)
+            ident = record
+            record = Record(ident, self, parent=self.parent)
+            record.connectedGroup = self
             self.records[row] = record
+            if self._rowByItem is not None:
+                # The row doesn't change so the index can be updated in place.
+                self._rowByItem.pop(ident, None)
+                self._rowByItem[record] = row
             return record
 
     def isWizard(self):
@@ -856,25 +1023,34 @@ class RecordGroup(QObject):
 
         c = Rpc.session.context.copy()
         c.update(self.context())
-        ids = self.ids()
-        pos = ids.index(record.id) / self.limit
-
-        queryIds = ids[int(pos * self.limit): int(pos * self.limit) + self.limit]
-        if None in queryIds:
-            queryIds.remove(None)
+        row = self.indexOfId(record.id)
+        if row >= 0:
+            queryIds = []
+            for x in self.records[row:row + self.limit]:
+                if isinstance(x, Record):
+                    x = x.id
+                if x is not None:
+                    queryIds.append(x)
+        else:
+            queryIds = [record.id]
 
         missingFields = record.missingFields()
 
         self.disableSignals()
         c['bin_size'] = True
         values = self.rpc.read(queryIds, missingFields, c)
+        records = []
         if values:
             for v in values:
                 ident = v['id']
                 if 'id' not in missingFields:
                     del v['id']
-                self.recordById(ident).set(v, signal=False)
+                loaded = self.recordById(ident)
+                loaded.set(v, signal=False)
+                records.append(loaded)
         self.enableSignals()
+        if records:
+            self.recordsValuesLoaded.emit(records)
         # TODO: Take a look if we need to set default values for new records!
         # Set defaults
         # if len(new) and len(to_add):
@@ -1024,6 +1200,7 @@ class RecordGroup(QObject):
 
         sorted = False
         sortingResult = self.SortingPossible
+        searchArgs = None
 
         if self._domain + self._filter == [('id', 'in', [])]:
             # If setDomainForEmptyGroup() was called, or simply the domain
@@ -1035,8 +1212,8 @@ class RecordGroup(QObject):
         elif not field in list(self.fields.keys()):
             # If the field doesn't exist use default sorting. Usually this will
             # happen when we update and haven't selected a field to sort by.
-            ids = self.rpc.search(
-                self._domain + self._filter, 0, False, False, self._context)
+            searchArgs = ('execute', False)
+            ids = self.searchIds(*searchArgs)
         else:
             field_type = self.fields[field]['type']
             if field_type == 'one2many' or type == 'many2many':
@@ -1051,12 +1228,8 @@ class RecordGroup(QObject):
                 else:
                     orderby += " DESC"
                 try:
-                    ids = Rpc.session.call(
-                        '/koo', 'search',
-                        self.resource,
-                        self._domain + self._filter, 0, 0, orderby,
-                        self._context
-                    )
+                    searchArgs = ('/koo', orderby)
+                    ids = self.searchIds(*searchArgs)
                     sortingResult = self.SortingPossible
                     sorted = True
                 except:
@@ -1085,10 +1258,8 @@ class RecordGroup(QObject):
 
                 try:
                     # Use call to catch exceptions
-                    ids = Rpc.session.call(
-                        '/object', 'execute', self.resource, 'search',
-                        self._domain + self._filter, 0, 0, orderby,
-                        self._context)
+                    searchArgs = ('/object', orderby)
+                    ids = self.searchIds(*searchArgs)
                 except Exception:
                     # In functional fields not stored in the database this will
                     # cause an exception :(
@@ -1099,6 +1270,7 @@ class RecordGroup(QObject):
             # The load function will be in charge of loading and sorting
             # elements
             self.load(ids)
+            self.setSearchWindow(ids, searchArgs)
         elif oldSortedField == self.sortedField or not self.ids():
             # If last sorted field was the same as the current one, possibly
             # only filter crierias have changed so we might need to reload in
@@ -1106,15 +1278,272 @@ class RecordGroup(QObject):
             # If sorting is not possible, but no data was loaded yet, we load
             # by model default field and order. Otherwise, a view might not
             # load any data.
-            ids = self.rpc.search(
-                self._domain + self._filter, 0, 0, False, self._context)
+            searchArgs = ('execute', False)
+            ids = self.searchIds(*searchArgs)
             self.clear()
             # The load function will be in charge of loading and sorting
             # elements
             self.load(ids)
+            self.setSearchWindow(ids, searchArgs)
 
         self.sorting.emit(sortingResult)
 
+    def setSearchLimit(self, limit):
+        """
+        Sets the number of ids fetched from the server at once when sorting
+        with SortAllItems.
+
+        By default (0) all ids matching domain and filter are fetched. With a
+        limit the group only fetches the first 'limit' ids plus the number of
+        matching records. The rest of ids are fetched on demand by
+        fetchMore(), which KooModel calls as the view scrolls past the end.
+        :param limit:
+        :return: None
+        :rtype: None
+        """
+        self._searchLimit = limit or 0
+
+    def searchLimit(self):
+        return self._searchLimit
+
+    def searchIds(self, service, order, offset=0, limit=None):
+        """
+        Returns the ids matching current domain and filter.
+
+        'service' can be 'execute' (RpcProxy search, which notifies errors),
+        '/object' or '/koo' (which raise exceptions). If 'limit' is None,
+        searchLimit() is used.
+        :param service:
+        :param order:
+        :param offset:
+        :param limit:
+        :return: List of ids
+        :rtype: list(int)
+        """
+        if limit is None:
+            limit = self._searchLimit
+        domain = self._domain + self._filter
+        if service == '/koo':
+            return Rpc.session.call('/koo', 'search', self.resource, domain,
+                                    offset, limit, order, self._context)
+        elif service == '/object':
+            return Rpc.session.call('/object', 'execute', self.resource,
+                                    'search', domain, offset, limit, order,
+                                    self._context)
+        return self.rpc.search(domain, offset, limit or False, order,
+                               self._context)
+
+    def searchGroups(self, field, order=None):
+        """
+        Returns the ids matching current domain and filter as a list of
+        (id, group number) pairs. Consecutive ids with the same value in
+        'field' share the group number, so views can know where each group
+        starts without reading the records. Uses koo module's search. If no
+        'order' is given, that of the search that filled the group is used.
+        :param field:
+        :param order:
+        :return: List of (id, group number) pairs
+        :rtype: list(tuple)
+        """
+        if order is None and self._searchArgs:
+            order = self._searchArgs[1]
+        domain = self._domain + self._filter
+        return Rpc.session.call('/koo', 'search', self.resource, domain, 0,
+                                self.count() or False, order, self._context,
+                                False, field)
+
+    def aggregatesQuery(self):
+        """
+        Returns a (domain, records) tuple that allows computing aggregates of
+        all the records of the group without loading them: the server
+        computes the values of the records matching 'domain' (see the
+        aggregate method of koo module's service), which excludes modified,
+        new and removed records, and the caller adds the values of 'records'
+        (the modified and new ones).
+
+        Returns None if the records of the group are not the result of a
+        search (for example, in one2many fields).
+        :return:
+        :rtype: tuple
+        """
+        if not self.isSearchResult():
+            return None
+        records = []
+        excluded = list(self.removedRecords)
+        for x in self.records:
+            if isinstance(x, Record) and (x.isModified() or not x.id):
+                records.append(x)
+                if x.id:
+                    excluded.append(x.id)
+        domain = self._domain + self._filter
+        if excluded:
+            domain = domain + [('id', 'not in', excluded)]
+        return domain, records
+
+    def isSearchResult(self):
+        """
+        Returns True if the records of the group are the result of searching
+        its domain and filter, as opposed to, for example, the records of a
+        one2many field.
+        :return:
+        :rtype: bool
+        """
+        return self._searchArgs is not None and not self.parent
+
+    def mergeValues(self, values):
+        """
+        Sets 'values', as returned by read(), to the records of the group
+        that have not been loaded yet and appends new records for those
+        whose id is not in the group. Loaded (maybe modified) and removed
+        records are left untouched.
+        :param values:
+        :return: List of the ids of the records appended
+        :rtype: list(int)
+        """
+        removed = set(self.removedRecords)
+        new = []
+        existing = []
+        for value in values or []:
+            if value['id'] in removed:
+                continue
+            if self.indexOfId(value['id']) < 0:
+                new.append(value)
+            else:
+                existing.append(value)
+        self._setLoadedValues(existing)
+        if not new:
+            return []
+        start = len(self.records)
+        for value in new:
+            record = Record(value['id'], self, parent=self.parent)
+            record.set(value, signal=False)
+            self._appendItem(record)
+            record.connectedGroup = self
+        self.recordsInserted.emit(start, len(self.records) - 1)
+        return [x['id'] for x in new]
+
+    def discardRecords(self, ids):
+        """
+        Removes the records with the given ids from the group, as
+        opposed to removeRecords() they won't be removed from the server
+        when the group is saved. Modified records are kept.
+
+        It's used to remove the records appended by mergeValues() once
+        they're no longer needed.
+        :param ids:
+        :type ids: list(int)
+        :return: None
+        :rtype: None
+        """
+        rows = []
+        toRemove = []
+        for ident in ids:
+            row = self.indexOfId(ident)
+            if row < 0:
+                continue
+            record = self.records[row]
+            if isinstance(record, Record) and record.isModified():
+                continue
+            rows.append(row)
+            toRemove.append(record)
+        if not toRemove:
+            return
+        self.freeRecords(toRemove)
+        self.recordsRemoved.emit(min(rows), max(rows))
+
+    def setSearchWindow(self, ids, searchArgs):
+        """
+        Stores the information needed by fetchMore() after the first
+        'ids' window has been loaded using searchIds(*searchArgs).
+        :param ids:
+        :param searchArgs:
+        :return: None
+        :rtype: None
+        """
+        self._searchArgs = searchArgs
+        self._searchOffset = len(ids or [])
+        if (searchArgs and self._searchLimit
+                and self._searchOffset >= self._searchLimit):
+            self._searchCount = self.rpc.search_count(
+                self._domain + self._filter, self._context)
+        else:
+            self._searchCount = self._searchOffset
+
+    def canFetchMore(self):
+        """
+        Returns True if there are ids in the server that have not been
+        fetched yet.
+        :return:
+        :rtype: bool
+        """
+        return self._searchOffset < self._searchCount
+
+    def totalCount(self):
+        """
+        Returns the number of records in this group, including those whose
+        ids have not been fetched yet.
+        :return:
+        :rtype: int
+        """
+        return self.count() + self._searchCount - self._searchOffset
+
+    def fetchMoreIds(self, limit=None):
+        """
+        Fetches the next window of ids from the server and returns those that
+        are not in the group yet. It doesn't add them to the group.
+        :param limit: Number of ids to fetch. searchLimit() by default. Use 0
+        to fetch all the remaining ones.
+        :return: List of ids
+        :rtype: list(int)
+        """
+        if not self.canFetchMore():
+            return []
+        ids = self.searchIds(*self._searchArgs, offset=self._searchOffset,
+                             limit=limit)
+        if ids:
+            self._searchOffset += len(ids)
+        if not ids or (limit == 0):
+            # Records may have been removed in the server in the meanwhile.
+            self._searchCount = self._searchOffset
+        result = []
+        seen = set()
+        for ident in ids:
+            if ident not in seen and self.indexOfId(ident) < 0:
+                seen.add(ident)
+                result.append(ident)
+        return result
+
+    def fetchMore(self):
+        """
+        Loads the next window of ids from the server.
+        :return: None
+        :rtype: None
+        """
+        self.loadFetched(self.fetchMoreIds())
+
+    def fetchAll(self):
+        """
+        Loads all ids that have not been fetched from the server yet.
+        :return: None
+        :rtype: None
+        """
+        self.loadFetched(self.fetchMoreIds(0))
+
+    def loadFetched(self, ids):
+        """
+        Appends the ids returned by fetchMoreIds() emitting
+        recordsAboutToBeInserted() first.
+        :param ids:
+        :type ids: list(int)
+        :return: None
+        :rtype: None
+        """
+        if not ids:
+            return
+        start = len(self.records)
+        self.recordsAboutToBeInserted.emit(start, start + len(ids) - 1)
+        self.load(ids)
+
     def sortVisible(self, field, order):
         """
         Sorts the records of the group taking into account only loaded fields.
@@ -1158,6 +1587,7 @@ class RecordGroup(QObject):
             # If we're only reversing the order, then reverse simply reverse
             if order != self.sortedOrder:
                 self.records.reverse()
+        self.invalidateIndex()
 
         self.sortedField = field
         self.sortedOrder = order
@@ -1188,10 +1618,26 @@ class RecordGroup(QObject):
         :param record:
         :return:
         """
-        self.records.remove(record)
-        if isinstance(record, Record):
-            record.recordChanged['PyQt_PyObject'].disconnect(self.recordChanged)
-            record.recordModified['PyQt_PyObject'].disconnect(self.recordModified)
+        self.freeRecords([record])
+
+    def freeRecords(self, records):
+        """
+        Removes a list of records from the list (but not from the database).
+
+        Same as freeRecord() but 'records' is rebuilt only once, which makes
+        removing many records at once linear instead of quadratic.
+        :param records:
+        :return:
+        """
+        toRemove = set(records)
+        if not toRemove:
+            return
+        self.records = [x for x in self.records if x not in toRemove]
+        self.invalidateIndex()
+        for record in toRemove:
+            if isinstance(record, Record):
+                if record.connectedGroup is self:
+                    record.connectedGroup = None
 
     def isModified(self):
         """
@@ -1213,14 +1659,66 @@ class RecordGroup(QObject):
         :param id:
         :return:
         """
-        for record in self.records:
-            if isinstance(record, Record):
-                if record.id == ident:
-                    return record.isModified()
-            elif record == ident:
-                return False
+        idx = self.indexOfId(ident)
+        if idx < 0:
+            return False
+        record = self.records[idx]
+        if isinstance(record, Record):
+            return record.isModified()
         return False
 
+    def invalidateIndex(self):
+        """
+        Marks the row index as outdated so it's rebuilt the next time it's
+        needed.
+
+        Must be called by anyone modifying 'records' directly, or changing
+        the id of one of its records.
+        :return: None
+        :rtype: None
+        """
+        self._rowById = None
+        self._rowByItem = None
+
+    def _ensureIndex(self):
+        """
+        Rebuilds the row index if it has been invalidated.
+        :return: None
+        :rtype: None
+        """
+        if self._rowById is not None and self._rowByItem is not None:
+            return
+        rowById = {}
+        rowByItem = {}
+        for row, item in enumerate(self.records):
+            rowByItem[item] = row
+            if isinstance(item, Record):
+                ident = item.id
+            else:
+                ident = item
+            # Keep the first appearance, as the linear search used to do.
+            rowById.setdefault(ident, row)
+        self._rowById = rowById
+        self._rowByItem = rowByItem
+
+    def _appendItem(self, item):
+        """
+        Appends a Record or an id to 'records' keeping the index up to date.
+        :param item:
+        :return: None
+        :rtype: None
+        """
+        self._ensureIndex()
+        row = len(self.records)
+        self.records.append(item)
+        self._rowByItem[item] = row
+        if isinstance(item, Record):
+            ident = item.id
+        else:
+            ident = item
+        if self._rowById.get(ident, -1) < 0:
+            self._rowById[ident] = row
+
     def isFieldRequired(self, fieldName):
         """
         Returns True if the given field is required in the RecordGroup,
@@ -25,6 +25,8 @@
 #
 ##############################################################################
 
+import bisect
+
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
@@ -34,6 +36,7 @@ from Koo.Common import Calendar
 from Koo.Common import Numeric
 from Koo.Common import Common
 from Koo.Rpc import Rpc
+from Koo.Model.Record import Record
 
 #
 # We store the pointer to the Tiny ModelGroup on QModelIndex.internalPointer
@@ -74,6 +77,15 @@ class KooModel(QAbstractItemModel):
     # might benefit too.
     ValueRole = Qt.UserRole + 1
 
+    # Roles whose values are kept in the data cache. See data().
+    CachedRoles = frozenset([Qt.DisplayRole, Qt.EditRole, Qt.ToolTipRole,
+                             Qt.ForegroundRole, ValueRole])
+    # Field types whose values are never cached because they depend on other
+    # records (one2many and many2many show the number of related records).
+    UncachedTypes = frozenset(['one2many', 'many2many', 'button'])
+    # Maximum number of records with cached values.
+    MaxCachedRecords = 5000
+
     def __init__(self, parent=None):
         QAbstractItemModel.__init__(self, parent)
         self.group = None
@@ -94,6 +106,13 @@ class KooModel(QAbstractItemModel):
         # and self.child fields. The list is updated using
         # updateVisibleFields().
         self.visibleFields = []
+        # Values returned by data() by record and (field, role). Entries of
+        # a record are removed when it changes. See clearDataCache().
+        self.dataCache = {}
+        # Labels of selection fields by value, see selectionLabel().
+        self.selectionLabels = {}
+        # True between recordsAboutToBeInserted() and recordsInserted()
+        self._insertingRows = False
 
     def setRecordGroup(self, group):
         """
@@ -108,14 +127,21 @@ class KooModel(QAbstractItemModel):
 
         if self.group:
             self.group.recordsInserted[int, int].disconnect(self.recordsInserted)
+            self.group.recordsAboutToBeInserted[int, int].disconnect(self.recordsAboutToBeInserted)
+            self.group.recordsValuesLoaded.disconnect(self.recordsValuesLoaded)
+            self.group.contextChanged.disconnect(self.clearForegroundCache)
             # @xtorello toreview
             self.group.recordChangedSignal['PyQt_PyObject'].disconnect(self.recordChanged)
             # self.group.recordChanged['QObject'].disconnect(self.recordChanged)
             self.group.recordsRemoved[int, int].disconnect(self.recordsRemoved)
 
         self.group = group
+        self.clearDataCache()
         if self.group:
             self.group.recordsInserted[int, int].connect(self.recordsInserted)
+            self.group.recordsAboutToBeInserted[int, int].connect(self.recordsAboutToBeInserted)
+            self.group.recordsValuesLoaded.connect(self.recordsValuesLoaded)
+            self.group.contextChanged.connect(self.clearForegroundCache)
             # @xtorello toreview
             self.group.recordChangedSignal['PyQt_PyObject'].connect(self.recordChanged)
             # self.group.recordChanged[QObject].connect(self.recordChanged)
@@ -155,13 +181,22 @@ class KooModel(QAbstractItemModel):
     def reset(self):
         pass
 
+    def recordsAboutToBeInserted(self, start, end):
+        self.beginInsertRows(QModelIndex(), start, end)
+        self._insertingRows = True
+
     def recordsInserted(self, start, end):
+        if self._insertingRows:
+            self._insertingRows = False
+            self.endInsertRows()
+            return
         if self._updatesEnabled:
             self.reset()
 
     def recordChanged(self, record):
         if not record:
             return
+        self.dataCache.pop(record, None)
         leftIndex = self.indexFromId(record.id)
         if not leftIndex.isValid():
             self.reset()
@@ -169,8 +204,72 @@ class KooModel(QAbstractItemModel):
         rightIndex = self.index(leftIndex.row(), self.columnCount() - 1)
         self.dataChanged.emit(leftIndex, rightIndex)
 
+    def recordsValuesLoaded(self, records):
+        """
+        Discards the values cached for records loaded without notifying
+        each change (for example neighbours prefetched by
+        RecordGroup.ensureRecordLoaded()) and lets views know their rows
+        changed.
+
+        :param records:
+        :return: None
+        :rtype: None
+        """
+        rows = []
+        for record in records:
+            self.dataCache.pop(record, None)
+            row = self.group.indexOfId(record.id)
+            if row >= 0:
+                rows.append(row)
+        if not rows:
+            return
+        self.dataChanged.emit(self.index(min(rows), 0),
+                              self.index(max(rows), self.columnCount() - 1))
+
     def recordsRemoved(self, start, end):
-        return None
+        self.clearDataCache()
+
+    def clearForegroundCache(self):
+        """
+        Discards the colors cached by data(). Color expressions may use the
+        parent record and the context, which change without the records of
+        the group changing.
+
+        :return: None
+        :rtype: None
+        """
+        for values in self.dataCache.values():
+            values.pop(Qt.ForegroundRole, None)
+
+    def clearDataCache(self):
+        """
+        Discards all values cached by data().
+
+        :return: None
+        :rtype: None
+        """
+        self.dataCache = {}
+        self.selectionLabels = {}
+
+    def selectionLabel(self, fieldName, value):
+        """
+        Returns the label of 'value' in the selection field 'fieldName' or
+        None if it's not one of its options.
+
+        :param fieldName:
+        :param value:
+        :return:
+        """
+        labels = self.selectionLabels.get(fieldName)
+        if labels is None:
+            labels = {}
+            for x in self.fields[fieldName]['selection']:
+                labels.setdefault(x[0], str(x[1]))
+            self.selectionLabels[fieldName] = labels
+        try:
+            return labels.get(value)
+        except TypeError:
+            return None
 
     def setFields(self, fields):
         """
@@ -181,6 +280,7 @@ class KooModel(QAbstractItemModel):
         :rtype: None
         """
         self.fields = fields
+        self.clearDataCache()
         self.updateVisibleFields()
 
     def setButtons(self, buttons):
@@ -203,6 +303,7 @@ class KooModel(QAbstractItemModel):
         :rtype: None
         """
         self.visibleFields = fields
+        self.clearDataCache()
         self.updateVisibleFields()
 
     def setColors(self, colors):
@@ -217,6 +318,7 @@ class KooModel(QAbstractItemModel):
         :return:
         """
         self.colors = colors
+        self.clearDataCache()
 
     def setShowBackgroundColor(self, showBackgroundColor):
         """
@@ -358,6 +460,25 @@ class KooModel(QAbstractItemModel):
         else:
             return self.group.count()
 
+    def canFetchMore(self, parent=QModelIndex()):
+        if not self.group or parent.isValid():
+            return False
+        return self.group.canFetchMore()
+
+    def fetchMore(self, parent=QModelIndex()):
+        """
+        Loads the next window of ids of a group with a search limit. Views
+        call it when they're scrolled past the last row.
+
+        :param parent:
+        :return: None
+        :rtype: None
+        """
+        if not self.group or parent.isValid():
+            return
+        # The group lets all models using it know rows are inserted
+        self.group.fetchMore()
+
     def columnCount(self, parent = QModelIndex()):
         if not self.group:
             return 0
@@ -453,6 +574,45 @@ class KooModel(QAbstractItemModel):
     def data(self, index, role=Qt.DisplayRole ):
         if not self.group:
             return QVariant()
+        # Views ask for the same values on every repaint so they're cached
+        # by record until the record changes. Only records of the main group
+        # are cached as children groups don't notify their changes here.
+        if role not in self.CachedRoles or index.internalPointer() is not self.group:
+            return self.computeData(index, role)
+        fieldName = self.field(index.column())
+        if fieldName in self.buttons or fieldName not in self.fields:
+            return self.computeData(index, role)
+        if self.fields[fieldName].get('type') in self.UncachedTypes:
+            return self.computeData(index, role)
+        record = self.record(index.row(), self.group)
+        if not record:
+            return self.computeData(index, role)
+        values = self.dataCache.get(record)
+        if values is None:
+            if len(self.dataCache) >= self.MaxCachedRecords:
+                self.dataCache = {}
+            values = self.dataCache[record] = {}
+        # Foreground color depends on the whole record (and the parent and
+        # context, see clearForegroundCache())
+        if role == Qt.ForegroundRole:
+            key = role
+        else:
+            key = (fieldName, role)
+        if key in values:
+            return values[key]
+        value = self.computeData(index, role)
+        values[key] = value
+        return value
+
+    def computeData(self, index, role):
+        """
+        Returns the value for the given index and role, as data() does,
+        without using the cache.
+
+        :param index:
+        :param role:
+        :return:
+        """
         if role in (Qt.DisplayRole, Qt.EditRole) or (self._showToolTips and role == Qt.ToolTipRole):
             value = self.value(index.row(), index.column(), index.internalPointer())
             if value is None:
@@ -461,11 +621,10 @@ class KooModel(QAbstractItemModel):
             if fieldType in ['one2many', 'many2many']:
                 return QVariant('(%d)' % value.count())
             elif fieldType == 'selection':
-                field = self.fields[self.field(index.column())]
-                for x in field['selection']:
-                    if x[0] == value:
-                        return QVariant(str(x[1]))
-                return QVariant()
+                label = self.selectionLabel(self.field(index.column()), value)
+                if label is None:
+                    return QVariant()
+                return QVariant(label)
             elif fieldType == 'date' and value:
                 return QVariant(Calendar.dateToText(Calendar.storageToDate(value)))
             elif fieldType == 'datetime' and value:
@@ -579,11 +738,10 @@ class KooModel(QAbstractItemModel):
                 return QVariant( '(%d)' % value.count())
             elif fieldType == 'selection':
                 # By now, return the same as DisplayRole for these
-                field = self.fields[self.field(index.column())]
-                for x in field['selection']:
-                    if x[0] == value:
-                        return QVariant(str(x[1]))
-                return QVariant()
+                label = self.selectionLabel(self.field(index.column()), value)
+                if label is None:
+                    return QVariant()
+                return QVariant(label)
             elif fieldType == 'date' and value:
                 return QVariant(Calendar.storageToDate(value))
             elif fieldType == 'datetime' and value:
@@ -705,6 +863,7 @@ class KooModel(QAbstractItemModel):
         movedRecord = self.recordFromIndex( self.indexFromId( id ) )
         group.records.remove( movedRecord )
         group.records.insert( group.records.index(record), movedRecord )
+        group.invalidateIndex()
 
         if group.count():
             for idx in range(len(group.records)):
@@ -903,6 +1062,21 @@ class KooModel(QAbstractItemModel):
 
 
 class KooGroupedModel( QAbstractProxyModel ):
+    """
+    Proxy model that shows a row for each set of consecutive records with
+    the same value in the first column.
+
+    The source row where each group starts is kept in the 'starts' list, so
+    mapping indexes uses binary search instead of walking all records. The
+    list is updated incrementally when records are inserted, removed or
+    changed. When the records of the group are the result of a search and
+    some of them are not loaded, boundaries are seeded with the groups
+    computed by the server (see serverGroups() and setGroups()) so records
+    don't need to be loaded to know where groups start.
+
+    Views are notified with a model reset when all boundaries are
+    recomputed and with layoutChanged() when some of them change.
+    """
     def __getattr__(self, name):
         if name == 'group':
             return self.sourceModel().group
@@ -916,30 +1090,219 @@ class KooGroupedModel( QAbstractProxyModel ):
 
     def setSourceModel(self, model):
         QAbstractProxyModel.setSourceModel(self, model)
-        self.group = model.group
+        # Value of the first column of each source row, see keyAt().
+        self.keys = []
+        self.starts = []
+        self.connectedGroup = None
+        model.dataChanged.connect(self.sourceDataChanged)
+        model.modelReset.connect(self.rebuild)
+        self.rebuild()
+
+    def connectGroup(self):
+        if self.connectedGroup is self.group:
+            return
+        if self.connectedGroup:
+            self.connectedGroup.recordsInserted[int, int].disconnect(self.sourceRecordsInserted)
+            self.connectedGroup.recordsRemoved[int, int].disconnect(self.sourceRecordsRemoved)
+        self.connectedGroup = self.group
+        if self.connectedGroup:
+            self.connectedGroup.recordsInserted[int, int].connect(self.sourceRecordsInserted)
+            self.connectedGroup.recordsRemoved[int, int].connect(self.sourceRecordsRemoved)
+
+    def count(self):
+        if not self.group:
+            return 0
+        return self.group.count()
 
-    def mapFromSource(self, index):
+    def rebuild(self):
+        """
+        Recomputes all group boundaries, asking the server for them if
+        possible (see serverGroups()) and using the source model values
+        otherwise.
+
+        :return: None
+        :rtype: None
+        """
+        self.connectGroup()
+        groups = self.serverGroups()
+        if groups is not None:
+            self.setGroups(groups)
+        else:
+            self.rebuildFromValues()
+
+    def rebuildFromValues(self):
+        self.beginResetModel()
         model = self.sourceModel()
-        newRow = 0
-        previous = False
-        for y in range(0, index.row()):
-            value = model.value(y, 0, self.group)
-            if value != previous:
-                newRow += 1
-                previous = value
-        return self.createIndex(newRow, index.column())
+        self.keys = [model.value(y, 0, self.group) for y in range(self.count())]
+        self.starts = []
+        self.updateBoundaries(0, len(self.keys) - 1)
+        self.endResetModel()
 
-    def mapToSource(self, index):
+    def serverGroups(self):
+        """
+        Returns the groups of the first column computed by the server (see
+        RecordGroup.searchGroups()) or None if all records are loaded, the
+        group is not the result of a search or the server can't compute them.
+
+        :return:
+        :rtype: list(tuple)
+        """
+        group = self.group
+        field = self.sourceModel().field(0)
+        if not group or not field or not group.isSearchResult():
+            return None
+        if all(isinstance(x, Record) and x._loaded for x in group.records):
+            return None
+        try:
+            return group.searchGroups(field)
+        except Rpc.RpcException:
+            return None
+
+    def setGroups(self, groups):
+        """
+        Seeds group boundaries with the (id, group number) pairs returned by
+        RecordGroup.searchGroups(), without loading records. The actual value
+        is used for modified records.
+
+        If the pairs don't match the records of the group, boundaries are
+        computed from the source model instead.
+
+        :param groups:
+        :return: None
+        :rtype: None
+        """
+        self.connectGroup()
+        if not self.group or [x[0] for x in groups] != self.group.ids():
+            self.rebuildFromValues()
+            return
+        self.beginResetModel()
         model = self.sourceModel()
-        previous = None
-        newRow = 0
-        for y in range(0, self.group.count()):
-            value = model.value(y, 0, self.group)
-            if value != previous:
-                newRow += 1
-                if newRow == index.row():
-                    break
-        return self.createIndex(y, index.column())
+        self.keys = []
+        for row, (ident, number) in enumerate(groups):
+            record = self.group.records[row]
+            if isinstance(record, Record) and record.isModified():
+                self.keys.append(model.value(row, 0, self.group))
+            else:
+                self.keys.append((KooGroupedModel, number))
+        self.starts = []
+        self.updateBoundaries(0, len(self.keys) - 1)
+        self.endResetModel()
+
+    def keyAt(self, row):
+        """
+        Returns the value of the first column of the given source row,
+        replacing the group number given by setGroups(), if any, with the
+        actual value.
+
+        :param row:
+        :return:
+        """
+        key = self.keys[row]
+        if self.isGroupNumber(key):
+            key = self.keys[row] = self.sourceModel().value(row, 0, self.group)
+        return key
+
+    def updateBoundaries(self, first, last, notify=False):
+        """
+        Recomputes which of the source rows between 'first' and 'last + 1'
+        start a group. Rows outside that range are not checked.
+
+        If 'notify' is True and boundaries change, layoutAboutToBeChanged()
+        and layoutChanged() are emitted around the change.
+
+        :param first:
+        :param last:
+        :param notify:
+        :return: Whether boundaries changed
+        :rtype: bool
+        """
+        count = len(self.keys)
+        if not count:
+            self.starts = []
+            return
+        first = max(first, 0)
+        last = min(last + 1, count - 1)
+        new = []
+        for row in range(first, last + 1):
+            if row == 0:
+                new.append(row)
+                continue
+            previous = self.keys[row - 1]
+            current = self.keys[row]
+            # Group numbers given by the server can only be compared between
+            # themselves.
+            if self.isGroupNumber(previous) != self.isGroupNumber(current):
+                previous = self.keyAt(row - 1)
+                current = self.keyAt(row)
+            if previous != current:
+                new.append(row)
+        i = bisect.bisect_left(self.starts, first)
+        j = bisect.bisect_right(self.starts, last)
+        if self.starts[i:j] == new:
+            return False
+        if notify:
+            self.layoutAboutToBeChanged.emit()
+        self.starts[i:j] = new
+        if notify:
+            self.layoutChanged.emit()
+        return True
+
+    def isGroupNumber(self, key):
+        return isinstance(key, tuple) and bool(key) and key[0] is KooGroupedModel
+
+    def sourceRecordsInserted(self, start, end):
+        inserted = end - start + 1
+        if len(self.keys) + inserted != self.count():
+            # RecordGroup also emits recordsInserted() after sorting
+            self.rebuild()
+            return
+        model = self.sourceModel()
+        self.layoutAboutToBeChanged.emit()
+        self.keys[start:start] = [model.value(y, 0, self.group)
+                                  for y in range(start, end + 1)]
+        i = bisect.bisect_left(self.starts, start)
+        self.starts[i:] = [x + inserted for x in self.starts[i:]]
+        self.updateBoundaries(start - 1, end)
+        self.layoutChanged.emit()
+
+    def sourceRecordsRemoved(self, start, end):
+        removed = end - start + 1
+        if len(self.keys) - removed != self.count():
+            self.rebuild()
+            return
+        self.layoutAboutToBeChanged.emit()
+        del self.keys[start:end + 1]
+        i = bisect.bisect_left(self.starts, start)
+        j = bisect.bisect_right(self.starts, end)
+        self.starts[i:] = [x - removed for x in self.starts[j:]]
+        self.updateBoundaries(start - 1, start)
+        self.layoutChanged.emit()
+
+    def sourceDataChanged(self, topLeft, bottomRight):
+        if topLeft.internalPointer() is not self.group:
+            return
+        if len(self.keys) != self.count():
+            self.rebuild()
+            return
+        model = self.sourceModel()
+        first = topLeft.row()
+        last = bottomRight.row()
+        for y in range(first, last + 1):
+            self.keys[y] = model.value(y, 0, self.group)
+        if not self.updateBoundaries(first - 1, last, notify=True):
+            self.dataChanged.emit(self.mapFromSource(topLeft),
+                                  self.mapFromSource(bottomRight))
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        row = bisect.bisect_right(self.starts, index.row()) - 1
+        return self.createIndex(row, index.column())
+
+    def mapToSource(self, index):
+        if not index.isValid() or index.row() >= len(self.starts):
+            return QModelIndex()
+        return self.sourceModel().index(self.starts[index.row()], index.column())
 
     def recordGroup(self):
         return self.sourceModel().recordGroup()
@@ -951,14 +1314,9 @@ class KooGroupedModel( QAbstractProxyModel ):
         return self.sourceModel().isReadOnly()
 
     def rowCount(self, parent=QModelIndex()):
-        model = self.sourceModel()
-        newRow = 0
-        previous = None
-        for y in range(0, self.group.count()):
-            value = model.value(y, 0, self.group)
-            if value != previous:
-                newRow += 1
-        return newRow
+        if parent.isValid():
+            return 0
+        return len(self.starts)
 
     def columnCount(self, parent=QModelIndex()):
         return self.sourceModel().columnCount(parent)
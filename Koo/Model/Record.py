@@ -67,7 +67,10 @@ class Record(QObject):
     def __init__(self, ident, group, parent=None, new=False):
         QObject.__init__(self, group)
         self.rpc = group.rpc
-        self.id = ident
+        # The group notified of changes and modifications of the record. See
+        # notifyChanged() and notifyModified().
+        self.connectedGroup = None
+        self._id = ident
         self._loaded = False
         self.parent = parent
         self.group = group
@@ -85,7 +88,11 @@ class Record(QObject):
         self.rpc = None
         self.modified_fields = None
         self.parent = None
-        self.setParent(None)
+        try:
+            self.setParent(None)
+        except RuntimeError:
+            # The C++ object was already destroyed along with its group.
+            pass
         for key, value in self.values.items():
             from .Group import RecordGroup
             if isinstance(value, RecordGroup):
@@ -100,14 +107,49 @@ class Record(QObject):
         self.invalidFields = []
         if self.id == 2:
             Debug.printReferrers(self)
+        self.connectedGroup = None
         self.group = None
 
+    def notifyChanged(self):
+        """
+        Emits recordChanged and lets the group of the record know.
+
+        Groups are notified directly instead of connecting to the signals of
+        each record, which would cost a connection (and a proxy QObject) per
+        record and signal.
+        :return: None
+        :rtype: None
+        """
+        self.recordChanged.emit(self)
+        if self.connectedGroup is not None:
+            self.connectedGroup.recordChanged(self)
+
+    def notifyModified(self):
+        """
+        Emits recordModified and lets the group of the record know.
+        :return: None
+        :rtype: None
+        """
+        self.recordModified.emit(self)
+        if self.connectedGroup is not None:
+            self.connectedGroup.recordModified(self)
+
     def set_after_save_function(self, func):
         self.after_save_function = func
 
     def set_error_procedure(self, func):
         self.error_procedure = func
 
+    def _getId(self):
+        return self._id
+
+    def _setId(self, value):
+        self._id = value
+        # The group indexes its records by id, so let it know.
+        if self.group is not None:
+            self.group.invalidateIndex()
+    id = property(_getId, _setId)
+
     def _getModified(self):
         return self._modified
 
@@ -133,10 +175,8 @@ class Record(QObject):
         record = self
         if not fieldName in self.values:
             self.group.ensureRecordLoaded(self)
-            x = 0
-            while self.group.records[x].id != self.id:
-                x += 1
-            record = self.group.records[x]
+            if self.id:
+                record = self.group.recordById(self.id) or self
         self.group.fieldObjects[fieldName].set_client(record, value)
 
     def value(self, fieldName):
@@ -152,10 +192,8 @@ class Record(QObject):
         field = self.group.fieldObjects[fieldName]
         if fieldName not in self.values:
             self.group.ensureRecordLoaded(self)
-            x = 0
-            while self.group.records[x].id != self.id:
-                x += 1
-            record = self.group.records[x]
+            if self.id:
+                record = self.group.recordById(self.id) or self
         return field.get_client(record)
 
     def setDefault(self, fieldName, value):
@@ -222,26 +260,42 @@ class Record(QObject):
         return list(self.modified_fields.keys())
 
     def stateAttributes(self, fieldName):
-        if fieldName not in self._stateAttributes:
-            if fieldName in self.group.fieldObjects:
-                # @xtorello toreview
-                # self._stateAttributes[fieldName] = {}
-                self._stateAttributes[fieldName] = self.group.fieldObjects[fieldName].attrs.copy()
-            else:
-                self._stateAttributes[fieldName] = {}
-        return self._stateAttributes[fieldName]
+        """
+        Returns the attributes of the field that have been changed for this
+        record (by states or attrs). Attributes not in the dictionary have
+        the value given by the field definition, see stateAttribute().
+        """
+        attributes = self._stateAttributes.get(fieldName)
+        if attributes is None:
+            attributes = self._stateAttributes[fieldName] = {}
+        return attributes
+
+    def stateAttribute(self, fieldName, attribute, default=False):
+        """
+        Returns the value of 'attribute' of the field for this record.
+        """
+        attributes = self._stateAttributes.get(fieldName)
+        if attributes and attribute in attributes:
+            return attributes[attribute]
+        field = self.group.fieldObjects.get(fieldName)
+        if field is None:
+            return default
+        return field.attrs.get(attribute, default)
 
     def setStateAttributes(self, fieldName, state='draft'):
         # @xtorello toreview
         field = self.group.fieldObjects[fieldName]
         stateChanges = dict(field.attrs.get('states', {}).get(state[0], []))
+        attributes = self._stateAttributes.get(fieldName)
         for key in ('readonly', 'required'):
-            if key in stateChanges:
-                self.stateAttributes(fieldName)[key] = stateChanges[key]
-            else:
-                self.stateAttributes(fieldName)[key] = field.attrs.get(
-                    key, False
-                )
+            # Only values that differ from the field definition are kept so
+            # large groups don't store a copy of the attrs for each record.
+            if key in stateChanges and stateChanges[key] != field.attrs.get(key, False):
+                if attributes is None:
+                    attributes = self.stateAttributes(fieldName)
+                attributes[key] = stateChanges[key]
+            elif attributes:
+                attributes.pop(key, None)
 
     def updateStateAttributes(self):
         state = self.values.get('state', 'draft')
@@ -258,10 +312,11 @@ class Record(QObject):
                 'attrs', '{}'
             )
 
+            code = Rpc.session.expressionCache.compile(attributes)[0]
             try:
-                attributeChanges = eval(attributes)
+                attributeChanges = eval(code)
             except:
-                attributeChanges = eval(attributes, self.value(fieldName))
+                attributeChanges = eval(code, self.value(fieldName))
 
             for attribute, condition in list(attributeChanges.items()):
                 for i in range(0, len(condition)):
@@ -274,7 +329,7 @@ class Record(QObject):
                     self.stateAttributes(fieldName)[attribute] = value
 
     def isFieldReadOnly(self, fieldName):
-        readOnly = self.stateAttributes(fieldName).get('readonly', False)
+        readOnly = self.stateAttribute(fieldName, 'readonly')
         if isinstance(readOnly, bool):
             return readOnly
         if isinstance(readOnly, str) or isinstance(readOnly, str):
@@ -286,7 +341,7 @@ class Record(QObject):
         return bool(readOnly)
 
     def isFieldRequired(self, fieldName):
-        required = self.stateAttributes(fieldName).get('required', False)
+        required = self.stateAttribute(fieldName, 'required')
         if isinstance(required, bool):
             return required
         if isinstance(required, str) or isinstance(required, str):
@@ -521,7 +576,7 @@ class Record(QObject):
             change = change or not self.isFieldValid(fname)
             self.setFieldValid(fname, True)
         if change:
-            self.recordChanged.emit(self)
+            self.notifyChanged()
         return change
 
     def validate(self):
@@ -577,8 +632,8 @@ class Record(QObject):
                 continue
             self.group.fieldObjects[fieldname].setDefault(self, value)
         self._loaded = True
-        self.recordChanged.emit(self)
-        self.recordModified.emit(self)
+        self.notifyChanged()
+        self.notifyModified()
 
     def changed(self):
         """
@@ -592,8 +647,8 @@ class Record(QObject):
         """
 
         self.updateAttributes()
-        self.recordChanged.emit(self)
-        self.recordModified.emit(self)
+        self.notifyChanged()
+        self.notifyModified()
 
     def set(self, val, modified=False, signal=True):
         """
@@ -628,9 +683,9 @@ class Record(QObject):
         self.modified = modified
         if not self.modified:
             self.modified_fields = {}
-        self.recordChanged.emit(self)
+        self.notifyChanged()
         if signal:
-            self.recordModified.emit(self)
+            self.notifyModified()
 
     def reload(self):
         if not self.id:
@@ -665,14 +720,21 @@ class Record(QObject):
             return dom
         if checkLoad:
             self.ensureIsLoaded()
+        code, names = Rpc.session.compileExpression(dom)
+        # Only the values of the names the expression references are
+        # prepared. This function is called for every cell painted in tree
+        # views with colors so retrieving all fields is too expensive.
         d = {}
-        for name in self.values:
-            d[name] = self.group.fieldObjects[name].get(
-                self, checkLoad=checkLoad)
+        for name in names:
+            if name in self.values:
+                d[name] = self.group.fieldObjects[name].get(
+                    self, checkLoad=checkLoad)
 
-        d['current_date'] = time.strftime('%Y-%m-%d')
+        if 'current_date' in names:
+            d['current_date'] = time.strftime('%Y-%m-%d')
         d['time'] = time
-        d['context'] = self.context()
+        if 'context' in names:
+            d['context'] = self.context()
         # Avoid setting None in the context as it might be sent to
         # the server and RPC doesn't support None
         d['active_id'] = self.id or False
@@ -680,10 +742,10 @@ class Record(QObject):
         # instead of 'active_id'. It has solved, for example, a problem
         # with the c2c_budget module.
         d['id'] = self.id or False
-        if self.parent:
+        if self.parent and 'parent' in names:
             d['parent'] = EvalEnvironment(self.parent)
         try:
-            val = Rpc.session.evaluateExpression(dom, d)
+            val = Rpc.session.evaluateExpression(code, d)
         except NameError as exception:
             # If evaluateExpression raises a NameError exception like this one:
             # NameError: name 'unit_amount' is not defined
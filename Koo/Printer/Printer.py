@@ -35,6 +35,7 @@ from Koo.Common.Settings import *
 import os
 import base64
 import tempfile
+import zlib
 
 # @brief Provides various static functions to easily print files and/or data
 # comming from the server.
@@ -69,6 +70,33 @@ class Printer(object):
         else:
             Printer.open(fileName)
 
+    # @brief Decodes the base64 (and zlib compressed if code is 'zlib') data
+    # of a report and writes it to the given file object.
+    #
+    # Data is decoded in chunks of chunkSize characters so the whole decoded
+    # (and decompressed) content is never held in memory.
+    @staticmethod
+    def writeData(fp, result, code='normal', chunkSize=4 * 65536):
+        decompressor = None
+        if code == 'zlib':
+            decompressor = zlib.decompressobj()
+        empty = result[:0]
+        pending = empty
+        for start in range(0, len(result), chunkSize):
+            # Base64 can only be decoded in groups of four characters, not
+            # counting new lines.
+            chunk = pending + empty.join(result[start:start + chunkSize].split())
+            size = len(chunk) - len(chunk) % 4
+            pending = chunk[size:]
+            content = base64.b64decode(chunk[:size])
+            if decompressor:
+                content = decompressor.decompress(content)
+            fp.write(content)
+        if pending:
+            raise ValueError('Incorrect padding in report data')
+        if decompressor:
+            fp.write(decompressor.flush())
+
     # @brief Prints report information contained in the data parameter. Which will
     # typically be received from the server.
     @staticmethod
@@ -78,12 +106,6 @@ class Printer(object):
                 'There was an error trying to create the report.'))
             return
 
-        if data.get('code', 'normal') == 'zlib':
-            import zlib
-            content = zlib.decompress(base64.b64decode(data['result']))
-        else:
-            content = base64.b64decode(data['result'])
-
         # We'll always try to open the file and won't limit ourselves to
         # doc, html and pdf. For example, one might get odt, ods, etc. Before
         # we stored the report in a file if it wasn't one of the first three
@@ -94,7 +116,7 @@ class Printer(object):
         fp, fileName = tempfile.mkstemp('.%s' % data['format'])
         fp = os.fdopen(fp, 'wb+')
         try:
-            fp.write(content)
+            Printer.writeData(fp, data['result'], data.get('code', 'normal'))
         finally:
             fp.close()
         # Add semantic information before printing file because otherwise
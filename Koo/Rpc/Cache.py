@@ -25,7 +25,52 @@
 #
 ##############################################################################
 
-import copy
+from collections import OrderedDict
+import pickle
+import sqlite3
+import threading
+import types
+
+
+class FrozenValue:
+    """
+    Immutable snapshot of a value stored in the cache.
+
+    Callers modify the values they receive (Screen and RecordGroup update
+    field dicts and ActionFactory appends to the toolbar lists) so values
+    can't be shared as is. The snapshot is kept pickled, which can't be
+    altered, and thaw() returns a new copy of it much faster than
+    copy.deepcopy() would.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, value):
+        self.data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def thaw(self):
+        return pickle.loads(self.data)
+
+
+def hashable(value):
+    """
+    Converts 'value' (typically the arguments of an RPC call, including
+    context dicts) into a hashable value. Dict items are sorted so equal
+    contexts always give the same key.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted(((k, hashable(v)) for k, v in value.items()),
+                            key=lambda x: str(x[0])))
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable(x) for x in value)
+    return value
+
+
+def cacheKey(obj, method, args):
+    """
+    Returns the key used to store the result of the given call in the
+    cache.
+    """
+    return (obj, method, hashable(args))
 
 
 class AbstractCache:
@@ -35,6 +80,12 @@ class AbstractCache:
     def get(self, obj, method, *args):
         pass
 
+    def purge(self):
+        """
+        Discards all cached information, including any stored out of memory.
+        """
+        self.clear()
+
 
 class ViewCache(AbstractCache):
     exceptions = []
@@ -45,10 +96,10 @@ class ViewCache(AbstractCache):
     def exists(self, obj, method, *args):
         if method != 'execute' or len(args) < 2 or args[1] != 'fields_view_get':
             return False
-        return (obj, method, str(args)) in self.cache
+        return cacheKey(obj, method, args) in self.cache
 
     def get(self, obj, method, *args):
-        return copy.deepcopy(self.cache[(obj, method, str(args))])
+        return self.cache[cacheKey(obj, method, args)].thaw()
 
     def add(self, value, obj, method, *args):
         if method != 'execute' or len(args) < 2 or args[1] != 'fields_view_get':
@@ -56,7 +107,7 @@ class ViewCache(AbstractCache):
         # Don't cache models configured in the exception list of the server module 'koo'.
         if args[0] in ViewCache.exceptions:
             return False
-        self.cache[(obj, method, str(args))] = copy.deepcopy(value)
+        self.cache[cacheKey(obj, method, args)] = FrozenValue(value)
 
     def clear(self):
         self.cache = {}
@@ -68,6 +119,18 @@ class ActionViewCache(AbstractCache):
     def __init__(self):
         self.cache = {}
 
+    def isCached(self, obj, method, *args):
+        """
+        Returns True if the result of the given call is kept in the cache.
+        """
+        if method == 'execute' and len(args) >= 2 and args[1] == 'fields_view_get':
+            return True
+        elif method == 'execute' and len(args) >= 2 and args[0] == 'ir.values' and args[1] == 'get':
+            return True
+        elif obj == '/fulltextsearch' and method == 'indexedModels':
+            return True
+        return False
+
     def exists(self, obj, method, *args):
         if method == 'execute' and len(args) >= 3 and args[1] == 'search':
             # In cases where search filter only is equal to [('id','in',[])] we will optimize and return
@@ -75,12 +138,8 @@ class ActionViewCache(AbstractCache):
             # worth the taking it into account.
             if isinstance(args[2], list) and len(args[2]) > 0 and (args[2][0] == ('id', 'in', []) or args[2][0] == ['id', 'in', []]):
                 return True
-        if method == 'execute' and len(args) >= 2 and args[1] == 'fields_view_get':
-            return (obj, method, str(args)) in self.cache
-        elif method == 'execute' and len(args) >= 2 and args[0] == 'ir.values' and args[1] == 'get':
-            return (obj, method, str(args)) in self.cache
-        elif obj == '/fulltextsearch' and method == 'indexedModels':
-            return (obj, method, str(args)) in self.cache
+        if self.isCached(obj, method, *args):
+            return cacheKey(obj, method, args) in self.cache
         else:
             return False
 
@@ -91,19 +150,223 @@ class ActionViewCache(AbstractCache):
             # worth the taking it into account.
             if isinstance(args[2], list) and len(args[2]) > 0 and (args[2][0] == ('id', 'in', []) or args[2][0] == ['id', 'in', []]):
                 return []
-        return copy.deepcopy(self.cache[(obj, method, str(args))])
+        return self.cache[cacheKey(obj, method, args)].thaw()
 
     def add(self, value, obj, method, *args):
         # No need to consider 'search' with [('id','in',[])] here given that we don't have to store anything
-        if method == 'execute' and len(args) >= 2 and args[1] == 'fields_view_get':
-            # Don't cache models configured in the exception list of the server module 'koo'.
-            if args[0] in ViewCache.exceptions:
+        if not self.isCached(obj, method, *args):
+            return
+        # Don't cache models configured in the exception list of the server module 'koo'.
+        if method == 'execute' and args[1] == 'fields_view_get' and args[0] in ViewCache.exceptions:
+            return
+        self.cache[cacheKey(obj, method, args)] = FrozenValue(value)
+
+    def clear(self):
+        self.cache = {}
+
+
+class PersistentViewCache(ActionViewCache):
+    """
+    ActionViewCache that also stores its entries in an sqlite database, so
+    views and actions don't need to be fetched again after a restart.
+
+    Entries are stored by scope (server, database, user and language). Each
+    scope keeps the stamp given by the server the last time it was opened
+    and its entries are discarded when the server returns a different one,
+    that is, when views, fields or actions have been modified.
+
+    Values are pickled so they're returned exactly as received (tuples and
+    non-string keys included). The database may be used from the threads
+    of asynchronous calls so it's only accessed with 'lock' held.
+    """
+
+    def __init__(self, path):
+        ActionViewCache.__init__(self)
+        self.path = path
+        self.scope = None
+        self.db = None
+        self.lock = threading.Lock()
+
+    def open(self, scope, stamp):
+        """
+        Opens the database for the given 'scope' and server 'stamp'.
+
+        Returns False if the database can't be used, in which case the cache
+        behaves as a plain ActionViewCache.
+        """
+        self.scope = str(scope)
+        with self.lock:
+            try:
+                self.db = sqlite3.connect(self.path, check_same_thread=False)
+                self.db.execute('CREATE TABLE IF NOT EXISTS scope '
+                                '(scope TEXT PRIMARY KEY, stamp TEXT)')
+                self.db.execute('CREATE TABLE IF NOT EXISTS entry '
+                                '(scope TEXT, key TEXT, value BLOB, '
+                                'PRIMARY KEY (scope, key))')
+                row = self.db.execute('SELECT stamp FROM scope WHERE scope=?',
+                                      (self.scope,)).fetchone()
+                if not row or row[0] != str(stamp):
+                    self.db.execute('DELETE FROM entry WHERE scope=?',
+                                    (self.scope,))
+                    self.db.execute('INSERT OR REPLACE INTO scope '
+                                    'VALUES (?, ?)', (self.scope, str(stamp)))
+                self.db.commit()
+            except sqlite3.Error:
+                self.db = None
+                return False
+        return True
+
+    def close(self):
+        with self.lock:
+            if self.db:
+                self.db.close()
+            self.db = None
+
+    def exists(self, obj, method, *args):
+        if ActionViewCache.exists(self, obj, method, *args):
+            return True
+        if not self.db or not self.isCached(obj, method, *args):
+            return False
+        key = cacheKey(obj, method, args)
+        with self.lock:
+            if not self.db:
+                return False
+            try:
+                row = self.db.execute('SELECT value FROM entry WHERE scope=? '
+                                      'AND key=?',
+                                      (self.scope, str(key))).fetchone()
+            except sqlite3.Error:
+                return False
+        if not row:
+            return False
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            # Entries written by older versions or corrupted
+            return False
+        self.cache[key] = FrozenValue(value)
+        return True
+
+    def add(self, value, obj, method, *args):
+        key = cacheKey(obj, method, args)
+        ActionViewCache.add(self, value, obj, method, *args)
+        if not self.db or key not in self.cache:
+            return
+        try:
+            data = sqlite3.Binary(pickle.dumps(value))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        with self.lock:
+            if not self.db:
                 return
-            self.cache[(obj, method, str(args))] = copy.deepcopy(value)
-        elif method == 'execute' and len(args) >= 2 and args[0] == 'ir.values' and args[1] == 'get':
-            self.cache[(obj, method, str(args))] = copy.deepcopy(value)
-        elif obj == '/fulltextsearch' and method == 'indexedModels':
-            self.cache[(obj, method, str(args))] = copy.deepcopy(value)
+            try:
+                self.db.execute('INSERT OR REPLACE INTO entry VALUES (?, ?, ?)',
+                                (self.scope, str(key), data))
+                self.db.commit()
+            except sqlite3.Error:
+                pass
+
+    def purge(self):
+        self.clear()
+        with self.lock:
+            if not self.db:
+                return
+            try:
+                self.db.execute('DELETE FROM entry WHERE scope=?',
+                                (self.scope,))
+                self.db.commit()
+            except sqlite3.Error:
+                pass
+
+
+class NameCache:
+    """
+    Stores the display name (as returned by name_get) of records, by model
+    and id, so many2one values can be shown without asking the server again.
+
+    Names of a model are discarded whenever its records are written or
+    unlinked through the session. At most 'maxSize' names are kept per model,
+    discarding the least recently used ones first.
+    """
+
+    def __init__(self, maxSize=10000):
+        self.cache = {}
+        self.maxSize = maxSize
+
+    def exists(self, model, ident):
+        return ident in self.cache.get(model, {})
+
+    def get(self, model, ident):
+        cache = self.cache.get(model)
+        if not cache or ident not in cache:
+            return None
+        cache.move_to_end(ident)
+        return cache[ident]
+
+    def add(self, model, names):
+        """
+        Stores the names of 'model' records. 'names' is the list of
+        (id, name) pairs returned by name_get.
+        """
+        cache = self.cache.setdefault(model, OrderedDict())
+        for ident, name in names:
+            cache[ident] = name
+            cache.move_to_end(ident)
+        while len(cache) > self.maxSize:
+            cache.popitem(last=False)
+
+    def invalidate(self, model):
+        self.cache.pop(model, None)
+
+    def clear(self):
+        self.cache = {}
+
+
+class ExpressionCache:
+    """
+    Stores expressions (domains, contexts, attrs, colors, etc.) compiled into
+    code objects by their source, so each one is parsed only once no matter
+    how many records or cells it's evaluated for.
+
+    Together with the code, the set of names it references is kept so
+    callers can prepare only the values the expression actually uses.
+    """
+
+    def __init__(self, maxSize=5000):
+        self.cache = {}
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, expression):
+        """
+        Returns a (code, names) tuple for the given 'expression' string.
+
+        Raises SyntaxError if the expression can't be compiled.
+        """
+        entry = self.cache.get(expression)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        code = compile(expression, '<expression>', 'eval')
+        entry = (code, frozenset(codeNames(code)))
+        if len(self.cache) >= self.maxSize:
+            self.cache = {}
+        self.cache[expression] = entry
+        return entry
 
     def clear(self):
         self.cache = {}
+
+
+def codeNames(code):
+    """
+    Returns the set of names referenced by 'code', including those
+    used inside lambdas and comprehensions.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= codeNames(const)
+    return names
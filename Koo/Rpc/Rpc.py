@@ -46,10 +46,18 @@ except:
     isNetRpcAvailable = False
 
 import xmlrpc.client
+import http.client
 import json
-import urllib
+import urllib.parse
 import base64
 import socket
+import copy
+import itertools
+import re
+import queue
+import threading
+import time
+import types
 
 import sys
 import os
@@ -101,6 +109,26 @@ class RpcServerException(RpcException):
             self.info = backtrace
             self.data = backtrace
 
+    def isUnsupported(self, method, model=None):
+        """
+        Returns True if the server doesn't provide the given service method,
+        or the given model when calling '/object', so there's no point in
+        calling it again. Any other error only affects the call that raised
+        it.
+        """
+        text = '%s\n%s' % (self.code, self.backtrace)
+        patterns = [
+            r'Method not found: %s\b' % re.escape(method),
+            r"has no attribute '(exp_)?%s'" % re.escape(method),
+            r'Unknown service',
+        ]
+        if model:
+            patterns.append(r"Object %s doesn't exist" % re.escape(model))
+        for pattern in patterns:
+            if re.search(pattern, text):
+                return True
+        return False
+
 
 # @brief The Connection class provides an abstract interface for a RPC
 # protocol
@@ -150,6 +178,16 @@ class Connection:
     def call(self, url, method, *args):
         pass
 
+    def clone(self):
+        """
+        Returns a connection to the same server that can be used from
+        another thread.
+        """
+        return createConnection(self.url)
+
+    def close(self):
+        pass
+
 
 try:
     import Pyro.core
@@ -272,31 +310,162 @@ class PyroConnection(Connection):
 
 
 class SocketConnection(Connection):
-    def call(self, obj, method, *args):
+    def __init__(self, url):
+        Connection.__init__(self, url)
+        # Each thread keeps its socket open between calls
+        self.local = threading.local()
+        self.sockets = []
+        self.lock = threading.Lock()
+
+    def socket(self):
+        """
+        Returns a tuple with the socket of the current thread, connecting it
+        if necessary, and whether it was already open.
+        """
+        s = getattr(self.local, 'socket', None)
+        if s:
+            return s, True
         try:
             s = tiny_socket.mysocket()
             s.connect(self.url)
         except socket.error as err:
             raise RpcProtocolException(str(err))
+        self.local.socket = s
+        with self.lock:
+            self.sockets.append(s)
+        return s, False
+
+    def dropSocket(self, s):
+        self.local.socket = None
+        with self.lock:
+            if s in self.sockets:
+                self.sockets.remove(s)
         try:
-            # Remove leading slash (ie. '/object' -> 'object')
-            obj = obj[1:]
-            encodedArgs = self.unicodeToString(args)
-            if self.authorized:
-                s.mysend((obj, method, self.databaseName,
-                          self.uid, self.password) + encodedArgs)
-            else:
-                s.mysend((obj, method) + encodedArgs)
-            result = s.myreceive()
-        except socket.error as err:
-            raise RpcProtocolException(str(err))
-        except tiny_socket.Myexception as err:
-            faultCode = err.faultCode
-            faultString = err.faultString
-            raise RpcServerException(faultCode, faultString)
-        finally:
             s.disconnect()
-        return self.stringToUnicode(result)
+        except socket.error:
+            pass
+
+    def close(self):
+        with self.lock:
+            sockets, self.sockets = self.sockets, []
+        for s in sockets:
+            try:
+                s.disconnect()
+            except socket.error:
+                pass
+        self.local = threading.local()
+
+    def call(self, obj, method, *args):
+        # Remove leading slash (ie. '/object' -> 'object')
+        obj = obj[1:]
+        encodedArgs = self.unicodeToString(args)
+        if self.authorized:
+            message = (obj, method, self.databaseName,
+                       self.uid, self.password) + encodedArgs
+        else:
+            message = (obj, method) + encodedArgs
+        while True:
+            s, reused = self.socket()
+            # The server may have closed an idle socket
+            if reused and s.isClosed():
+                self.dropSocket(s)
+                continue
+            sent = False
+            try:
+                s.mysend(message)
+                sent = True
+                result = s.myreceive()
+            except (socket.error, RuntimeError) as err:
+                self.dropSocket(s)
+                # Once the message has been sent the server may have
+                # executed it, so the call is only sent again if the socket
+                # was closed before that. A partially sent message is
+                # discarded by the server.
+                if (reused and not sent and
+                        not isinstance(err, socket.timeout)):
+                    continue
+                raise RpcProtocolException(str(err))
+            except tiny_socket.Myexception as err:
+                faultCode = err.faultCode
+                faultString = err.faultString
+                raise RpcServerException(faultCode, faultString)
+            return self.stringToUnicode(result)
+
+class HttpConnectionPool:
+    """
+    Keeps idle keep-alive HTTP(S) connections to a server so they're reused
+    by later calls instead of paying TCP (and TLS) setup on each call.
+
+    A connection is taken out of the pool for the duration of a request so
+    the same pool can be shared by connections used from several threads.
+    """
+
+    def __init__(self, url, maxIdle=4):
+        parts = urllib.parse.urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.maxIdle = maxIdle
+        self.idle = []
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self):
+        """
+        Returns a tuple with an HTTP connection and whether it was reused
+        from the pool.
+        """
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+            self.created += 1
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port), False
+        return http.client.HTTPConnection(self.host, self.port), False
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.maxIdle:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, path, body, headers):
+        """
+        POSTs 'body' to 'path' and returns a tuple with the response and
+        its contents.
+
+        If a reused connection was closed by the server meanwhile, the
+        request is sent again using a new one.
+        """
+        while True:
+            connection, reused = self.acquire()
+            try:
+                connection.request('POST', path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.BadStatusLine):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+            return response, data
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
 
 # @brief The XmlRpcConnection class implements Connection class for XML-RPC.
 #
@@ -307,28 +476,49 @@ class XmlRpcConnection(Connection):
     def __init__(self, url):
         Connection.__init__(self, url)
         self.url += '/xmlrpc'
+        self.pool = HttpConnectionPool(url)
 
-    def call(self, obj, method, *args):
-        with xmlrpc.client.ServerProxy(self.url + obj, allow_none=True) as remote:
-            function = getattr(remote, method)
-            try:
-                if self.authorized:
-                    result = function(self.databaseName, self.uid,
-                                      self.password, *args)
+    def clone(self):
+        # Connections share the pool which can be used from several threads.
+        return copy.copy(self)
 
-                else:
-                    result = function(*args)
-            except socket.error as err:
-                raise RpcProtocolException(err)
-            except xmlrpc.client.Fault as err:
-                raise RpcServerException(err.faultCode, err.faultString)
-            return result
+    def close(self):
+        self.pool.close()
+
+    def call(self, obj, method, *args):
+        if self.authorized:
+            args = (self.databaseName, self.uid, self.password) + args
+        try:
+            request = xmlrpc.client.dumps(args, method, allow_none=True)
+            response, data = self.pool.request(
+                '/xmlrpc' + obj, request.encode('utf-8'),
+                {'Content-Type': 'text/xml'}
+            )
+            if response.status != 200:
+                raise xmlrpc.client.ProtocolError(
+                    self.url + obj, response.status, response.reason,
+                    response.msg
+                )
+            result = xmlrpc.client.loads(data)[0][0]
+        except socket.error as err:
+            raise RpcProtocolException(err)
+        except xmlrpc.client.Fault as err:
+            raise RpcServerException(err.faultCode, err.faultString)
+        return result
 
 
 class MsgpackConnection(Connection):
     def __init__(self, url, content_type="application/msgpack"):
         self.content_type = content_type
         super(MsgpackConnection, self).__init__(url)
+        self.pool = HttpConnectionPool(url)
+
+    def clone(self):
+        # Connections share the pool which can be used from several threads.
+        return copy.copy(self)
+
+    def close(self):
+        self.pool.close()
 
     def encode(self, payload):
         if self.content_type == "application/json":
@@ -343,7 +533,6 @@ class MsgpackConnection(Connection):
             return msgpack.unpackb(payload, raw=False)
 
     def call(self, obj, method, *args):
-        endpoint = '%s%s' % (self.url, obj)
         try:
             if self.authorized:
                 m = self.encode(
@@ -352,13 +541,15 @@ class MsgpackConnection(Connection):
                 )
             else:
                 m = self.encode([method] + list(args))
-            req = urllib.request.Request(endpoint, m)
-            req.add_header('Content-Type', self.content_type)
-            u = urllib.request.urlopen(req)
-            s = u.read()
-            u.close()
+            response, s = self.pool.request(
+                obj, m, {'Content-Type': self.content_type}
+            )
+            if response.status not in (200, 210):
+                raise RpcProtocolException('%s%s: %s %s' % (
+                    self.url, obj, response.status, response.reason
+                ))
             result = self.decode(s)
-            if u.code == 210:
+            if response.status == 210:
                 raise RpcServerException(
                     result['exception'],
                     result['traceback']
@@ -390,13 +581,26 @@ def createConnection(url):
     return con
 
 
-class AsynchronousSessionCall(QThread):
+class AsynchronousSessionCall(QObject):
+    """
+    Keeps track of a call queued with Session.callAsync() or
+    Session.executeAsync(). Calls are run by the SessionCallExecutor of the
+    session and the result is delivered in the thread the call was created
+    in (usually the GUI thread).
+    """
+    # Calls with lower values are run first.
+    HighPriority = 0
+    NormalPriority = 5
+    LowPriority = 10
+
     exception = pyqtSignal('PyQt_PyObject')
     called = pyqtSignal('PyQt_PyObject')
+    # Emitted from the worker thread when the call has been run.
+    done = pyqtSignal()
 
     def __init__(self, session, parent=None):
-        QThread.__init__(self, parent)
-        self.session = session.copy()
+        QObject.__init__(self, parent)
+        self.session = session
         self.obj = None
         self.method = None
         self.args = None
@@ -405,10 +609,18 @@ class AsynchronousSessionCall(QThread):
         self.error = None
         self.warning = None
         self.exception = None
+        self.priority = AsynchronousSessionCall.NormalPriority
+        self.executor = None
+        self.cancelled = False
+        self.queuedTime = None
+        self.startTime = None
+        self.finishTime = None
+        self.finishedEvent = threading.Event()
         # If false, the behaviour is the same as Session.call()
         # otherwise we use the notification mechanism and behave
         # like Session.execute()
         self.useNotifications = False
+        self.done.connect(self.hasFinished)
 
     def execute(self, callback, obj, method, *args):
         self.useNotifications = True
@@ -417,7 +629,6 @@ class AsynchronousSessionCall(QThread):
         self.obj = obj
         self.method = method
         self.args = args
-        self.finished.connect(self.hasFinished)
         self.start()
 
     def call(self, callback, obj, method, *args):
@@ -427,10 +638,45 @@ class AsynchronousSessionCall(QThread):
         self.obj = obj
         self.method = method
         self.args = args
-        self.finished.connect(self.hasFinished)
         self.start()
 
+    def start(self):
+        self.executor = self.session.executor()
+        self.executor.submit(self)
+
+    def cancel(self):
+        """
+        Cancels the call. If it's still queued it won't reach the server,
+        otherwise its result is discarded and the callback isn't called.
+        """
+        self.cancelled = True
+
+    # Kept for compatibility with the time each call had its own thread.
+    terminate = cancel
+
+    def isRunning(self):
+        return self.startTime is not None and not self.isFinished()
+
+    def isFinished(self):
+        return self.finishedEvent.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the call has been run or cancelled. 'timeout' is given
+        in seconds.
+        """
+        return self.finishedEvent.wait(timeout)
+
+    def finish(self):
+        self.finishTime = time.time()
+        self.finishedEvent.set()
+        self.done.emit()
+
     def hasFinished(self):
+        self.executor.delivered(self)
+        if self.cancelled:
+            self.session = None
+            return
         if self.exception:
             if self.useNotifications:
                 # Note that if there's an error or warning
@@ -451,18 +697,18 @@ class AsynchronousSessionCall(QThread):
         # Free session and thus server  as soon as possible
         self.session = None
 
-    def run(self):
+    def run(self, session):
         # As we don't want to force initialization of gettext if 'call' is used
         # we handle exceptions depending on 'useNotifications'
         if not self.useNotifications:
             try:
-                self.result = self.session.call(
+                self.result = session.call(
                     self.obj, self.method, *self.args)
             except Exception as err:
                 self.exception = err
         else:
             try:
-                self.result = self.session.call(
+                self.result = session.call(
                     self.obj, self.method, *self.args)
             except RpcProtocolException as err:
                 self.exception = err
@@ -474,6 +720,114 @@ class AsynchronousSessionCall(QThread):
                 else:
                     self.error = (_('Application Error'), _(
                         'View details'), err.backtrace)
+            except Exception as err:
+                self.exception = err
+
+
+class SessionCallExecutor:
+    """
+    Runs asynchronous calls of a session with a bounded number of worker
+    threads.
+
+    Each worker keeps its own copy of the session (and thus its connection)
+    between calls. Queued calls are run by priority and then in the order
+    they were submitted.
+    """
+
+    def __init__(self, session, maxWorkers=4):
+        self.session = session
+        self.maxWorkers = max(1, maxWorkers)
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.idle = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.totalWait = 0.0
+        self.totalLatency = 0.0
+        # Calls are kept until their result has been delivered, so callers
+        # don't need to keep a reference to them.
+        self.calls = set()
+
+    def submit(self, call):
+        call.queuedTime = time.time()
+        self.queue.put((call.priority, next(self.sequence), call))
+        with self.lock:
+            self.calls.add(call)
+            if self.idle or len(self.workers) >= self.maxWorkers:
+                return
+            worker = threading.Thread(target=self.work, name='Koo RPC')
+            worker.daemon = True
+            self.workers.append(worker)
+        worker.start()
+
+    def work(self):
+        session = None
+        credentials = None
+        while True:
+            with self.lock:
+                self.idle += 1
+            priority, sequence, call = self.queue.get()
+            with self.lock:
+                self.idle -= 1
+            if call is None:
+                return
+            if call.cancelled:
+                with self.lock:
+                    self.cancelled += 1
+                call.finish()
+                continue
+            current = (self.session.url, self.session.databaseName,
+                       self.session.uid, self.session.password)
+            if session is None or credentials != current:
+                session = self.session.copy()
+                credentials = current
+            session.context = self.session.context
+            call.startTime = time.time()
+            with self.lock:
+                self.running += 1
+            call.run(session)
+            call.finishTime = time.time()
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.totalWait += call.startTime - call.queuedTime
+                self.totalLatency += call.finishTime - call.startTime
+            call.finish()
+
+    def delivered(self, call):
+        with self.lock:
+            self.calls.discard(call)
+
+    def metrics(self):
+        """
+        Returns a dict with the number of calls 'queued', 'running',
+        'completed' and 'cancelled', the number of 'workers' and the
+        'averageWait' (in the queue) and 'averageLatency' (of the call
+        itself) in seconds.
+        """
+        with self.lock:
+            completed = self.completed or 1
+            return {
+                'queued': self.queue.qsize(),
+                'running': self.running,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'workers': len(self.workers),
+                'averageWait': self.totalWait / completed,
+                'averageLatency': self.totalLatency / completed,
+            }
+
+    def shutdown(self):
+        """
+        Stops the workers once the calls already queued have been run.
+        """
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            self.queue.put((sys.maxsize, next(self.sequence), None))
 
 
 # @brief The Session class provides a simple way of login and executing function in a server
@@ -501,30 +855,25 @@ class Session:
         self.databaseName = None
         self.connection = None
         self.cache = None
-        self.threads = []
+        self.nameCache = NameCache()
+        self.expressionCache = ExpressionCache()
+        # Whether the server provides koo's execute_many
+        self.batchAvailable = True
+        self.callExecutor = None
 
-
-    def appendThread(self, thread):
+    def executor(self):
         """
-        This function removes all finished threads from the list of running
-        threads and appends the one provided.
-        We keep a reference to all threads started because otherwise their
-        C++ counterparts would be freed by garbage collector. User can also
-        keep a reference to it when she calls callAsync or executeAsync but
-        with this mechanism she's not forced to it.
-        The only inconvenience we could find is that we kept some thread
-        objects for much too long in memory, but that doesn't seem worrisome
-        by now.
-
-        :param thread:
-        :return: None
-        :rtype: None
+        Returns the SessionCallExecutor that runs the asynchronous calls of
+        the session.
         """
-        self.threads = [x for x in self.threads if x.isRunning()]
-        self.threads.append(thread)
-
-
-    def callAsync(self, callback, obj, method, *args):
+        if not self.callExecutor:
+            from Koo.Common.Settings import Settings
+            self.callExecutor = SessionCallExecutor(
+                self, Settings.value('koo.rpc_workers', 4, int))
+        return self.callExecutor
+
+    def callAsync(self, callback, obj, method, *args,
+                  priority=AsynchronousSessionCall.NormalPriority):
         """
         Calls asynchronously the specified method on the given object on the
         server.
@@ -554,14 +903,18 @@ class Session:
         :param exceptionCallback: Function that has to be called when an
         exception returns from the server.
         :param args: Argument list for the given method
+        :param priority: Calls with lower priority values are run first. Use
+        AsynchronousSessionCall.HighPriority for calls the user is waiting for
+        and LowPriority for background ones.
         :return:
         """
         caller = AsynchronousSessionCall(self)
+        caller.priority = priority
         caller.call(callback, obj, method, *args)
-        self.appendThread(caller)
         return caller
 
-    def executeAsync(self, callback, obj, method, *args):
+    def executeAsync(self, callback, obj, method, *args,
+                     priority=AsynchronousSessionCall.NormalPriority):
         """
         Same as callAsync() but uses the notify mechanism to notify exceptions.
 
@@ -574,8 +927,8 @@ class Session:
         :return:
         """
         caller = AsynchronousSessionCall(self)
+        caller.priority = priority
         caller.execute(callback, obj, method, *args)
-        self.appendThread(caller)
         return caller
 
 
@@ -600,9 +953,112 @@ class Session:
             if self.cache.exists(obj, method, *args):
                 return self.cache.get(obj, method, *args)
         value = self.connection.call(obj, method, *args)
+        self.called(value, obj, method, *args)
+        return value
+
+    def called(self, value, obj, method, *args):
+        """
+        Updates the caches with the value returned by the given call.
+        """
         if self.cache:
             self.cache.add(value, obj, method, *args)
-        return value
+        if obj == '/object' and method == 'execute' and len(args) >= 2:
+            if args[1] == 'unlink' or args[1].startswith('write'):
+                self.nameCache.invalidate(args[0])
+
+    def callMany(self, calls):
+        """
+        Calls several model methods on the server in a single round trip.
+
+        Calls that can be answered by the cache don't reach the server. The
+        rest are sent together to the execute_many method of the koo server
+        module, or one by one if it's not available.
+
+        :param calls: List of (model, method, args) tuples. Each of them
+        is executed as execute(model, method, *args) of the '/object' service.
+        :type calls: list
+        :return: List with the result of each call or the RpcServerException
+        it raised.
+        :rtype: list
+        """
+        if not self.open:
+            raise RpcException(_('Not logged in'))
+        calls = [(model, method) + tuple(args) for model, method, args in calls]
+        results = [None] * len(calls)
+        pending = []
+        for index, args in enumerate(calls):
+            if self.cache and self.cache.exists('/object', 'execute', *args):
+                results[index] = self.cache.get('/object', 'execute', *args)
+            else:
+                pending.append(index)
+        if not pending:
+            return results
+
+        replies = None
+        if len(pending) > 1 and self.batchAvailable:
+            try:
+                replies = self.connection.call(
+                    '/koo', 'execute_many',
+                    [[calls[i][0], calls[i][1], list(calls[i][2:])]
+                     for i in pending]
+                )
+            except RpcServerException as err:
+                # Only stop batching if the koo module of the server doesn't
+                # provide execute_many. Otherwise the calls are sent one by
+                # one this time so the error is reported by the failing call.
+                if err.isUnsupported('execute_many'):
+                    self.batchAvailable = False
+
+        for position, index in enumerate(pending):
+            args = calls[index]
+            if replies is None:
+                try:
+                    value = self.connection.call('/object', 'execute', *args)
+                except RpcServerException as err:
+                    results[index] = err
+                    continue
+            elif 'exception' in replies[position]:
+                results[index] = RpcServerException(
+                    replies[position]['exception'],
+                    replies[position]['traceback']
+                )
+                continue
+            else:
+                value = replies[position]['result']
+            self.called(value, '/object', 'execute', *args)
+            results[index] = value
+        return results
+
+    def executeMany(self, calls):
+        """
+        Same as callMany() but uses the notify mechanism to notify
+        exceptions.
+
+        Warnings are notified and the result of the call that raised it is
+        None. Other errors are raised.
+
+        :param calls: List of (model, method, args) tuples.
+        :type calls: list
+        :return: List with the result of each call.
+        :rtype: list
+        """
+        count = 1
+        while True:
+            try:
+                results = self.callMany(calls)
+                break
+            except RpcProtocolException as err:
+                if not Notifier.notifyLostConnection(count):
+                    raise
+            count += 1
+        for index, result in enumerate(results):
+            if not isinstance(result, RpcServerException):
+                continue
+            if result.type not in ('warning', 'UserError'):
+                raise result
+            Notifier.notifyWarning(result.info, result.data)
+            results[index] = None
+        return results
 
     def execute(self, obj, method, *args):
         """
@@ -674,6 +1130,8 @@ class Session:
         self.databaseName = db
         if self.cache:
             self.cache.clear()
+        self.nameCache.clear()
+        self.batchAvailable = True
 
         self.connection.databaseName = self.databaseName
         self.connection.password = self.password
@@ -693,6 +1151,8 @@ class Session:
         """
         self.context = self.execute(
             '/object', 'execute', 'res.users', 'context_get') or {}
+        # Names depend on the language
+        self.nameCache.clear()
 
     def logged(self):
         """
@@ -712,15 +1172,37 @@ class Session:
             self.userName = None
             self.uid = None
             self.password = None
+            if self.connection:
+                self.connection.close()
             self.connection = None
+            if self.callExecutor:
+                self.callExecutor.shutdown()
+                self.callExecutor = None
             if self.cache:
                 self.cache.clear()
+            self.nameCache.clear()
+
+    def compileExpression(self, expression):
+        """
+        Returns a (code, names) tuple with the compiled 'expression' and the
+        names it references. Compiled expressions are cached.
+
+        :param expression:
+        :type expression: str
+        :return:
+        """
+        if "'active_id'" in expression:
+            expression = expression.replace("'active_id'", "active_id")
+        return self.expressionCache.compile(expression)
 
     def evaluateExpression(self, expression, context=None):
         """
         Uses eval to evaluate the expression, using the defined context plus
         the appropiate 'uid' in it.
 
+        'expression' may also be a code object returned by
+        compileExpression().
+
         :param expression:
         :param context:
         :return:
@@ -729,8 +1211,8 @@ class Session:
             context = {}
         context['uid'] = self.uid
         if isinstance(expression, str):
-            if "'active_id'" in expression:
-                expression = expression.replace("'active_id'", "active_id")
+            return eval(self.compileExpression(expression)[0], context)
+        elif isinstance(expression, types.CodeType):
             return eval(expression, context)
         else:
             return expression
@@ -744,10 +1226,17 @@ class Session:
         new.context = self.context
         new.userName = self.userName
         new.databaseName = self.databaseName
-        # Create a new connection as Pyro protocol does not allow the use of
-        # the same connection in different threads and this copy() function
-        # will mostly be called to use the session in new threads.
-        new.connection = createConnection(new.url)
+        new.nameCache = self.nameCache
+        new.expressionCache = self.expressionCache
+        new.batchAvailable = self.batchAvailable
+        # Pyro protocol does not allow the use of the same connection in
+        # different threads and this copy() function will mostly be called to
+        # use the session in new threads. HTTP connections share their pool of
+        # keep-alive connections instead of creating a new one.
+        if self.connection:
+            new.connection = self.connection.clone()
+        else:
+            new.connection = createConnection(new.url)
         new.connection.databaseName = self.databaseName
         new.connection.password = self.password
         new.connection.uid = self.uid
@@ -26,7 +26,9 @@
 ##############################################################################
 
 from PyQt5.QtCore import *
-from time import sleep
+import threading
+import uuid
+import weakref
 
 # @brief The Subscriber class provides a mechanisme for subscribing to server events.
 #
@@ -38,6 +40,10 @@ from time import sleep
 # If the 'koo' module is not installed the Subscription service won't emit any signals, but won't
 # return any errors either.
 #
+# All subscribers of a session share a single SubscriptionChannel, so only one
+# connection is kept waiting for events on the server regardless of the number
+# of subscriptions.
+#
 # Example of usage:
 #
 # self.subscriber = Rpc.Subscriber(Rpc.session, self)
@@ -47,23 +53,29 @@ from time import sleep
 # on any record in 'res.request' model.
 
 
-class Subscriber(QThread):
-    # @brief Creates a new Subscriber object from the given session and with 'parent' as QObject parent.
+class Subscriber(QObject):
+    # @brief Emitted each time the subscribed expression is published.
     published = pyqtSignal()
+    # @brief Emitted with the list of ids of the records involved, or False
+    # if they're not known.
+    publishedIds = pyqtSignal('PyQt_PyObject')
 
+    # @brief Creates a new Subscriber object from the given session and with 'parent' as QObject parent.
     def __init__(self, session, parent=None):
-        QThread.__init__(self, parent)
-        self.session = session.copy()
+        QObject.__init__(self, parent)
+        self.channel = SubscriptionChannel.instance(session)
+        self.expression = None
         self.slot = None
 
     # @brief Subscribes to the given 'expression' event on the server. And calls 'slot' each
     # time the given event is published.
     def subscribe(self, expression, slot=None):
+        self.unsubscribe()
         self.expression = expression
         self.slot = slot
         if self.slot:
             self.published.connect(self.slot)
-        self.start()
+        self.channel.add(self)
 
     # @brief Unsubscribes from the previously subscribed event.
     #
@@ -71,13 +83,192 @@ class Subscriber(QThread):
     def unsubscribe(self):
         if self.slot:
             self.published.disconnect(self.slot)
-        self.terminate()
+            self.slot = None
+        if self.expression:
+            self.channel.remove(self)
+            self.expression = None
+
+    def notify(self, ids):
+        self.published.emit()
+        self.publishedIds.emit(ids)
+
+
+# @brief The SubscriptionChannel class waits for the events of all subscribers of a session.
+#
+# Its thread keeps a single 'listen' call to the server which returns the
+# events published for any of the subscribed expressions (coalesced, with
+# the ids of the records involved). Subscribers are notified in the thread
+# the channel was created in (usually the GUI thread).
+class SubscriptionChannel(QObject):
+    received = pyqtSignal('PyQt_PyObject')
+
+    # Seconds each 'listen' call waits in the server
+    ListenTimeout = 60
+    # Seconds to wait before trying again after an error
+    RetryDelay = 60
+    # Milliseconds to wait for more subscription changes before sending them
+    # to the server
+    UpdateDelay = 100
+
+    channels = weakref.WeakKeyDictionary()
+
+    # @brief Returns the channel of the given session, creating it if needed.
+    @staticmethod
+    def instance(session):
+        channel = SubscriptionChannel.channels.get(session)
+        if not channel:
+            channel = SubscriptionChannel(session)
+            SubscriptionChannel.channels[session] = channel
+        return channel
+
+    def __init__(self, session, parent=None):
+        QObject.__init__(self, parent)
+        self.parentSession = session
+        self.session = None
+        self.credentials = None
+        self.thread = None
+        self.identifier = uuid.uuid4().hex
+        self.version = 0
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.wakeUp = threading.Event()
+        self.stopped = False
+        self.available = True
+        self.updateScheduled = False
+        self.received.connect(self.dispatch)
+
+    # @brief Adds the given subscriber to the channel.
+    def add(self, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.setdefault(subscriber.expression, [])
+            subscribers.append(subscriber)
+            changed = len(subscribers) == 1
+        if changed:
+            self.scheduleUpdate()
+        if not self.available:
+            return
+        if not self.thread or not self.thread.is_alive():
+            self.stopped = False
+            # Use a daemon thread so a pending 'listen' call doesn't prevent
+            # the application from quitting.
+            self.thread = threading.Thread(target=self.run,
+                                           name='Koo subscriptions')
+            self.thread.daemon = True
+            self.thread.start()
+        self.wakeUp.set()
+
+    # @brief Removes the given subscriber from the channel.
+    def remove(self, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.expression, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            changed = not subscribers and subscriber.expression in self.subscribers
+            if changed:
+                del self.subscribers[subscriber.expression]
+        if changed:
+            self.scheduleUpdate()
+
+    # @brief Sends the subscribed expressions to the server after UpdateDelay
+    # milliseconds, so subscribers added or removed together (for example
+    # when a window is opened) cause a single call.
+    def scheduleUpdate(self):
+        if self.updateScheduled:
+            return
+        self.updateScheduled = True
+        QTimer.singleShot(self.UpdateDelay, self.sendUpdate)
+
+    # @brief Sends the subscribed expressions to the server without blocking.
+    def sendUpdate(self):
+        self.updateScheduled = False
+        if not self.available or not self.parentSession.open:
+            return
+        version, expressions = self.nextVersion()
+        self.parentSession.callAsync(self.updated, '/subscription',
+                                     'subscribe', self.identifier, version,
+                                     expressions)
+
+    def updated(self, result, exception):
+        # If the update couldn't be sent, the listener thread will subscribe
+        # again once the server tells the channel doesn't exist.
+        if exception is not None:
+            self.handleError('subscribe', exception)
+
+    # @brief Sends the list of subscribed expressions to the server. Blocks
+    # until the server replies so it's only used by the listener thread.
+    def update(self, session):
+        if not self.available:
+            return False
+        version, expressions = self.nextVersion()
+        if not session.open:
+            return False
+        return self.call(session, 'subscribe', self.identifier, version,
+                         expressions) is not None
+
+    # @brief Returns a new version number and the list of subscribed expressions.
+    def nextVersion(self):
+        with self.lock:
+            self.version += 1
+            return self.version, list(self.subscribers.keys())
+
+    # @brief Calls the given method of the subscription service. Returns None on error.
+    def call(self, session, method, *args):
+        try:
+            return session.call('/subscription', method, *args)
+        except Exception as err:
+            self.handleError(method, err)
+        return None
+
+    def handleError(self, method, exception):
+        from .Rpc import RpcServerException
+        if (isinstance(exception, RpcServerException) and
+                exception.isUnsupported(method)):
+            # The 'koo' module is not installed on the server
+            self.available = False
+        # Otherwise the server is not available. The thread will try again
+        # later.
+
+    def stop(self):
+        self.stopped = True
+        self.wakeUp.set()
+
+    def dispatch(self, events):
+        for expression, ids in events:
+            with self.lock:
+                subscribers = self.subscribers.get(expression, [])[:]
+            for subscriber in subscribers:
+                try:
+                    subscriber.notify(ids)
+                except RuntimeError:
+                    # The subscriber was deleted without unsubscribing
+                    self.remove(subscriber)
 
     def run(self):
-        while True:
-            try:
-                self.result = self.session.call(
-                    '/subscription', 'wait', self.expression)
-                self.published.emit()
-            except Exception as err:
-                sleep(60)
+        while not self.stopped and self.available:
+            with self.lock:
+                empty = not self.subscribers
+            if empty or not self.parentSession.open:
+                # Nothing to listen to. Wait until we're given something.
+                self.wakeUp.wait(self.RetryDelay)
+                self.wakeUp.clear()
+                continue
+            current = (self.parentSession.url, self.parentSession.databaseName,
+                       self.parentSession.uid, self.parentSession.password)
+            if self.session is None or self.credentials != current:
+                self.session = self.parentSession.copy()
+                self.credentials = current
+            events = self.call(self.session, 'listen', self.identifier,
+                               self.ListenTimeout)
+            if events is None:
+                self.wakeUp.wait(self.RetryDelay)
+                self.wakeUp.clear()
+                continue
+            if events is False:
+                # The server doesn't know about the channel (it expired or
+                # the server was restarted) so subscribe again.
+                if not self.update(self.session):
+                    self.wakeUp.wait(self.RetryDelay)
+                    self.wakeUp.clear()
+                continue
+            if events:
+                self.received.emit(events)
@@ -26,11 +26,15 @@
 ##############################################################################
 
 import socket
+import select
 import pickle
 import sys
 
 DNS_CACHE = {}
 
+# Receive buffers up to this size are kept for the next replies.
+MAX_BUFFER_SIZE = 4 * 1024 * 1024
+
 
 class Myexception(Exception):
     def __init__(self, faultCode, faultString):
@@ -47,6 +51,7 @@ class mysocket:
         else:
             self.sock = sock
         self.sock.settimeout(120)
+        self.buffer = bytearray()
 
     def connect(self, host, port=False):
         if not port:
@@ -64,38 +69,56 @@ class mysocket:
             self.sock.shutdown(socket.SHUT_RDWR)
         self.sock.close()
 
+    def isClosed(self):
+        """
+        Returns whether the peer has closed the connection, without
+        blocking. Used to check idle sockets before sending a new message.
+        """
+        try:
+            readable = select.select([self.sock], [], [], 0)[0]
+            if not readable:
+                return False
+            return not self.sock.recv(1, socket.MSG_PEEK)
+        except (socket.error, ValueError):
+            return True
+
     def mysend(self, msg, exception=False, traceback=None):
-        msg = pickle.dumps([msg, traceback])
-        size = len(msg)
-        self.sock.send('%8d' % size)
-        self.sock.send(exception and "1" or "0")
-        totalsent = 0
-        while totalsent < size:
-            sent = self.sock.send(msg[totalsent:])
-            if sent == 0:
+        # Protocol 2 can be read by servers running python 2
+        msg = pickle.dumps([msg, traceback], 2)
+        header = b'%8d' % len(msg) + (exception and b"1" or b"0")
+        self.sock.sendall(header + msg)
+
+    def receiveInto(self, view):
+        """
+        Fills the given memoryview with data read from the socket.
+        """
+        while len(view):
+            received = self.sock.recv_into(view)
+            if not received:
                 raise RuntimeError("socket connection broken")
-            totalsent = totalsent + sent
+            view = view[received:]
 
     def myreceive(self):
-        buf = ''
-        while len(buf) < 8:
-            chunk = self.sock.recv(8 - len(buf))
-            if chunk == '':
-                raise RuntimeError("socket connection broken")
-            buf += chunk
-        size = int(buf)
-        buf = self.sock.recv(1)
-        if buf != "0":
-            exception = buf
+        header = bytearray(9)
+        self.receiveInto(memoryview(header))
+        size = int(header[:8])
+        exception = header[8:9] != b"0"
+        # Replies are read into a buffer that is allocated once and reused
+        # by the following calls, instead of concatenating the chunks.
+        if size > len(self.buffer):
+            if size <= MAX_BUFFER_SIZE:
+                self.buffer = bytearray(size)
+                buf = self.buffer
+            else:
+                buf = bytearray(size)
         else:
-            exception = False
-        msg = ''
-        while len(msg) < size:
-            chunk = self.sock.recv(size - len(msg))
-            if chunk == '':
-                raise RuntimeError("socket connection broken")
-            msg = msg + chunk
-        res = pickle.loads(msg)
+            buf = self.buffer
+        view = memoryview(buf)[:size]
+        try:
+            self.receiveInto(view)
+            res = pickle.loads(view, encoding='bytes')
+        finally:
+            view.release()
         if isinstance(res[0], Exception):
             if exception:
                 raise Myexception(str(res[0]), str(res[1]))
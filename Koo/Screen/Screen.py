@@ -271,10 +271,10 @@ class Screen(QScrollArea):
             return
         if self.currentView().showsMultipleRecords() and not self._embedded:
             if not self.searchForm.isLoaded():
-                form = Rpc.session.execute(
-                    '/object', 'execute', self.resource, 'fields_view_get', False, 'form', self.context)
-                tree = Rpc.session.execute(
-                    '/object', 'execute', self.resource, 'fields_view_get', False, 'tree', self.context)
+                form, tree = Rpc.session.executeMany([
+                    (self.resource, 'fields_view_get', (False, 'form', self.context)),
+                    (self.resource, 'fields_view_get', (False, 'tree', self.context)),
+                ])
                 fields = form['fields']
                 fields.update(tree['fields'])
                 arch = form['arch']
@@ -527,7 +527,7 @@ class Screen(QScrollArea):
         else:
             ident = -1
         if self.group:
-            count = self.group.count()
+            count = self.group.totalCount()
         else:
             count = 0
         self.recordMessage.emit(pos, count, ident)
@@ -1014,6 +1014,8 @@ class Screen(QScrollArea):
         self.currentView().store()
         if self.group.recordExists(self.currentRecord()):
             idx = self.group.indexOfRecord(self.currentRecord())
+            if idx + 1 >= self.group.count():
+                self.group.fetchMore()
             idx = (idx + 1) % self.group.count()
             self.setCurrentRecord(self.group.modelByIndex(idx))
         else:
@@ -1035,6 +1037,7 @@ class Screen(QScrollArea):
             #idx = self.group.records.index(self.currentRecord())-1
             idx = self.group.indexOfRecord(self.currentRecord()) - 1
             if idx < 0:
+                self.group.fetchAll()
                 idx = self.group.count() - 1
             self.setCurrentRecord(self.group.modelByIndex(idx))
         else:
@@ -33,9 +33,243 @@ from Koo.Common import Common
 from Koo.Common import Calendar
 from Koo.View.AbstractView import *
 from Koo.KooChart import ColorManager
+from Koo import Rpc
+from collections import OrderedDict
 import math
 
 
+class CalendarDataSource(QObject):
+    """
+    Provides the records of a RecordGroup shown by the calendar for a given
+    range of dates.
+
+    Records are searched and read one month (period) at a time in the
+    background, restricting the group's domain and filter to the dates of
+    the period, and kept in a cache of 'maxPeriods' periods with the least
+    recently used ones discarded first. 'loaded' is emitted when a period
+    that was requested arrives. The periods next to the ones requested are
+    prefetched so navigating to the previous or next month doesn't need to
+    wait for the server.
+
+    Only the records of the range being shown are added to the group (see
+    RecordGroup.mergeValues()) so they can be selected and opened as any
+    other record of the view. They're removed from the group once another
+    range is shown.
+    """
+    loaded = pyqtSignal()
+
+    def __init__(self, maxPeriods=12):
+        QObject.__init__(self)
+        self.maxPeriods = maxPeriods
+        self.prefetch = True
+        self._group = None
+        self._field = None
+        self._key = None
+        self._periods = OrderedDict()
+        self._pending = {}
+        # Periods being shown, see values()
+        self._requested = []
+        # Ids of the records added to the group by rowsByDay()
+        self._merged = set()
+        self._updatingGroup = False
+
+    def setGroup(self, group, field):
+        """
+        Sets the group whose records are provided and the name of the field
+        with the date (or datetime) in which each record starts.
+        """
+        if group is self._group and field == self._field:
+            return
+        if self._group:
+            self._group.recordsRemoved[int, int].disconnect(self.discard)
+            self._group.modified.disconnect(self.clear)
+        self._group = group
+        self._field = field
+        self._merged = set()
+        self.clear()
+        if self._group:
+            self._group.recordsRemoved[int, int].connect(self.discard)
+            self._group.modified.connect(self.clear)
+
+    def discard(self, start, end):
+        if not self._updatingGroup:
+            self.clear()
+
+    def clear(self):
+        """
+        Discards all cached periods, for example, because records have been
+        modified or removed.
+        """
+        for call in self._pending.values():
+            call.cancel()
+        self._pending = {}
+        self._periods = OrderedDict()
+        self._key = None
+
+    def isAvailable(self):
+        """
+        Returns True if records can be fetched by periods, that is, if the
+        records of the group are the result of a search.
+        """
+        return bool(self._group and self._field and
+                    self._group.isSearchResult())
+
+    @staticmethod
+    def periodKey(date):
+        return (date.year(), date.month())
+
+    @staticmethod
+    def periodDomain(field, key):
+        year, month = key
+        start = QDate(year, month, 1)
+        return [
+            (field, '>=', Calendar.dateToStorage(start)),
+            (field, '<', Calendar.dateToStorage(start.addMonths(1))),
+        ]
+
+    @staticmethod
+    def adjacentKey(key, months):
+        date = QDate(key[0], key[1], 1).addMonths(months)
+        return CalendarDataSource.periodKey(date)
+
+    def periodKeys(self, start, end):
+        keys = []
+        date = QDate(start.year(), start.month(), 1)
+        while date <= end:
+            keys.append(self.periodKey(date))
+            date = date.addMonths(1)
+        return keys
+
+    def context(self):
+        context = Rpc.session.context.copy()
+        context.update(self._group.context())
+        context['bin_size'] = True
+        return context
+
+    def domain(self, key):
+        return (self._group.domain() + self._group.filter() +
+                self.periodDomain(self._field, key))
+
+    def ensureKey(self):
+        # Periods are only valid for the domain, filter and context they
+        # were fetched with.
+        key = repr((self._group.domain(), self._group.filter(),
+                    self._group.context()))
+        if key != self._key:
+            self.clear()
+            self._key = key
+
+    def storePeriod(self, key, values):
+        self._periods[key] = values or []
+        self._periods.move_to_end(key)
+        while len(self._periods) > self.maxPeriods:
+            self._periods.popitem(last=False)
+        if key in self._requested:
+            self.loaded.emit()
+
+    def prefetchPeriod(self, key):
+        self.fetchPeriod(key, Rpc.AsynchronousSessionCall.LowPriority)
+
+    def fetchPeriod(self, key,
+                    priority=Rpc.AsynchronousSessionCall.NormalPriority):
+        """
+        Searches and reads the records of the given period in the
+        background and stores them in the cache.
+        """
+        if key in self._periods or key in self._pending:
+            return
+        context = self.context()
+        fields = list(self._group.fields.keys())
+        resource = self._group.resource
+
+        def read(ids, exception):
+            if self._pending.get(key) is not searchCall:
+                return
+            if exception or not ids:
+                del self._pending[key]
+                if not exception:
+                    self.storePeriod(key, [])
+                return
+            self._pending[key] = Rpc.session.callAsync(
+                stored, '/object', 'execute', resource, 'read', ids,
+                fields, context, priority=priority)
+
+        def stored(values, exception):
+            self._pending.pop(key, None)
+            if not exception:
+                self.storePeriod(key, values)
+
+        searchCall = Rpc.session.callAsync(
+            read, '/object', 'execute', resource, 'search', self.domain(key),
+            0, False, False, context, priority=priority)
+        self._pending[key] = searchCall
+
+    def values(self, start, end):
+        """
+        Returns the list of values (as returned by read()) of the records
+        starting between 'start' and 'end' dates (QDate) found in the cache.
+        Periods not in the cache are fetched without waiting for them
+        ('loaded' is emitted when they arrive) and those next to the range
+        are prefetched.
+        """
+        self.ensureKey()
+        keys = self.periodKeys(start, end)
+        self._requested = keys
+        values = []
+        for key in keys:
+            if key not in self._periods:
+                self.fetchPeriod(key)
+                continue
+            self._periods.move_to_end(key)
+            values.extend(self._periods[key])
+        if self.prefetch and keys:
+            self.prefetchPeriod(self.adjacentKey(keys[-1], 1))
+            self.prefetchPeriod(self.adjacentKey(keys[0], -1))
+        return values
+
+    def rowsByDay(self, start, end):
+        """
+        Returns a dictionary with the rows in the group of the records
+        starting each day between 'start' and 'end' (QDate). Keys are the
+        dates in storage format ('yyyy-MM-dd').
+
+        Records are grouped in a single pass. The value of loaded records is
+        used instead of the fetched one as it may have been modified.
+        """
+        values = self.values(start, end)
+        ids = set([x['id'] for x in values])
+        # Changes of the group made here must not discard the cache
+        self._updatingGroup = True
+        try:
+            self._group.discardRecords(list(self._merged - ids))
+            self._merged &= ids
+            self._merged.update(self._group.mergeValues(values))
+        finally:
+            self._updatingGroup = False
+        first = Calendar.dateToStorage(start)
+        last = Calendar.dateToStorage(end)
+        days = {}
+        for value in values:
+            row = self._group.indexOfId(value['id'])
+            if row < 0:
+                continue
+            date = value.get(self._field)
+            record = self._group.records[row]
+            if not isinstance(record, int) and record.isFullyLoaded():
+                date = record.value(self._field)
+            if not date:
+                continue
+            day = date[:10]
+            if first <= day <= last:
+                days.setdefault(day, []).append(row)
+        for record in self._group.newRecords():
+            date = record.value(self._field)
+            if date and first <= date[:10] <= last:
+                days.setdefault(date[:10], []).append(
+                    self._group.indexOfRecord(record))
+        return days
+
+
 class GraphicsTaskItem(QGraphicsRectItem):
     # Parent should be a GraphicsDayItem
     def __init__(self, parent=None):
@@ -146,18 +380,22 @@ class GraphicsDayItem(QGraphicsItemGroup):
         return self._date
 
     def addModelIndex(self, index):
-        if index in list(self._tasks.keys()):
-            return
-        task = GraphicsTaskItem(self)
-        task.setZValue(1)
-        task.setIndex(index)
-        self.addToGroup(task)
-        self._indexes[task] = index
-        self._tasks[index] = task
+        self.addModelIndexes([index])
+
+    def addModelIndexes(self, indexes):
+        for index in indexes:
+            if index in self._tasks:
+                continue
+            task = GraphicsTaskItem(self)
+            task.setZValue(1)
+            task.setIndex(index)
+            self.addToGroup(task)
+            self._indexes[task] = index
+            self._tasks[index] = task
         self.updateData()
 
     def removeModelIndex(self, index):
-        if not index in list(self._tasks.keys()):
+        if not index in self._tasks:
             return
         task = self._tasks[index]
         self.removeFromGroup(task)
@@ -166,6 +404,10 @@ class GraphicsDayItem(QGraphicsItemGroup):
         self.updateData()
 
     def clear(self):
+        for task in list(self._indexes.keys()):
+            self.removeFromGroup(task)
+            if task.scene():
+                task.scene().removeItem(task)
         self._indexes = {}
         self._tasks = {}
 
@@ -237,6 +479,8 @@ class GraphicsCalendarItem(QGraphicsItemGroup):
         self._modelDurationColumn = 0
         self._modelColorColumn = -1
         self._hasDurationColumn = False
+        self._dataSource = CalendarDataSource()
+        self._dataSource.loaded.connect(self.updateCalendarData)
 
     def setSize(self, size):
         self._size = size
@@ -259,6 +503,11 @@ class GraphicsCalendarItem(QGraphicsItemGroup):
     def endDate(self):
         return self._endDate
 
+    def setDateRange(self, start, end):
+        self._startDate = start
+        self._endDate = end
+        self.updateCalendarView()
+
     def daysCount(self):
         count = self._startDate.daysTo(self._endDate) + 1
         if count < 0:
@@ -275,8 +524,8 @@ class GraphicsCalendarItem(QGraphicsItemGroup):
         rows = math.ceil((offset + self.daysCount()) / 7.0)
         if rows == 1:
             offset = 0
-        dayWidth = self._size.width() / min(daysPerRow, self.daysCount())
-        dayHeight = self._size.height() / rows
+        dayWidth = self._size.width() // min(daysPerRow, self.daysCount())
+        dayHeight = int(self._size.height() // rows)
         date = self._startDate
         for x in range(self._startDate.daysTo(self._endDate) + 1):
             item = GraphicsDayItem(self)
@@ -284,7 +533,7 @@ class GraphicsCalendarItem(QGraphicsItemGroup):
             item.setPos((x + offset) % 7 * dayWidth,
                         dayHeight * ((x + offset) // 7))
             item.setSize(QSize(dayWidth, dayHeight))
-            self._days[str(Calendar.dateToText(date))] = item
+            self._days[Calendar.dateToStorage(date)] = item
             date = date.addDays(1)
         self.updateCalendarData()
 
@@ -309,47 +558,30 @@ class GraphicsCalendarItem(QGraphicsItemGroup):
         for x in list(self._days.values()):
             x.clear()
 
-        #
-        # Filter the records, so only those in the current* month/week/day
-        #   are processed (just the ones that will be shown).
-        #
-        # (*) We use a hack, to get events that span from the previous
-        #   month, so we really are processing one month more than the
-        #   days shown :(
-        #
-        startField = self._model.field(self._modelDateColumn)
-        durationField = self._model.field(self._modelDurationColumn)
-        if startField == durationField:
-            startDate = Calendar.dateToStorage(self.startDate())
+        group = self._model.group
+        self._dataSource.setGroup(
+            group, self._model.field(self._modelDateColumn))
+        if self._dataSource.isAvailable():
+            # Only the records of the months shown are searched and read.
+            rows = self._dataSource.rowsByDay(self.startDate(),
+                                              self.endDate())
         else:
-            # TODO: Based on web client hack to get spanded events.
-            #	A better solution should be used someday...
-            startDate = Calendar.dateToStorage(self.startDate().addMonths(-1))
-        endDate = Calendar.dateToStorage(self.endDate())
-
-        oldFilter = self._model.group.filter() or []
-        newFilter = []
-        # Ignore any (start_field, ..., ...) item from the filter.
-        for x in oldFilter:
-            if x[0] != startField:
-                newFilter.append(x)
-        # Add the start field restrictions to the new filter
-        newFilter.extend([
-            (startField, '>=', startDate),
-            (startField, '<=', endDate),
-        ])
-        self._model.group.setFilter(newFilter)
-
-        # Get the data
-        for x in range(self._model.rowCount()):
-            idx = self._model.index(x, self._modelDateColumn)
-            date = Calendar.dateToText(self.dateTimeFromIndex(idx).date())
-            if date in self._days:
-                idx = self._model.index(x, self._modelTitleColumn)
-                self._days[date].addModelIndex(idx)
-
-        # Restore the old filter
-        self._model.group.setFilter(oldFilter)
+            # The group isn't the result of a search (it's a one2many
+            # field, for example) so we use the records it already has.
+            rows = {}
+            for x in range(self._model.rowCount()):
+                idx = self._model.index(x, self._modelDateColumn)
+                date = Calendar.dateToStorage(
+                    self.dateTimeFromIndex(idx).date())
+                rows.setdefault(date, []).append(x)
+
+        for date, dayRows in rows.items():
+            if date not in self._days:
+                continue
+            self._days[date].addModelIndexes([
+                self._model.index(x, self._modelTitleColumn)
+                for x in dayRows
+            ])
 
     def dateTimeFromIndex(self, idx):
         data = self._model.data(idx)
@@ -469,7 +701,6 @@ class GraphicsCalendarScene(QGraphicsScene):
         self._calendar.setModelColorColumn(column)
 
     def updateData(self):
-        self._calendar.updateCalendarData()
         self._calendar.updateCalendarView()
 
     def setStartDate(self, date):
@@ -478,6 +709,9 @@ class GraphicsCalendarScene(QGraphicsScene):
     def setEndDate(self, date):
         self._calendar.setEndDate(date)
 
+    def setDateRange(self, start, end):
+        self._calendar.setDateRange(start, end)
+
 
 class GraphicsCalendarView(QGraphicsView):
     def __init__(self, parent=None):
@@ -515,6 +749,9 @@ class GraphicsCalendarView(QGraphicsView):
     def setEndDate(self, date):
         self.scene().setEndDate(date)
 
+    def setDateRange(self, start, end):
+        self.scene().setDateRange(start, end)
+
 
 (CalendarViewUi, CalendarViewBase) = loadUiType(
     Common.uiPath('calendarview.ui'))
@@ -567,8 +804,7 @@ class CalendarView(AbstractView, CalendarViewUi):
         else:
             start = date
             end = date
-        self.calendarView.setStartDate(start)
-        self.calendarView.setEndDate(end)
+        self.calendarView.setDateRange(start, end)
 
     def display(self, currentModel, models):
         self.calendarView.updateData()
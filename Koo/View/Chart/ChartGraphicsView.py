@@ -48,6 +48,15 @@ if not hasattr(locale, 'D_FMT'):
     locale.D_FMT = None
 
 
+# Chart operators that can be calculated by the server and the name of
+# the function used by koo module's aggregate.
+serverOperators = {
+    '+': 'sum',
+    'min': 'min',
+    'max': 'max',
+}
+
+
 class ChartGraphicsView(QGraphicsView):
     def __init__(self, parent=None):
         QGraphicsView.__init__(self, parent)
@@ -56,6 +65,8 @@ class ChartGraphicsView(QGraphicsView):
         self.scene = QGraphicsScene(self)
         self.setScene(self.scene)
         self.chart = None
+        self._groups = []
+        self._serverAggregates = True
 
     def setModel(self, model):
         self._model = model
@@ -95,6 +106,149 @@ class ChartGraphicsView(QGraphicsView):
                 newList.append(str(x))
         return newList
 
+    def converters(self):
+        """
+        Returns a dictionary with a function for each field of the chart
+        that converts its values into what's shown in the chart.
+
+        Lookups are prepared once for all records, and dates (which
+        usually repeat a lot) are converted only once per distinct value.
+        :return:
+        """
+        converters = {}
+        for x in list(self._axisData.keys()):
+            type = self._fields[x]['type']
+            if type in ('many2one', 'char', 'time', 'text'):
+                converters[x] = lambda value: value
+            elif type == 'selection':
+                labels = {}
+                for y in self._fields[x]['selection']:
+                    labels.setdefault(y[0], str(y[1]))
+                converters[x] = lambda value, labels=labels: labels.get(value, '')
+            elif type == 'date':
+                converters[x] = self.dateConverter()
+            elif type == 'datetime':
+                converters[x] = self.dateTimeConverter()
+            else:
+                converters[x] = lambda value: float(value or 0.0)
+        return converters
+
+    def dateConverter(self):
+        format = locale.nl_langinfo(locale.D_FMT).replace('%y', '%Y')
+        converted = {}
+
+        def convert(value):
+            if not value:
+                return ''
+            if value not in converted:
+                date = time.strptime(value, DT_FORMAT)
+                converted[value] = time.strftime(format, date)
+            return converted[value]
+        return convert
+
+    def dateTimeConverter(self):
+        format = locale.nl_langinfo(locale.D_FMT).replace('%y', '%Y') + ' %H:%M:%S'
+        lzone = None
+        szone = None
+        if 'tz' in Rpc.session.context:
+            try:
+                import pytz
+                lzone = pytz.timezone(Rpc.session.context['tz'])
+                szone = pytz.timezone(Rpc.session.timezone)
+            except:
+                lzone = None
+        converted = {}
+
+        def convert(value):
+            if not value:
+                return ''
+            if value in converted:
+                return converted[value]
+            date = time.strptime(value, DHM_FORMAT)
+            if lzone:
+                try:
+                    dt = datetime.datetime(
+                        date[0], date[1], date[2], date[3], date[4], date[5], date[6])
+                    sdt = szone.localize(dt, is_dst=True)
+                    ldt = sdt.astimezone(lzone)
+                    date = ldt.timetuple()
+                except:
+                    pass
+            converted[value] = time.strftime(format, date)
+            return converted[value]
+        return convert
+
+    def clientRecords(self, models):
+        """
+        Returns the values of all the given records converted for the chart.
+        :param models:
+        :return:
+        """
+        converters = list(self.converters().items())
+        records = []
+        for m in models:
+            res = {}
+            for x, convert in converters:
+                res[x] = convert(m.value(x))
+            records.append(res)
+        return records
+
+    def serverRecords(self, models):
+        """
+        Returns the values of the records of the group 'models' aggregated
+        by the server by category and group, so records don't need to be
+        loaded, or None if the server can't aggregate them.
+
+        Values of modified and new records are not aggregated by the server
+        but added to the list as they're on the client.
+        :param models:
+        :return:
+        """
+        if not self._serverAggregates:
+            return None
+        if not hasattr(models, 'aggregatesQuery'):
+            return None
+        aggregates = {}
+        for field in self._axis[1:]:
+            function = serverOperators.get(
+                self._axisData[field].get('operator', '+'))
+            if not function or self._fields[field]['type'] not in ('integer', 'float'):
+                return None
+            aggregates[field] = function
+        groupby = []
+        for field in self._axis[:1] + self._groups:
+            if field not in groupby:
+                groupby.append(field)
+        for field in list(aggregates.keys()) + groupby:
+            if not self._fields[field].get('stored', True):
+                return None
+        query = models.aggregatesQuery()
+        if query is None:
+            return None
+        domain, local = query
+        try:
+            result = Rpc.session.call('/koo', 'aggregate', models.resource,
+                                      domain, aggregates, models.context(), groupby)
+        except Rpc.RpcException as exception:
+            # If the server doesn't have an up to date version of koo module
+            # don't try again. Other errors only affect this query so records
+            # are used this time only.
+            if (isinstance(exception, Rpc.RpcServerException) and
+                    exception.isUnsupported('aggregate')):
+                self._serverAggregates = False
+            return None
+        converters = self.converters()
+        records = []
+        for group, values in result:
+            res = {}
+            for x, value in zip(groupby, group):
+                res[x] = converters[x](value)
+            for x in aggregates:
+                res[x] = float(values.get(x) or 0.0)
+            records.append(res)
+        records += self.clientRecords(local)
+        return records
+
     def display(self, models):
         self._models = models
         if not self.chart:
@@ -107,60 +261,22 @@ class ChartGraphicsView(QGraphicsView):
             self.chart.setSize(self.size())
             self.scene.addItem(self.chart)
 
-        # Put all values to be shown in the records list
-        records = []
+        # Put all values to be shown in the records list.
+        # records will be a list of dictionaries:
+        # records = [
+        #	{ 'field1': value, 'field2': value }, #record 1
+        #	{ 'field1': value, 'field2': value }  #record 2
+        #	...
+        # }
+        # When the server aggregates the records, each dictionary contains
+        # the values of a set of records with the same category and group.
 
         # Models could be None
+        records = []
         if models:
-            # Fill in records with data from all models for all necessary fields.
-            # records will be a list of dictionaries:
-            # records = [
-            #	{ 'field1': value, 'field2': value }, #record 1
-            #	{ 'field1': value, 'field2': value }  #record 2
-            #	...
-            # }
-            for m in models:
-                res = {}
-                for x in list(self._axisData.keys()):
-                    type = self._fields[x]['type']
-                    if type in ('many2one', 'char', 'time', 'text'):
-                        res[x] = m.value(x)
-                    elif type == 'selection':
-                        res[x] = ''
-                        for y in self._fields[x]['selection']:
-                            if y[0] == m.value(x):
-                                res[x] = str(y[1])
-                                break
-                    elif type == 'date':
-                        if m.value(x):
-                            date = time.strptime(m.value(x), DT_FORMAT)
-                            res[x] = time.strftime(locale.nl_langinfo(
-                                locale.D_FMT).replace('%y', '%Y'), date)
-                        else:
-                            res[x] = ''
-                    elif type == 'datetime':
-                        if m.value(x):
-                            date = time.strptime(m.value(x), DHM_FORMAT)
-                            if 'tz' in Rpc.session.context:
-                                try:
-                                    import pytz
-                                    lzone = pytz.timezone(
-                                        Rpc.session.context['tz'])
-                                    szone = pytz.timezone(Rpc.session.timezone)
-                                    dt = datetime.datetime(
-                                        date[0], date[1], date[2], date[3], date[4], date[5], date[6])
-                                    sdt = szone.localize(dt, is_dst=True)
-                                    ldt = sdt.astimezone(lzone)
-                                    date = ldt.timetuple()
-                                except:
-                                    pass
-                            res[x] = time.strftime(locale.nl_langinfo(
-                                locale.D_FMT).replace('%y', '%Y') + ' %H:%M:%S', date)
-                        else:
-                            res[x] = ''
-                    else:
-                        res[x] = float(m.value(x) or 0.0)
-                records.append(res)
+            records = self.serverRecords(models)
+            if records is None:
+                records = self.clientRecords(models)
 
         # Calculate the rest of values
         operators = {
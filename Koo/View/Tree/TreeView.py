@@ -172,6 +172,16 @@ class TreeView(AbstractView):
 
         # Contains list of aggregated fields
         self.aggregates = []
+        # Group being loaded in the background to calculate aggregates and
+        # the totals of the records loaded so far.
+        self.aggregatesGroup = None
+        self.aggregatesTotals = {}
+        # Aggregates computed by the server for the domain given by
+        # RecordGroup.aggregatesQuery(), see serverAggregates().
+        self.serverAggregatesKey = None
+        self.serverAggregatesValues = None
+        self.serverAggregatesCall = None
+        self.serverAggregatesAvailable = True
         self.aggregatesContainer = QWidget(self)
         self.aggregatesLayout = QHBoxLayout(self.aggregatesContainer)
         self.aggregatesLayout.setContentsMargins(0, 0, 0, 0)
@@ -215,6 +225,7 @@ class TreeView(AbstractView):
         self.widget.selectionModel().currentChanged[QModelIndex, QModelIndex].connect(self.perform_currentChanged)
         self.treeModel.rowsInserted[QModelIndex, int, int].connect(self.updateAggregates)
         self.treeModel.rowsRemoved[QModelIndex, int, int].connect(self.updateAggregates)
+        self.treeModel.modelReset.connect(self.discardServerAggregates)
         self.treeModel.modelReset.connect(self.updateAggregates)
         self.treeModel.recordGroup().sorting.connect(self.sorting)
 
@@ -261,14 +272,51 @@ class TreeView(AbstractView):
         self.aggregatesLayout.addStretch(0)
 
     # @brief Forces calculation of aggregates, even if not all records in the group have been loaded yet.
+    #
+    # Records are loaded in the background and totals are updated as each chunk arrives.
     def forceAggregatesUpdate(self, url):
-        QApplication.setOverrideCursor(Qt.WaitCursor)
-        try:
-            self.treeModel.group.ensureAllLoaded()
-            self.updateAggregates()
-        except Rpc.RpcException as e:
-            pass
-        QApplication.restoreOverrideCursor()
+        group = self.treeModel.group
+        if not group or self.aggregatesGroup:
+            return
+        self.aggregatesTotals = {}
+        for agg in self.aggregates:
+            self.aggregatesTotals[agg['name']] = 0.0
+        self.foldAggregates(group.loadedRecords())
+        self.aggregatesGroup = group
+        group.recordsLoaded.connect(self.foldAggregates)
+        group.loadProgress.connect(self.aggregatesProgress)
+        group.loadFinished.connect(self.aggregatesLoaded)
+        if not group.loadAllInBackground():
+            self.aggregatesLoaded(True)
+
+    # @brief Adds the values of the given records to the aggregates being calculated.
+    def foldAggregates(self, records):
+        for agg in self.aggregates:
+            value = self.aggregatesTotals[agg['name']]
+            for record in records:
+                value += record.value(agg['name']) or 0.0
+            self.aggregatesTotals[agg['name']] = value
+            agg['widget'].setText(
+                Numeric.floatToText(value, agg['digits'], True))
+
+    def aggregatesProgress(self, loaded, total):
+        self.uiUpdateAggregates.setText(
+            _('Calculating totals (%d%%)') % (loaded * 100 // max(total, 1)))
+
+    def aggregatesLoaded(self, completed):
+        group = self.aggregatesGroup
+        self.aggregatesGroup = None
+        if group:
+            group.recordsLoaded.disconnect(self.foldAggregates)
+            group.loadProgress.disconnect(self.aggregatesProgress)
+            group.loadFinished.disconnect(self.aggregatesLoaded)
+        self.uiUpdateAggregates.setText(_('<a href="update">Update totals</a>'))
+        self.updateAggregates()
+
+    # @brief Cancels the calculation of aggregates if the group is being loaded in the background.
+    def cancelAggregatesUpdate(self):
+        if self.aggregatesGroup:
+            self.aggregatesGroup.cancelLoading()
 
     # This signal is emited when a list item is double clicked
     # or activated, only when it's read-only.
@@ -319,6 +367,8 @@ class TreeView(AbstractView):
             self.selecting = False
 
     def display(self, currentRecord, recordGroup):
+        if self.aggregatesGroup and self.aggregatesGroup is not recordGroup:
+            self.cancelAggregatesUpdate()
         # TODO: Avoid setting the model group each time...
         self.treeModel.setRecordGroup(recordGroup)
         if self._widgetType != 'tree':
@@ -395,9 +445,21 @@ class TreeView(AbstractView):
     # will show a hyphen instead of the appropiate value, avoiding long load times for some
     # screens.
     def updateAggregates(self):
-        if self.treeModel.group and self.aggregates:
-            if self.treeModel.group.unloadedIds():
-                self.uiUpdateAggregates.show()
+        if self.aggregatesGroup:
+            # Totals are being calculated as records are loaded
+            return
+        group = self.treeModel.group
+        if group and self.aggregates:
+            if group.unloadedIds() or group.canFetchMore():
+                totals = self.serverAggregates(group)
+                if totals is not None:
+                    self.uiUpdateAggregates.hide()
+                    for agg in self.aggregates:
+                        agg['widget'].setText(Numeric.floatToText(
+                            totals[agg['name']], agg['digits'], True))
+                    return
+                self.uiUpdateAggregates.setVisible(
+                    self.serverAggregatesCall is None)
                 calculate = False
             else:
                 self.uiUpdateAggregates.hide()
@@ -418,6 +480,63 @@ class TreeView(AbstractView):
             else:
                 agg['widget'].setText('-')
 
+    # @brief Returns the totals of all the records of the group computed by the server
+    # plus the values of modified and new records, or None if they're not available (yet).
+    #
+    # If server totals for the current domain are not known, they're requested in the
+    # background and aggregates are updated when they arrive.
+    def serverAggregates(self, group):
+        if not self.serverAggregatesAvailable:
+            return None
+        query = group.aggregatesQuery()
+        if query is None:
+            return None
+        domain, records = query
+        key = (group, repr(domain))
+        if key != self.serverAggregatesKey:
+            if self.serverAggregatesCall:
+                self.serverAggregatesCall.cancel()
+            self.serverAggregatesKey = key
+            self.serverAggregatesValues = None
+            aggregates = dict((agg['name'], 'sum') for agg in self.aggregates)
+            self.serverAggregatesCall = Rpc.session.callAsync(
+                self.serverAggregatesReceived, '/koo', 'aggregate',
+                group.resource, domain, aggregates, group.context())
+            return None
+        if self.serverAggregatesValues is None:
+            return None
+        totals = {}
+        for agg in self.aggregates:
+            value = self.serverAggregatesValues.get(agg['name']) or 0.0
+            for record in records:
+                value += record.value(agg['name']) or 0.0
+            totals[agg['name']] = value
+        return totals
+
+    # @brief Discards totals received from the server so they're requested again, as
+    # records may have changed since.
+    def discardServerAggregates(self):
+        if self.serverAggregatesCall:
+            self.serverAggregatesCall.cancel()
+            self.serverAggregatesCall = None
+        self.serverAggregatesKey = None
+        self.serverAggregatesValues = None
+
+    def serverAggregatesReceived(self, result, exception):
+        self.serverAggregatesCall = None
+        if exception:
+            # Let the user load all records to calculate totals. Only stop
+            # asking the server if it doesn't have an up to date version of
+            # koo module. Otherwise the key is kept so the same totals are
+            # not requested again until records or the domain change.
+            if (isinstance(exception, Rpc.RpcServerException) and
+                    exception.isUnsupported('aggregate')):
+                self.serverAggregatesAvailable = False
+                self.serverAggregatesKey = None
+        else:
+            self.serverAggregatesValues = result or {}
+        self.updateAggregates()
+
     def startEditing(self):
         self.widget.edit(self.widget.currentIndex())
 
@@ -33,9 +33,12 @@ import base64
 import shutil
 import tempfile
 import datetime
+import traceback
+import multiprocessing
 import xml.dom.minidom
 
 import netsvc
+import tools
 from osv import osv
 from osv import fields
 from tools.translate import _
@@ -46,6 +49,102 @@ from NanScan.Recognizer import *
 from NanScan.Ocr import *
 
 from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+
+
+# Writes the given base64 data into a temporary file and returns its name.
+def writeImage(datas):
+	fp, image = tempfile.mkstemp()
+	fp = os.fdopen( fp, 'wb+' )
+	try:
+		fp.write( base64.decodestring(datas) )
+	finally:
+		fp.close()
+	return image
+
+# Returns the (name, text, template box id) tuples of the boxes of the given
+# document.
+def documentBoxes(doc):
+	if not doc:
+		return []
+	return [(box.name, box.text, box.templateBox and box.templateBox.id or False) for box in doc.boxes]
+
+# Recognizers and templates used by recognizeDocument() in each process of
+# the pool. They're set by initWorker() when the process starts instead of
+# being sent with each document.
+workerRecognizers = None
+workerTemplates = None
+workerRecognizer = None
+
+def initWorker(recognizers, templates):
+	"""
+	Initializer of the processes of TemplateSet.processPool().
+	"""
+	global workerRecognizers, workerTemplates, workerRecognizer
+	workerRecognizers = recognizers
+	workerTemplates = templates
+	workerRecognizer = Recognizer()
+
+def recognizeDocument(item):
+	"""
+	Runs in the processes of TemplateSet.processPool(). Receives a (id, datas)
+	tuple and returns the (id, template_id, boxes) tuple of the best template
+	found for the document.
+	"""
+	id, datas = item
+	image = writeImage( datas )
+	try:
+		workerRecognizer.recognize( QImage( image ), workerRecognizers )
+	finally:
+		os.unlink( image )
+	result = workerRecognizer.findMatchingTemplateByOffset( workerTemplates )
+	template = result['template']
+	return (id, template and template.id or False, documentBoxes(result['document']))
+
+class TemplateSet(object):
+	"""
+	Keeps the templates of a database with the recognizers they use, so they're
+	not loaded again for each document, and the pool of processes that
+	recognizes documents with them.
+
+	The number of processes can be set with the 'auto_attach_workers'
+	configuration option and defaults to the number of CPUs.
+	"""
+	workers = int(tools.config.get('auto_attach_workers', multiprocessing.cpu_count()))
+	# Maximum number of seconds spent recognizing each document
+	timeout = 300
+	sets = {}
+
+	def __init__(self, key, templates):
+		self.key = key
+		self.templates = templates
+		self.withAnalysis = [x for x in templates if x.analysisFunction]
+		self.withoutAnalysis = [x for x in templates if not x.analysisFunction]
+
+		# Search what recognizers are used so we do not execute unnecessary processes.
+		recognizers = set()
+		for template in templates:
+			for box in template.boxes:
+				recognizers.add( box.recognizer )
+		self.recognizers = list(recognizers)
+		self.pool = None
+
+	def processPool(self):
+		if not self.pool:
+			# The server runs several threads so processes are not forked
+			# from it, as they could inherit locks held by other threads.
+			if 'forkserver' in multiprocessing.get_all_start_methods():
+				context = multiprocessing.get_context('forkserver')
+			else:
+				context = multiprocessing.get_context('spawn')
+			self.pool = context.Pool( max(1, TemplateSet.workers), initWorker,
+				(self.recognizers, self.withoutAnalysis) )
+		return self.pool
+
+	def close(self):
+		if self.pool:
+			self.pool.terminate()
+			self.pool = None
 
 
 class nan_template(osv.osv):
@@ -105,6 +204,24 @@ class nan_template(osv.osv):
 			templates.append( self.getTemplateFromData( cr, uid, x, context ) )
 		return templates
 
+	# Returns the TemplateSet of all templates. It's only loaded again if
+	# templates or their boxes have changed since the last call.
+	def getTemplateSet(self, cr, uid, context=None):
+		cr.execute("""
+			SELECT
+				(SELECT COUNT(*) || ',' || COALESCE(MAX(COALESCE(write_date, create_date))::TEXT, '') FROM nan_template),
+				(SELECT COUNT(*) || ',' || COALESCE(MAX(COALESCE(write_date, create_date))::TEXT, '') FROM nan_template_box)
+			""")
+		key = tuple( cr.fetchone() )
+		current = TemplateSet.sets.get( cr.dbname )
+		if current and current.key == key:
+			return current
+		if current:
+			current.close()
+		current = TemplateSet( key, self.getAllTemplates( cr, uid, context ) )
+		TemplateSet.sets[cr.dbname] = current
+		return current
+
 
 nan_template()
 
@@ -131,6 +248,8 @@ nan_template_box()
 
 class nan_document(osv.osv):
 	_name = 'nan.document'
+	# Number of documents analyzed in each transaction by analyze_documents_queue()
+	batchSize = 50
 	state_only_read = {
 		'pending': [ ( 'readonly', False ), ],
 		'analyzed': [ ( 'readonly', False ), ],
@@ -159,7 +278,8 @@ class nan_document(osv.osv):
 		'task' : fields.text('Task', readonly=True),
 		'state': fields.selection( [
 			('pending','Pending'),('analyzing','Analyzing'),('analyzed','Analyzed'),
-			('verified','Verified'),('processing','Processing'),('processed','Processed')], 
+			('verified','Verified'),('processing','Processing'),('processed','Processed'),
+			('error','Analysis Failed')],
 			'State', required=True, readonly=True )
 	}
 	_defaults = {
@@ -263,28 +383,91 @@ class nan_document(osv.osv):
 		return ret
 
 	def analyze_document_background(self, cr, uid, imageIds, context=None):
-		# Use ir.cron to execute job in the background. We do not use threading
-		# because in case of the server crashing while the process is being executed
-		# it would not be recovered.
+		# Documents in 'analyzing' state are analyzed in batches by the
+		# 'Analyze documents' scheduler action (see analyze_documents_queue()).
+		# We do not use threading because in case of the server crashing
+		# while the process is being executed it would not be recovered.
 		#
-		# Also, we need to set nextcall in some time in the future, otherwise it's
-		# executed within this transaction, meaning trg_validate() can not work correctly
-		# because current state has not yet changed to 'analyzing'.
+		# Here we only ensure the action is executed in a few seconds. We need
+		# to set nextcall in some time in the future, otherwise documents
+		# could be read before current state has changed to 'analyzing'.
 		nextcall = datetime.datetime.now() + datetime.timedelta(seconds=5)
-		self.pool.get('ir.cron').create(cr, uid, {
-			'name': 'Analyze document',
-			'user_id': uid,
-			'model': 'nan.document',
-			'function': 'analyze_document_analyzing_to_analyzed',
-			'args': repr([ imageIds, True ]),
-			'nextcall': nextcall.strftime('%Y-%m-%d %H:%M:%S'),
-		}, context)
+		ids = self.pool.get('ir.model.data').search(cr, uid, [
+			('module','=','auto_attach'),
+			('name','=','cron_analyze_documents'),
+		], context=context)
+		if not ids:
+			return
+		cronId = self.pool.get('ir.model.data').read(cr, uid, ids, ['res_id'], context)[0]['res_id']
+		# Don't wait for the row if the action is being executed: the documents
+		# will be found by the running batch or the next execution.
+		cr.execute("SAVEPOINT auto_attach_nextcall")
+		try:
+			cr.execute("SELECT id FROM ir_cron WHERE id=%s FOR UPDATE NOWAIT", (cronId,) )
+		except Exception:
+			cr.execute("ROLLBACK TO SAVEPOINT auto_attach_nextcall")
+			return
+		cr.execute("UPDATE ir_cron SET nextcall=%s WHERE id=%s AND nextcall > %s", (nextcall.strftime('%Y-%m-%d %H:%M:%S'), cronId, nextcall.strftime('%Y-%m-%d %H:%M:%S')) )
+		cr.execute("RELEASE SAVEPOINT auto_attach_nextcall")
+
+	# Analyzes again documents whose analysis failed
+	def retry_analysis(self, cr, uid, ids, context=None):
+		ids = self.search(cr, uid, [('id','in',ids),('state','=','error')], context=context)
+		if ids:
+			self.write(cr, uid, ids, {
+				'state': 'analyzing',
+				'task': False,
+			}, context)
+			self.analyze_document_background(cr, uid, ids, context)
+		return True
 
 	def analyze_document_analyzing_to_analyzed(self, cr, uid, imageIds, context=None):
 		workflow = netsvc.LocalService('workflow')
 		for id in imageIds:
 			workflow.trg_validate(uid, 'nan.document', id, 'analyzing_to_analyzed', cr)
 
+	def analyze_documents_queue(self, cr, uid, context=None):
+		"""
+		Analyzes all documents in 'analyzing' state, batchSize documents at a
+		time. Each batch is committed before starting the next one so if the
+		server crashes, only the documents of the current batch need to be
+		analyzed again the next time the scheduler executes the action.
+
+		If a batch fails its documents are analyzed one by one and those that
+		fail are set to 'error' state, with the error in 'task', so they don't
+		block the queue.
+		"""
+		lastId = 0
+		while True:
+			ids = self.search(cr, uid, [
+				('state','=','analyzing'),
+				('id','>',lastId),
+			], limit=self.batchSize, order='id', context=context)
+			if not ids:
+				break
+			lastId = ids[-1]
+			try:
+				analyzed = self.analyze_document(cr, uid, ids, context)
+				# Documents are already analyzed so this only updates their workflow
+				self.analyze_document_analyzing_to_analyzed(cr, uid, analyzed, context)
+				cr.commit()
+				continue
+			except Exception:
+				cr.rollback()
+
+			for id in ids:
+				try:
+					analyzed = self.analyze_document(cr, uid, [id], context)
+					self.analyze_document_analyzing_to_analyzed(cr, uid, analyzed, context)
+				except Exception:
+					cr.rollback()
+					self.write(cr, uid, [id], {
+						'state': 'error',
+						'task': traceback.format_exc(),
+					}, context)
+				cr.commit()
+		return True
+
 	def analyze_documents_batch(self, cr, uid, imageIds, context=None):
 		self.analyze_document(cr, uid, imageIds, context=context)
 		self.pool.get('res.request').create( cr, uid, {
@@ -294,73 +477,98 @@ class nan_document(osv.osv):
 			'body': 'The auto_attach system has finished analyzing the documents you requested. You can now go to the Analyzed Documents queue to verify and process them.',
 		}, context)
 
-	def analyze_document(self, cr, uid, imageIds, context=None):
-		# Load templates into 'templates' list
-		templates = self.pool.get('nan.template').getAllTemplates( cr, uid, context )
-
-		templatesWithAnalysis = [x for x in templates if x.analysisFunction]
-		templatesWithoutAnalysis = [x for x in templates if not x.analysisFunction]
-
-		# Search what recognizers are used so we do not execute unnecessary processes.
-		recognizers = set()
-		for template in templates:
-			for box in template.boxes:
-				recognizers.add( box.recognizer )
-		recognizers = list(recognizers)
-
+	# Analyzes the given documents using templates with an analysis function.
+	# Returns a list with an (id, template_id, boxes) item for each document.
+	def _analyzeWithFunctions(self, cr, uid, documents, templateSet, context):
 		recognizer = Recognizer()
-
-		# Iterate over all images and try to find the most similar template
-		for document in self.browse(cr, uid, imageIds, context):
-			if document.state not in ('pending','analyzing'):
-				continue
-			if not document.datas:
-				continue
-			fp, image = tempfile.mkstemp()
-			fp = os.fdopen( fp, 'wb+' )
+		results = []
+		for document in documents:
+			image = writeImage( document.datas )
 			try:
-				fp.write( base64.decodestring(document.datas) )
+				recognizer.recognize( QImage( image ), templateSet.recognizers )
 			finally:
-				fp.close()
-			recognizer.recognize( QImage( image ), recognizers )
-			
+				os.unlink( image )
+
 			template = False
 			doc = False
-			for template in templatesWithAnalysis:
+			for template in templateSet.withAnalysis:
 				function = re.sub( ' *', '', template.analysisFunction )
 				if function.endswith('()'):
 					function = function[:-2]
-				doc = eval( 'self.%s(cr, uid, document, template, recognizer, context)' % function )
+				doc = getattr(self, function)(cr, uid, document, template, recognizer, context)
 				if doc:
 					break
 
 			if not doc:
-				result = recognizer.findMatchingTemplateByOffset( templatesWithoutAnalysis )
+				result = recognizer.findMatchingTemplateByOffset( templateSet.withoutAnalysis )
 				template = result['template']
 				doc = result['document']
+			results.append( (document.id, template and template.id or False, documentBoxes(doc)) )
+		return results
 
-			if not template:
-				print("No template found for document %s." % document.name)
+	# Analyzes the given documents and returns the ids of those analyzed.
+	# Documents whose recognition takes more than TemplateSet.timeout seconds
+	# are set to 'error' state.
+	def analyze_document(self, cr, uid, imageIds, context=None):
+		documents = [x for x in self.browse(cr, uid, imageIds, context) if x.state in ('pending','analyzing')]
+		if not documents:
+			return []
+
+		templateSet = self.pool.get('nan.template').getTemplateSet( cr, uid, context )
+
+		# Recognition is run in a pool of processes unless there are
+		# templates with analysis functions, which need the recognizer and
+		# the cursor in this process.
+		withData = [x for x in documents if x.datas]
+		if templateSet.withAnalysis or len(withData) < 2:
+			results = self._analyzeWithFunctions( cr, uid, withData, templateSet, context )
+		else:
+			pool = templateSet.processPool()
+			pending = [(x.id, pool.apply_async( recognizeDocument, ((x.id, x.datas),) )) for x in withData]
+			results = []
+			failed = []
+			for id, result in pending:
+				try:
+					results.append( result.get( TemplateSet.timeout ) )
+				except multiprocessing.TimeoutError:
+					failed.append( id )
+			if failed:
+				# A process may be stuck or have died (the pool would wait
+				# forever for its result) so start new ones for the next
+				# documents.
+				templateSet.close()
+				self.write(cr, uid, failed, {
+					'state': 'error',
+					'task': _('Recognition took more than %d seconds.') % TemplateSet.timeout,
+				}, context)
+				documents = [x for x in documents if x.id not in failed]
+				withData = [x for x in withData if x.id not in failed]
+
+		names = dict([(x.id, x.name) for x in documents])
+		templateNames = dict([(x.id, x.name) for x in templateSet.templates])
+		properties = []
+		for id, templateId, boxes in results:
+			if not templateId:
+				print("No template found for document %s." % names[id])
 			else:
-				print("The best template found for document %s is %s." % (document.name, template.name))
+				print("The best template found for document %s is %s." % (names[id], templateNames.get(templateId)))
 
-			if template:
-				template_id = template.id
-			else:
-				template_id = False
-			self.write(cr, uid, [document.id], {
-				'template_id': template_id, 
+			self.write(cr, uid, [id], {
+				'template_id': templateId,
 				'state': 'analyzed'
 			}, context=context)
-			if doc:
-				for box in doc.boxes:
-					self.pool.get('nan.document.property').create(cr, uid, { 
-						'name': box.name, 
-						'value': box.text, 
-						'document_id': document.id,
-						'template_box_id': box.templateBox and box.templateBox.id or False
-					}, context)
-
+			for name, text, templateBoxId in boxes:
+				properties += [name, text, id, templateBoxId or None, uid]
+
+		# Create all properties with a single query
+		if properties:
+			cr.execute("""
+				INSERT INTO
+					nan_document_property (name, value, document_id, template_box_id, create_uid, create_date)
+				VALUES
+				""" + ','.join( ['(%s,%s,%s,%s,%s,now())'] * (len(properties) // 5) ), properties )
+
+		for document in withData:
 			if document.state == 'analyzing':
 				self.pool.get('res.request').create( cr, uid, {
 					'act_from': uid,
@@ -370,8 +578,10 @@ class nan_document(osv.osv):
 					'ref_doc1': 'nan.document,%d' % document.id,
 				}, context)
 
-		self.executeAttachs( cr, uid, imageIds, context )
-		self.executeActions( cr, uid, imageIds, True, context )
+		ids = [x.id for x in documents]
+		self.executeAttachs( cr, uid, ids, context )
+		self.executeActions( cr, uid, ids, True, context )
+		return ids
 
 	def analyzeDocumentWithTemplate(self, cr, uid, documentId, templateId, context):
 
@@ -41,6 +41,12 @@ class wizard_start(osv.osv_memory):
 			
 	_columns = {
 		'configuration': fields.selection(_get_configs, 'Configuration', method=True, required=True, help="Choose a PostgreSQL TS configuration"),
+		'index_type': fields.selection([('gin','GIN'),('gist','GiST')], 'Index Type', required=True, help="GIN indexes are faster to search but slower to update than GiST ones."),
+		'deferred': fields.boolean('Deferred Indexing', help="If checked, modified records are only queued and indexed periodically, so that creating or modifying lots of records isn't slowed down by the index. Note that searches won't find the latest changes until the queue is processed."),
+	}
+	_defaults = {
+		'index_type': lambda *a: 'gin',
+		'deferred': lambda *a: False,
 	}
 
 	def start(self, cr, uid, ids, context={}):
@@ -53,10 +59,11 @@ class wizard_start(osv.osv_memory):
 			print("It seems that TSearch2 is NOT installed")
 			return {}
 
-		# Check PL/PythonU
-		cr.execute("SELECT * FROM pg_catalog.pg_language WHERE lanname='plpythonu'")
-		if cr.rowcount == 0:
-			cr.execute("CREATE LANGUAGE plpythonu;")
+		# Check PL/PythonU and PL/pgSQL
+		for language in ('plpythonu', 'plpgsql'):
+			cr.execute("SELECT * FROM pg_catalog.pg_language WHERE lanname=%s", (language,))
+			if cr.rowcount == 0:
+				cr.execute("CREATE LANGUAGE %s;" % language)
 
 		# Set default FTS configuration
 		cr.execute( "SELECT cfgname FROM pg_catalog.pg_ts_config WHERE cfgname='default'" )
@@ -66,10 +73,13 @@ class wizard_start(osv.osv_memory):
 		wizard = self.browse(cr, uid, ids, context)[0]
 		cr.execute( 'CREATE TEXT SEARCH CONFIGURATION "default" (COPY=%s)' % wizard['configuration'] )
 
-		self.recreate_core(cr)
-		self.create_indexes(cr)
 		cr.execute("DELETE FROM fts_current_full_text_index")
 		cr.execute("INSERT INTO fts_current_full_text_index SELECT * FROM fts_full_text_index")
+		self.recreate_core(cr)
+		self.create_indexes(cr, wizard['deferred'])
+		# Creating the index once all records have been added is much faster
+		# than updating it for each of them.
+		cr.execute("CREATE INDEX fts_full_text_search_idx ON fts_full_text_search USING %s (message)" % (wizard['index_type'] == 'gist' and 'GIST' or 'GIN'))
 		return {}
 
 	def recreate_core(self,cr):
@@ -84,7 +94,30 @@ class wizard_start(osv.osv_memory):
 				FOREIGN KEY ( model ) REFERENCES ir_model ( id ) ON UPDATE CASCADE ON DELETE CASCADE
 			) WITHOUT OIDS
 			""")
-		cr.execute("CREATE INDEX fts_full_text_search_idx ON fts_full_text_search USING GIST (message)")
+		# Records modified while deferred indexing is used are queued here
+		# until process_queue() indexes them.
+		cr.execute("DROP TABLE IF EXISTS fts_full_text_queue")
+		cr.execute("""
+			CREATE TABLE fts_full_text_queue (
+				model INT8 NOT NULL,
+				reference INT8 NOT NULL
+			) WITHOUT OIDS
+			""")
+		cr.execute("CREATE INDEX fts_full_text_queue_idx ON fts_full_text_queue (model)")
+		cr.execute("DROP FUNCTION IF EXISTS fts_full_text_queue_trigger() CASCADE")
+		cr.execute("""
+			CREATE FUNCTION fts_full_text_queue_trigger() RETURNS trigger AS
+			$$
+			BEGIN
+				IF TG_OP = 'DELETE' THEN
+					DELETE FROM fts_full_text_search WHERE model = TG_ARGV[0]::INT8 AND reference = OLD.id;
+				ELSE
+					INSERT INTO fts_full_text_queue (model, reference) VALUES (TG_ARGV[0]::INT8, NEW.id);
+				END IF;
+				RETURN NULL;
+			END;
+			$$ LANGUAGE plpgsql;
+			""")
 		cr.execute("DROP FUNCTION IF EXISTS fts_full_text_search_trigger() CASCADE")
 		cr.execute("""
 			CREATE FUNCTION fts_full_text_search_trigger() RETURNS trigger AS
@@ -119,55 +152,94 @@ class wizard_start(osv.osv_memory):
 			$$ LANGUAGE plpythonu;
 			""")
 
-	def create_indexes(self, cr):
-		cr.execute("SELECT DISTINCT model_id FROM fts_full_text_index i, ir_model_fields f WHERE i.field_id=f.id");
+	def create_indexes(self, cr, deferred=False):
+		cr.execute("SELECT DISTINCT model_id FROM fts_current_full_text_index i, ir_model_fields f WHERE i.field_id=f.id");
 		for j in [x[0] for x in cr.fetchall()]:
-			self.create_index(cr, j)
-
-	def create_index(sself, cr, model_id):
-		cr.execute("SELECT model FROM ir_model WHERE id=%s", (model_id,) )
-		tuple=cr.fetchone()
-		model_name=tuple[0]
-
-		pool = pooler.get_pool(cr.dbname)
-		table_name = pool.get(model_name)._table
-
-		cr.execute("SELECT f.name, p.name FROM fts_full_text_index i, fts_priority p, ir_model_fields f WHERE i.field_id=f.id AND i.priority=p.id AND f.model_id=%s", (model_id,) )
+			self.create_index(cr, j, deferred)
+
+	# Returns the SQL expression that computes the tsvector of a record of the
+	# given model (fields of the table are expected to be prefixed with
+	# 'tbl.') and the list of 'field|weight' items expected by
+	# fts_full_text_search_trigger.
+	def index_expression(self, cr, model_id):
+		cr.execute("SELECT f.name, p.name FROM fts_current_full_text_index i, fts_priority p, ir_model_fields f WHERE i.field_id=f.id AND i.priority=p.id AND f.model_id=%s", (model_id,) )
 		tsVector = []
 		fields = []
 		for record in cr.fetchall():
 			name = record[0]
 			weight = record[1]
-			tsVector.append( "setweight( to_tsvector('default', COALESCE(%s::TEXT,'')), '%s' )" % (name, weight) )
+			tsVector.append( "setweight( to_tsvector('default', COALESCE(tbl.%s::TEXT,'')), '%s' )" % (name, weight) )
 			fields.append( '%s|%s' % ( str(name), weight ) )
-		tsVector = ' || '.join( tsVector )
-		fields = ','.join( fields )
-
-		if tsVector != "''":
-			cr.execute("""
-				DELETE FROM 
-					fts_full_text_search 
-				WHERE 
-					model = (SELECT id FROM ir_model WHERE model=%s) 
-				""", (model_name,) )
-			cr.commit()
-			cr.execute(
-				"""
-					INSERT INTO 
-						fts_full_text_search(model,reference,message) 
-					SELECT 
-						model.id, 
-						tbl.id, 
-						%s
-					FROM 
-						\"%s\" AS tbl,
-						(SELECT id FROM ir_model WHERE model='%s') AS model
-				""" % (tsVector, table_name, model_name) )
-			cr.commit()
-			cr.execute("SELECT id FROM ir_model WHERE model=%s", (model_name,) )
-			cr.execute("DROP TRIGGER IF EXISTS \"%s_fts_full_text_search\" ON \"%s\"" % (table_name, table_name ) )
-			cr.commit()
+		return ' || '.join( tsVector ), ','.join( fields )
+
+	# Indexes the records of the given model with a single INSERT ... SELECT.
+	# If 'ids' is None all records of the model are (re)indexed. 'tsVector'
+	# can be given if the caller already has the expression returned by
+	# index_expression().
+	def index_records(self, cr, model_id, ids=None, tsVector=None):
+		cr.execute("SELECT model FROM ir_model WHERE id=%s", (model_id,) )
+		model_name = cr.fetchone()[0]
+		table_name = pooler.get_pool(cr.dbname).get(model_name)._table
+		if tsVector is None:
+			tsVector = self.index_expression(cr, model_id)[0]
+		if not tsVector:
+			return False
+
+		if ids is None:
+			cr.execute("DELETE FROM fts_full_text_search WHERE model=%s", (model_id,) )
+			where = ''
+			params = (model_id,)
+		else:
+			if not ids:
+				return True
+			cr.execute("DELETE FROM fts_full_text_search WHERE model=%s AND reference IN %s", (model_id, tuple(ids)) )
+			where = 'WHERE tbl.id IN %s'
+			params = (model_id, tuple(ids))
+		cr.execute("""
+			INSERT INTO
+				fts_full_text_search(model,reference,message)
+			SELECT
+				%%s,
+				tbl.id,
+				%s
+			FROM
+				\"%s\" AS tbl
+			%s
+			""" % (tsVector, table_name, where), params )
+		return True
+
+	def create_index(self, cr, model_id, deferred=False):
+		cr.execute("SELECT model FROM ir_model WHERE id=%s", (model_id,) )
+		model_name = cr.fetchone()[0]
+		table_name = pooler.get_pool(cr.dbname).get(model_name)._table
+
+		tsVector, fields = self.index_expression(cr, model_id)
+		if not tsVector:
+			return
+
+		self.index_records(cr, model_id, tsVector=tsVector)
+		cr.execute("DROP TRIGGER IF EXISTS \"%s_fts_full_text_search\" ON \"%s\"" % (table_name, table_name ) )
+		if deferred:
+			# Only updates of indexed fields need to queue the record again
+			columns = ','.join( ['"%s"' % x.split('|')[0] for x in fields.split(',')] )
+			cr.execute("CREATE TRIGGER \"" + table_name + "_fts_full_text_search\" AFTER INSERT OR UPDATE OF " + columns + " OR DELETE ON \"" + table_name + "\" FOR EACH ROW EXECUTE PROCEDURE fts_full_text_queue_trigger(%s)", (model_id,) )
+		else:
 			cr.execute("CREATE TRIGGER \"" + table_name + "_fts_full_text_search\" BEFORE INSERT OR UPDATE OR DELETE ON \"" + table_name + "\" FOR EACH ROW EXECUTE PROCEDURE fts_full_text_search_trigger(%s,%s)", (model_id, fields) )
+		cr.commit()
+
+	# Indexes the records queued by fts_full_text_queue_trigger (that is,
+	# when deferred indexing is used) with one query per model. Called
+	# periodically by the scheduler.
+	def process_queue(self, cr, uid, context=None):
+		cr.execute("SELECT 1 FROM pg_catalog.pg_class WHERE relname='fts_full_text_queue'")
+		if cr.rowcount == 0:
+			return True
+		cr.execute("SELECT DISTINCT model FROM fts_full_text_queue")
+		for model_id in [x[0] for x in cr.fetchall()]:
+			cr.execute("DELETE FROM fts_full_text_queue WHERE model=%s RETURNING reference", (model_id,) )
+			ids = list(set([x[0] for x in cr.fetchall()]))
+			self.index_records(cr, model_id, ids)
 			cr.commit()
+		return True
 	
 wizard_start()
@@ -124,47 +124,124 @@ class fulltextsearch_services(netsvc_service):
 				self.postgresKeyWords[ 'ts_headline' ] = 'headline'
 
 	# This method should not be exported
-	def headline( self, pool, cr, uid, text, id, model_id, model_name, context ):
-		# Get all the fields of the model that are indexed
-		cr.execute( """
-			SELECT
-				f.name
-			FROM
-				fts_current_full_text_index i,
-				ir_model_fields f
-			WHERE
-				i.field_id = f.id AND
-				f.model_id=%s
-			""", (model_id,) )
-		# We will concatenate all those fields just like the
-		# index does, so we can have the headline
-		table = pool.get(model_name)._table
-		fields = []
-		for c in cr.fetchall():
-			fields.append( c[0] )
-		textFields = "''"
-		for k in fields:
-			textFields = textFields + " || ' ' || COALESCE(" + k + "::TEXT,'')"
+	#
+	# Returns a dict with the name and headline of each (model name, id) of
+	# the given rows. Headlines of the records of each model are computed
+	# with a single query.
+	def headlines( self, pool, cr, uid, tsQuery, rows, context ):
+		ids = {}
+		for x in rows:
+			ids.setdefault( (x[0], x[3]), [] ).append( x[1] )
+
+		result = {}
+		for (model_id, model_name), model_ids in list(ids.items()):
+			# Get all the fields of the model that are indexed
+			cr.execute( """
+				SELECT
+					f.name
+				FROM
+					fts_current_full_text_index i,
+					ir_model_fields f
+				WHERE
+					i.field_id = f.id AND
+					f.model_id=%s
+				""", (model_id,) )
+			# We will concatenate all those fields just like the
+			# index does, so we can have the headline
+			table = pool.get(model_name)._table
+			textFields = "''"
+			for c in cr.fetchall():
+				textFields = textFields + " || ' ' || COALESCE(" + c[0] + "::TEXT,'')"
 
-		try:
-			name = pool.get( model_name ).name_get( cr, uid, [id], context )[0][1]
-		except:
-			name = ""
+			try:
+				names = dict( pool.get( model_name ).name_get( cr, uid, model_ids, context ) )
+			except:
+				names = {}
+
+			# Names are not stored in the table so they're given as a list
+			# of (id, name) values to compute their headline in the same query.
+			values = []
+			params = []
+			for id in model_ids:
+				values.append( '(%s, %s)' )
+				params += [id, names.get(id) or '']
+
+			# tsQuery is already quoted but may contain '%' characters
+			query = tsQuery.replace('%', '%%')
+
+			# Finally, obtain the headline with the concatenation of the
+			# indexed fields
+			cr.execute( """
+				SELECT
+					t.id,
+					""" + self.postgresKeyWords['ts_headline'] + """ ( 'default', """ + textFields + """, """ + query + """ ),
+					""" + self.postgresKeyWords['ts_headline'] + """ ( 'default', n.name, """ + query + """ )
+				FROM
+					\"""" + table + """\" t,
+					( VALUES """ + ', '.join(values) + """ ) AS n(id, name)
+				WHERE
+					t.id = n.id
+				""", params )
+			for record in cr.fetchall():
+				result[(model_name, record[0])] = { 'name': record[2], 'headline': record[1] }
+		return result
 
-		# Finally, obtain the headline with the concatenation of the
-		# indexed fields
-		cr.execute( """
-			SELECT
-				""" + self.postgresKeyWords['ts_headline'] + """ ( 'default', """ + textFields + """, to_tsquery('default', %s) ),
-				""" + self.postgresKeyWords['ts_headline'] + """ ( 'default', %s, to_tsquery('default', %s) ) 
+	# This method should not be exported
+	#
+	# Returns the set of (model name, id) pairs of the given rows the user has
+	# access to. Permissions are checked once per model, and 'modelAccess'
+	# keeps the result of the read access check of each model between calls.
+	def allowedRows( self, pool, cr, uid, rows, modelAccess, context ):
+		ids = {}
+		for x in rows:
+			ids.setdefault( x[3], [] ).append( x[1] )
+
+		allowed = set()
+		for model_name, model_ids in list(ids.items()):
+			# Check read permissions because 'search' is not enough and using 'read' 
+			# alone is not enough either. For example, it can allow searching
+			# menu entries restricted to that user.
+			if model_name not in modelAccess:
+				try:
+					pool.get('ir.model.access').check(cr, uid, model_name, 'read')
+					modelAccess[model_name] = True
+				except except_orm as e:
+					modelAccess[model_name] = False
+			if not modelAccess[model_name]:
+				continue
+			# Check security permissions using search
+			try:
+				model_ids = pool.get(model_name).search(cr, uid, [('id','in',model_ids)], context=context)
+			except except_orm as e:
+				continue
+			if model_name == 'ir.attachment':
+				model_ids = self.allowedAttachments( pool, cr, uid, model_ids, context )
+			for id in model_ids:
+				allowed.add( (model_name, id) )
+		return allowed
 
-			FROM 
-				\"""" + table + """\"
-			WHERE
-				id = %s
-			""", (text, name, text, id) )
-		record = cr.fetchone()
-		return { 'name': record[1], 'headline': record[0] }
+	# This method should not be exported
+	#
+	# Returns the ids of the given attachments whose related record (if any)
+	# can be accessed by the user.
+	def allowedAttachments( self, pool, cr, uid, ids, context ):
+		attachments = pool.get('ir.attachment').read(cr, uid, ids, ['res_model', 'res_id'], context)
+		parents = {}
+		for attachment in attachments:
+			if attachment['res_model'] and attachment['res_id']:
+				parents.setdefault( attachment['res_model'], set() ).add( attachment['res_id'] )
+		for res_model, res_ids in list(parents.items()):
+			try:
+				parents[res_model] = set( pool.get(res_model).search(cr, uid, [('id','in',list(res_ids))], context=context) )
+			except except_orm as e:
+				parents[res_model] = set()
+		result = []
+		for attachment in attachments:
+			if attachment['res_model'] and attachment['res_id']:
+				if attachment['res_id'] not in parents[attachment['res_model']]:
+					continue
+			result.append( attachment['id'] )
+		return result
 
 	def exp_indexedModels(self, cr, uid, context=None):
 		self.checkPostgresVersion(cr)
@@ -275,84 +352,77 @@ class fulltextsearch_services(netsvc_service):
 			filterModel = ''
 
 		# Note on limit & offset: Given that we might restrict some models due
-		# to the user not having permissions to access them we can't use PostgreSQL
-		# LIMIT & OFFSET in the query. That would be possible only if 
-		# 'ir.model.access' had a function which returned a list with all the models
-		# the user has access to.
-		#
-		# We may consider using LIMIT in the future and making multiple queries if
-		# we think it can bring a performance gain, but OFFSET specified by the user 
-		# can never be used in the query directly.
-		try:
-			cr.execute( """
-				SELECT
-					fts.model,
-					fts.reference,
-					m.name,
-					m.model,
-					%s(message, %s)*100 AS ranking
-				FROM
-					fts_full_text_search fts,
-					ir_model m
-				WHERE
-					m.id = fts.model AND
-					message @@ %s 
-					%s
-				ORDER BY
-					ranking DESC,
-					fts.model,
-					fts.reference""" % (self.postgresKeyWords['ts_rank'], tsQuery, tsQuery, filterModel) )
-		except:
-			return []
+		# to the user not having permissions to access them we can't use
+		# PostgreSQL LIMIT & OFFSET in the query directly. Instead, rows are
+		# fetched in windows which double their size each time until there
+		# are enough rows the user has access to.
+		query = """
+			SELECT
+				fts.model,
+				fts.reference,
+				m.name,
+				m.model,
+				%s(message, %s)*100 AS ranking
+			FROM
+				fts_full_text_search fts,
+				ir_model m
+			WHERE
+				m.id = fts.model AND
+				message @@ %s 
+				%s
+			ORDER BY
+				ranking DESC,
+				fts.model,
+				fts.reference
+			LIMIT %d
+			OFFSET %d"""
+
+		accepted = []
+		modelAccess = {}
+		window = max( offset + limit, 20 )
+		position = 0
+		while len(accepted) < offset + limit:
+			try:
+				cr.execute( query % (self.postgresKeyWords['ts_rank'], tsQuery, tsQuery, filterModel, window, position) )
+			except:
+				return []
+			rows = cr.fetchall()
+			allowed = self.allowedRows( pool, cr, uid, rows, modelAccess, context )
+			for x in rows:
+				if (x[3], x[1]) in allowed:
+					accepted.append( x )
+			if len(rows) < window:
+				break
+			position += window
+			window *= 2
+
+		# Offset & limit can only be calulated once we have ensured the user has
+		# access to those records.
+		page = accepted[offset:offset + limit]
 
 		if 'lang' in context:
 			lang = context['lang']
 		else:
 			lang = 'en_US'
 
+		headlines = self.headlines( pool, cr, uid, tsQuery, page, context )
+
 		ret = []
-		i = -1
-		all = cr.fetchall()
-		for x in all:
+		labels = {}
+		for x in page:
 			model_id = x[0]
 			id = x[1]
 			model_label = x[2]
 			model_name = x[3]
 			ranking = x[4]
 
-			# Check security permissions using search
-			try:
-				if not pool.get(model_name).search(cr, uid, [('id','=',id)], context=context):
-					continue
-			except except_orm as e:
-				continue
-			# Check read permissions using because 'search' is not enough and using 'read' 
-			# alone is not enough either. For example, it can allow searching
-			# menu entries restricted to that user.
-			try:
-				pool.get('ir.model.access').check(cr, uid, model_name, 'read')
-			except except_orm as e:
-				continue
-			if model_name == 'ir.attachment':
-				attachment = pool.get(model_name).browse(cr, uid, id, context)
-				if attachment.res_model and attachment.res_id:
-					if not pool.get(attachment.res_model).search(cr, uid, [('id','=',attachment.res_id)], context=context):
-						continue
-
-			# Offset & limit can only be calulated once we have ensured the user has
-			# access to those records.
-			i = i + 1
-			if i < offset:
-				continue
-			if i >= offset + limit:
-				break
-
 			# Search for the translation of the model
-			model_label = pool.get('ir.translation')._get_source(cr, uid, 'ir.model,name', 'model', lang, model_label)
-			if not model_label:
-				model_label = x[2]
+			if model_label not in labels:
+				label = pool.get('ir.translation')._get_source(cr, uid, 'ir.model,name', 'model', lang, model_label)
+				labels[model_label] = label or model_label
+			model_label = labels[model_label]
 
-			d = self.headline( pool, cr, uid, text, id, model_id, model_name, context )
+			d = headlines.get( (model_name, id), { 'name': '', 'headline': '' } ).copy()
 			d['id'] = id
 			d['ranking'] = ranking
 			d['model_id'] = model_id
@@ -35,6 +35,7 @@ import sql_db
 import pooler
 import operator
 import release
+import traceback
 
 class ir_attachment(osv.osv):
 	_name = 'ir.attachment'
@@ -57,6 +58,13 @@ class ir_attachment(osv.osv):
 	}
 ir_attachment()
 
+aggregate_functions = {
+	'sum': 'SUM',
+	'min': 'MIN',
+	'max': 'MAX',
+	'avg': 'AVG',
+}
+
 regex_order = re.compile('^(([a-z0-9_]+|"[a-z0-9_]+")( *desc| *asc)?( *, *|))+$', re.I)
 
 if release.major_version == '5.0':
@@ -72,9 +80,15 @@ class koo_services(netsvc_service):
 
 		if release.major_version == '5.0':
 			self.exportMethod(self.search)
+			self.exportMethod(self.cache_stamp)
+			self.exportMethod(self.execute_many)
+			self.exportMethod(self.aggregate)
 		else:
 			self.exportedMethods = [
 				'search',
+				'cache_stamp',
+				'execute_many',
+				'aggregate',
 			]
 
 	def dispatch(self, method, auth, params):
@@ -91,18 +105,14 @@ class koo_services(netsvc_service):
 		finally:
 			cr.close()
 
-	def exp_search(self, cr, uid, model, filter, offset=0, limit=None, order=None, context=None, count=False, group=False):
-
+	# Returns the table of the model and the tables, where clause and
+	# parameters of the query for the given domain, including record rules.
+	def _where(self, cr, uid, model, filter, context):
 		pool = pooler.get_pool(cr.dbname)
-		if not context:
-			context = {}
-
-		# Check to avoid SQL injection later
-		model = pool.get(model)._name
 		table = pool.get(model)._table
 
-		# compute the where, order by, limit and offset clauses
-		if release.major_Version == '5.0':
+		# compute the where clause
+		if release.major_version == '5.0':
 			(qu1, qu2, tables) = pool.get(model)._where_calc(cr, uid, filter, context=context)
 		else:
 			query = pool.get(model)._where_calc(cr, uid, filter, context=context)
@@ -115,6 +125,23 @@ class koo_services(netsvc_service):
 		else:
 			qu1 = ''
 
+		# construct a clause for the rules :
+		d1, d2 = pool.get('ir.rule').domain_get(cr, uid, model)
+		if d1:
+			qu1 = qu1 and qu1+' and '+d1 or ' where '+d1
+			qu2 += d2
+		return table, tables, qu1, qu2
+
+	def exp_search(self, cr, uid, model, filter, offset=0, limit=None, order=None, context=None, count=False, group=False):
+
+		pool = pooler.get_pool(cr.dbname)
+		if not context:
+			context = {}
+
+		# Check to avoid SQL injection later
+		model = pool.get(model)._name
+		table, tables, qu1, qu2 = self._where(cr, uid, model, filter, context)
+
 		resortField = False
 		resortOrder = False
 		if order:
@@ -139,13 +166,6 @@ class koo_services(netsvc_service):
 		limit_str = limit and ' limit %d' % limit or ''
 		offset_str = offset and ' offset %d' % offset or ''
 
-
-		# construct a clause for the rules :
-		d1, d2 = pool.get('ir.rule').domain_get(cr, uid, model)
-		if d1:
-			qu1 = qu1 and qu1+' and '+d1 or ' where '+d1
-			qu2 += d2
-
 		if count:
 			cr.execute('select count(%s.id) from ' % table +
 					   ','.join(tables) +qu1 + limit_str + offset_str, qu2)
@@ -154,21 +174,201 @@ class koo_services(netsvc_service):
 
 		# execute the "main" query to fetch the ids we were searching for
 		if group:
-			cr.execute('select %s.id, %s from ' % (table, group) + ','.join(tables) +qu1+' order by '+order_by+limit_str+offset_str, qu2)
+			# Returns (id, group number) pairs where consecutive records with
+			# the same value in the 'group' field share the group number, so
+			# the client knows where groups start without reading records.
+			column = pool.get(model)._columns.get(group)
+			if group != 'id' and (not column or not column._classic_write):
+				raise orm.except_orm('ValidateError', 'Field %s can not be used for grouping' % group)
+			cr.execute('select %s.id, %s."%s" from ' % (table, table, group) + ','.join(tables) +qu1+' order by '+order_by+limit_str+offset_str, qu2)
 			res = []
-			counter = 0
+			counter = -1
 			last_value = None
-			for record in cr.fetchall():
-				if last_value != x[1]:
+			for x in cr.fetchall():
+				if counter < 0 or last_value != x[1]:
 					last_value = x[1]
 					counter += 1
-				res = [(x[0], counter)]
+				res.append((x[0], counter))
 		else:
 			cr.execute('select %s.id from ' % table + ','.join(tables) +qu1+' order by '+order_by+limit_str+offset_str, qu2)
 			res = [x[0] for x in cr.fetchall()]
 
 		return res
 
+	def aggregate(self, db, uid, passwd, model, filter, aggregates, context=None, groupby=None):
+		security.check(db, uid, passwd)
+		conn = sql_db.db_connect(db)
+		cr = conn.cursor()
+		try:
+			return self.exp_aggregate(cr, uid, model, filter, aggregates, context, groupby)
+		finally:
+			cr.close()
+
+	# Computes aggregates of the records matching 'filter' without reading
+	# them. 'aggregates' is a dictionary of field name -> function ('sum',
+	# 'min', 'max' or 'avg') and a dictionary of field name -> value is
+	# returned. Only stored integer and float fields can be aggregated.
+	#
+	# If a list of 'groupby' fields is given, a list of (group values,
+	# aggregates dictionary) pairs is returned instead, one for each
+	# distinct combination of values of those fields. many2one values are
+	# returned as names, as shown in the client.
+	def exp_aggregate(self, cr, uid, model, filter, aggregates, context=None, groupby=None):
+		pool = pooler.get_pool(cr.dbname)
+		if not context:
+			context = {}
+		if not aggregates and not groupby:
+			return {}
+
+		obj = pool.get(model)
+		# _where() only applies record rules
+		access = pool.get('ir.model.access')
+		access.check(cr, uid, obj._name, 'read')
+		table, tables, qu1, qu2 = self._where(cr, uid, obj._name, filter, context)
+
+		groupby = groupby or []
+		group_select = []
+		for name in groupby:
+			column = obj._columns.get(name)
+			if not column or not column._classic_write or column._type in ('binary', 'one2many', 'many2many'):
+				raise orm.except_orm('ValidateError', 'Field %s can not be used for grouping' % name)
+			if column._type == 'many2one':
+				access.check(cr, uid, column._obj, 'read')
+			group_select.append('%s."%s"' % (table, name))
+
+		names = sorted(aggregates.keys())
+		select = []
+		for name in names:
+			function = str(aggregates[name]).lower()
+			column = obj._columns.get(name)
+			if not function in aggregate_functions or not column or not column._classic_write or not column._type in ('integer', 'float'):
+				raise orm.except_orm('ValidateError', 'Field %s can not be aggregated with %s' % (name, function))
+			select.append('%s(%s."%s")' % (aggregate_functions[function], table, name))
+
+		query = 'select ' + ','.join(group_select + select) + ' from ' + ','.join(tables) + qu1
+		if group_select:
+			query += ' group by ' + ','.join(group_select)
+		cr.execute(query, qu2)
+
+		def values(row):
+			res = {}
+			for name, value in zip(names, row):
+				# SUM() and AVG() return numeric values which can't be marshalled
+				# and all functions return NULL if there are no records.
+				if value is None:
+					res[name] = False
+				else:
+					res[name] = float(value)
+			return res
+
+		if not groupby:
+			return values(cr.fetchone())
+
+		rows = cr.fetchall()
+		groups = [list(row[:len(groupby)]) for row in rows]
+		for i, name in enumerate(groupby):
+			column = obj._columns[name]
+			if column._type == 'many2one':
+				ids = list(set([x[i] for x in groups if x[i]]))
+				names_by_id = dict(pool.get(column._obj).name_get(cr, uid, ids, context))
+				for x in groups:
+					x[i] = x[i] and names_by_id.get(x[i], False) or False
+			else:
+				for x in groups:
+					if x[i] is None:
+						x[i] = False
+					elif column._type == 'float':
+						x[i] = float(x[i])
+		return [(group, values(row[len(groupby):])) for group, row in zip(groups, rows)]
+
+	def cache_stamp(self, db, uid, passwd, context=None):
+		security.check(db, uid, passwd)
+		conn = sql_db.db_connect(db)
+		cr = conn.cursor()
+		try:
+			return self.exp_cache_stamp(cr, uid, context)
+		finally:
+			cr.close()
+
+	# Returns a string which changes whenever views, fields, actions or
+	# installed modules change, so the client knows whether it can keep
+	# using the views it stored on disk.
+	#
+	# Translations of the user language and the groups of the user are
+	# included too, as they change labels and which parts of a view are
+	# returned. Neither table keeps modification dates so the translations
+	# are hashed and the group ids listed.
+	def exp_cache_stamp(self, cr, uid, context=None):
+		if not context:
+			context = {}
+		stamp = [release.version]
+		for table in cache_stamp_tables:
+			cr.execute('SELECT MAX(COALESCE(write_date, create_date)), COUNT(*) FROM "%s"' % table)
+			last, count = cr.fetchone()
+			stamp.append('%s:%s:%s' % (table, last, count))
+		cr.execute("""
+			SELECT
+				COUNT(*),
+				SUM(hashtext(COALESCE(name,'') || COALESCE(src,'') || COALESCE(value,'')))
+			FROM
+				ir_translation
+			WHERE
+				lang=%s AND
+				type IN ('field','help','selection','view','model')
+			""", (context.get('lang') or 'en_US',) )
+		count, checksum = cr.fetchone()
+		stamp.append('ir_translation:%s:%s' % (count, checksum))
+		cr.execute("SELECT gid FROM res_groups_users_rel WHERE uid=%s ORDER BY gid", (uid,) )
+		stamp.append('res_groups_users_rel:%s' % ','.join([str(x[0]) for x in cr.fetchall()]))
+		return ';'.join(stamp)
+
+	def execute_many(self, db, uid, passwd, calls):
+		security.check(db, uid, passwd)
+		conn = sql_db.db_connect(db)
+		cr = conn.cursor()
+		try:
+			return self.exp_execute_many(cr, uid, calls)
+		finally:
+			cr.close()
+
+	# Executes a list of [model, method, args] calls, as the execute method of
+	# the object service would, so the client can send them in a single round
+	# trip. Returns a dict per call with either its 'result' or the
+	# 'exception' and 'traceback' it raised.
+	#
+	# Each call is executed by the object service in its own transaction, so
+	# 'cr' is only used to know the database.
+	def exp_execute_many(self, cr, uid, calls):
+		service = netsvc.LocalService('object_proxy')
+		res = []
+		for model, method, args in calls:
+			try:
+				res.append({
+					'result': service.execute(cr.dbname, uid, model, method, *args),
+				})
+			except osv.except_osv as e:
+				res.append({
+					'exception': 'warning -- %s\n\n%s' % (e.name, e.value),
+					'traceback': traceback.format_exc(),
+				})
+			except Exception as e:
+				res.append({
+					'exception': str(e),
+					'traceback': traceback.format_exc(),
+				})
+		return res
+
+# Tables whose changes invalidate the views and actions cached by the client
+cache_stamp_tables = [
+	'ir_ui_view',
+	'ir_model_fields',
+	'ir_values',
+	'ir_act_window',
+	'ir_act_report_xml',
+	'ir_module_module',
+	'nan_koo_cache_exception',
+]
+
 koo_services()
 paths = list(xmlrpc.server.SimpleXMLRPCRequestHandler.rpc_paths) + ['/xmlrpc/koo' ]
 xmlrpc.server.SimpleXMLRPCRequestHandler.rpc_paths = tuple(paths)
@@ -341,6 +541,31 @@ class nan_koo_view_settings(osv.osv):
 			result.append( (setting.id, '%s (%s)' % (settings.view.name, settings.user.name)) )
 		return result
 
+	# Returns the settings of all views of the user as a list of
+	# (view id, data) pairs, so the client can load them in a single call.
+	def get_user_settings(self, cr, uid, context=None):
+		cr.execute('SELECT "view", data FROM nan_koo_view_settings WHERE "user"=%s AND "view" IS NOT NULL', (uid,))
+		return [(view, data or False) for view, data in cr.fetchall()]
+
+	# Stores the settings of the user for several views at once. 'settings'
+	# is a list of (view id, data) pairs. Existing settings are updated and
+	# the missing ones created.
+	def set_user_settings(self, cr, uid, settings, context=None):
+		cr.execute('SELECT "view", id FROM nan_koo_view_settings WHERE "user"=%s', (uid,))
+		existing = dict(cr.fetchall())
+		for view, data in settings:
+			if view in existing:
+				self.write(cr, uid, [existing[view]], {
+					'data': data,
+				}, context)
+			else:
+				existing[view] = self.create(cr, uid, {
+					'user': uid,
+					'view': view,
+					'data': data,
+				}, context)
+		return True
+
 nan_koo_view_settings()
 
 class nan_koo_cache_exceptions(osv.osv):
@@ -25,36 +25,36 @@
 #
 ##############################################################################
 
-from threading import Thread, Semaphore, Lock
+from threading import Thread, Semaphore, Lock, Event
 import netsvc
 import time
 from workflow.wkf_service import workflow_service
+from service import security
 import xmlrpc.server
 import release
 
+# Publishes the expression to the clients subscribed to it. The service
+# doesn't export publish() so it can only be called from the server.
+def publish(expression, ids=None):
+	if release.major_version == '5.0':
+		netsvc.SERVICES['subscription'].publish(expression, ids)
+	else:
+		netsvc.ExportService.getService('subscription').publish(expression, ids)
+
 class new_workflow_service(workflow_service):
 	def __init__(self, name='workflow', audience='*'):
 		workflow_service.__init__(self, name, audience)
 	
 	def trg_create(self, uid, res_type, res_id, cr):
-		if release.major_version == '5.0':
-			netsvc.LocalService('subscription').publish( 'updated_model:%s' % res_type )
-		else:
-			netsvc.ExportService.getService('subscription').publish( 'updated_model:%s' % res_type )
+		publish('updated_model:%s' % res_type, [res_id])
 		return workflow_service.trg_create(self, uid, res_type, res_id, cr)
 
 	def trg_write(self, uid, res_type, res_id, cr):
-		if release.major_version == '5.0':
-			netsvc.LocalService('subscription').publish( 'updated_model:%s' % res_type )
-		else:
-			netsvc.ExportService.getService('subscription').publish( 'updated_model:%s' % res_type )
+		publish('updated_model:%s' % res_type, [res_id])
 		return workflow_service.trg_write(self, uid, res_type, res_id, cr)
 
 	def trg_delete(self, uid, res_type, res_id, cr):
-		if release.major_version == '5.0':
-			netsvc.LocalService('subscription').publish( 'updated_model:%s' % res_type )
-		else:
-			netsvc.ExportService.getService('subscription').publish( 'updated_model:%s' % res_type )
+		publish('updated_model:%s' % res_type, [res_id])
 		return workflow_service.trg_delete(self, uid, res_type, res_id, cr)
 new_workflow_service()
 
@@ -64,6 +64,32 @@ else:
 	import service
 	netsvc_service = service.web_services._ObjectService
 
+# Seconds a channel is kept after its client stopped listening
+CHANNEL_TIMEOUT = 600
+# Seconds events are accumulated before replying to a listening channel so
+# bursts of changes are sent together.
+COALESCE_DELAY = 0.3
+
+# A channel carries all subscriptions of a client. Events published for its
+# expressions are accumulated, with the ids of the records involved, until
+# the client listens for them.
+class subscription_channel(object):
+	def __init__(self):
+		self.version = -1
+		self.expressions = set()
+		# expression -> set of ids or None if unknown
+		self.events = {}
+		self.ready = Event()
+		self.listening = 0
+		self.last_seen = time.time()
+
+	def add_event(self, expression, ids):
+		if ids is None or self.events.get(expression, True) is None:
+			self.events[expression] = None
+		else:
+			self.events.setdefault(expression, set()).update(ids)
+		self.ready.set()
+
 class subscription_services(netsvc_service):
 	def __init__(self, name="subscription"):
 		netsvc_service.__init__(self,name)
@@ -71,17 +97,21 @@ class subscription_services(netsvc_service):
 
 		if release.major_version == '5.0':
 			self.exportMethod(self.wait)
-			self.exportMethod(self.publish)
+			self.exportMethod(self.subscribe)
+			self.exportMethod(self.listen)
 		else:
 			self.exportedMethods = [
 				'wait',
-				'publish',
+				'subscribe',
+				'listen',
 			]
-		self.subscriptions = []
-		self.connections = {}
 		self.lock = Lock()
-		self.queue = []
-		self.waits = []
+		# (db, uid, channel) -> subscription_channel
+		self.channels = {}
+		# expression -> set of channels subscribed to it
+		self.subscribers = {}
+		# expression -> list of semaphores of 'wait' calls
+		self.waits = {}
 
 	def dispatch(self, method, auth, params):
 		if not method in self.exportedMethods:
@@ -89,41 +119,125 @@ class subscription_services(netsvc_service):
 		return self.common_dispatch(method, auth, params)
 
 	def wait(self, db, uid, passwd, expression, context=None):
-                security.check(db, uid, passwd)
-                conn = sql_db.db_connect(db)
-                cr = conn.cursor()
-                result = self.exp_wait(cr, uid, expression, context)
-                cr.close()
-                return result
+		security.check(db, uid, passwd)
+		return self._wait(expression)
 
 	def exp_wait(self, cr, uid, expression, context=None):
-		self.lock.acquire()
+		return self._wait(expression)
+
+	# Blocks until the given expression is published. Kept for clients that
+	# don't use channels.
+	def _wait(self, expression):
 		currentLock = Semaphore(0)
-		self.waits.append( {'expression': expression, 'lock': currentLock } )
-		self.lock.release()
+		self.lock.acquire()
+		try:
+			self.waits.setdefault(expression, []).append(currentLock)
+		finally:
+			self.lock.release()
 		currentLock.acquire()
 		# Ensure we don't reply too fast when client and server are on the same
 		# machine
-		time.sleep(0.3)
+		time.sleep(COALESCE_DELAY)
+		return True
+
+	def subscribe(self, db, uid, passwd, channel, version, expressions):
+		security.check(db, uid, passwd)
+		return self._subscribe((db, uid, channel), version, expressions)
+
+	def exp_subscribe(self, cr, uid, channel, version, expressions):
+		return self._subscribe((cr.dbname, uid, channel), version, expressions)
+
+	# Sets the expressions the channel is subscribed to. Updates with a
+	# version older than the current one are ignored.
+	def _subscribe(self, key, version, expressions):
+		self.lock.acquire()
+		try:
+			self._remove_expired()
+			channel = self.channels.get(key)
+			if not channel:
+				channel = subscription_channel()
+				self.channels[key] = channel
+			channel.last_seen = time.time()
+			if version < channel.version:
+				return True
+			channel.version = version
+			expressions = set(expressions)
+			for expression in channel.expressions - expressions:
+				self._unsubscribe(channel, expression)
+			for expression in expressions - channel.expressions:
+				self.subscribers.setdefault(expression, set()).add(channel)
+			channel.expressions = expressions
+		finally:
+			self.lock.release()
+		return True
+
+	def listen(self, db, uid, passwd, channel, timeout=60):
+		security.check(db, uid, passwd)
+		return self._listen((db, uid, channel), timeout)
 
-	def publish(self, expression):
+	def exp_listen(self, cr, uid, channel, timeout=60):
+		return self._listen((cr.dbname, uid, channel), timeout)
+
+	# Waits up to 'timeout' seconds for events on the channel. Returns a list
+	# of [expression, ids] pairs, where ids is False if unknown, or False if
+	# the channel doesn't exist (it expired or the server was restarted) and
+	# the client must subscribe again.
+	def _listen(self, key, timeout=60):
+		self.lock.acquire()
+		try:
+			channel = self.channels.get(key)
+			if not channel:
+				return False
+			channel.listening += 1
+		finally:
+			self.lock.release()
+		try:
+			if channel.ready.wait(min(timeout, CHANNEL_TIMEOUT)):
+				time.sleep(COALESCE_DELAY)
+		finally:
+			self.lock.acquire()
+			try:
+				channel.listening -= 1
+				channel.last_seen = time.time()
+				events = channel.events
+				channel.events = {}
+				channel.ready.clear()
+			finally:
+				self.lock.release()
+		return [[expression, ids is not None and sorted(ids) or False]
+			for expression, ids in events.items()]
+
+	# Notifies the channels subscribed to 'expression'. Only those channels
+	# are visited so the cost doesn't depend on the number of subscriptions
+	# of other expressions.
+	def publish(self, expression, ids=None):
 		self.lock.acquire()
-		waits = self.waits[:]
-		remove = []
-		for wait in waits:
-			if wait['expression'] == expression:
-				wait['lock'].release()
-				self.waits.remove( wait )
-		self.lock.release()
-
-	def connection(self, host):
-		if host in connections:
-			data = connections[host]
-			return Pyro.core.getProxyForURI( 'PYROLOC://%s:%s' % ( data['host'], data['port'] ) )
-		self.proxy = Pyro.core.getProxyForURI( self.url )
+		try:
+			for channel in self.subscribers.get(expression, ()):
+				channel.add_event(expression, ids)
+			for currentLock in self.waits.pop(expression, []):
+				currentLock.release()
+		finally:
+			self.lock.release()
+
+	def _unsubscribe(self, channel, expression):
+		channels = self.subscribers.get(expression)
+		if channels is None:
+			return
+		channels.discard(channel)
+		if not channels:
+			del self.subscribers[expression]
+
+	def _remove_expired(self):
+		limit = time.time() - CHANNEL_TIMEOUT
+		for key, channel in list(self.channels.items()):
+			if channel.listening or channel.last_seen > limit:
+				continue
+			for expression in channel.expressions:
+				self._unsubscribe(channel, expression)
+			del self.channels[key]
 
 subscription_services()
 
 paths = list(xmlrpc.server.SimpleXMLRPCRequestHandler.rpc_paths) + ['/xmlrpc/subscription' ]
 xmlrpc.server.SimpleXMLRPCRequestHandler.rpc_paths = tuple(paths)
-
@@ -37,49 +37,72 @@ import shutil
 import codecs
 import re
 import threading
+import hashlib
 import pooler
+import tools
 
 from . import ocr
 from PyQt5.QtCore import *
 
+PROCESSING = 'Processing document...'
+
 # This class overrides the default ir_attachment class and adds the ability to
 # obtain text from the file. Text is extracted using strigi and if it fails
 # it will try to treat the file as an image and OCR it.
 # Information found is stored in a new field called 'metainfo' that if indexed
 # using the Full Text Search module it can be used to find documents easily.
+#
+# Extraction is not done in the transaction that creates or modifies the
+# attachment: a job is queued in 'smart_attach.job' and processed by a fixed
+# number of worker threads (see ExtractionPool). Files whose content has
+# already been processed reuse the existing text, found by 'metainfo_hash'.
 class ir_attachment(osv.osv):
 	_name = 'ir.attachment'
 	_inherit = 'ir.attachment'
 	_columns = {
-		'metainfo': fields.text('Meta Information', help='Text automatically extracted from the attached file.')
+		'metainfo': fields.text('Meta Information', help='Text automatically extracted from the attached file.'),
+		'metainfo_hash': fields.char('Content Hash', size=40, readonly=True, select=True, help='SHA-1 of the attached file, used to avoid extracting text from the same file twice.'),
 	}
 
+	# Sets 'metainfo' and 'metainfo_hash' in vals and returns True if
+	# extraction is needed.
+	def prepareMetaInfo(self, cr, vals):
+		if not vals['datas']:
+			vals['metainfo'] = ''
+			vals['metainfo_hash'] = False
+			return False
+		datas = vals['datas']
+		if isinstance( datas, str ):
+			datas = datas.encode('ascii', 'ignore')
+		vals['metainfo_hash'] = hashlib.sha1( datas ).hexdigest()
+		cr.execute("SELECT metainfo FROM ir_attachment WHERE metainfo_hash=%s AND metainfo IS NOT NULL AND metainfo != %s LIMIT 1", (vals['metainfo_hash'], PROCESSING) )
+		row = cr.fetchone()
+		if row:
+			vals['metainfo'] = row[0]
+			return False
+		vals['metainfo'] = PROCESSING
+		return True
+
 	# This is standard create but extracting meta information first
 	def create(self, cr, uid, vals, context=None):
+		extract = False
 		if 'datas' in vals:
-			if vals['datas']:
-				vals['metainfo'] = 'Processing document...'
-			else:
-				vals['metainfo'] = ''
+			extract = self.prepareMetaInfo(cr, vals)
 		id = super(ir_attachment, self).create(cr, uid, vals, context)
-		if 'datas' in vals:
-			ctx = context and context.copy() or None
-			thread = threading.Thread(target=updateMetaInfo, args=(cr.dbname, uid, [id]))
-			thread.start()
+		if extract:
+			self.pool.get('smart_attach.job').enqueue(cr, uid, [id], context)
 		return id
 
 	# This is standard write but extracting meta information first
 	def write(self, cr, uid, ids, vals, context=None):
+		extract = False
 		if 'datas' in vals:
-			if vals['datas']:
-				vals['metainfo'] = 'Processing document...'
-			else:
-				vals['metainfo'] = ''
+			extract = self.prepareMetaInfo(cr, vals)
 		ret = super(ir_attachment, self).write(cr, uid, ids, vals, context)
-		if 'datas' in vals:
-			ctx = context and context.copy() or None
-			thread = threading.Thread(target=updateMetaInfo, args=(cr.dbname, uid, [ids]))
-			thread.start()
+		if extract:
+			if isinstance(ids, int):
+				ids = [ids]
+			self.pool.get('smart_attach.job').enqueue(cr, uid, ids, context)
 		return ret
 
 	# Extracts data from text nodes of an XML node list
@@ -174,25 +197,218 @@ class ir_attachment(osv.osv):
 
 ir_attachment()
 
-def updateMetaInfo(db_name, uid, ids):
-	# As we're creating a new transaction, if update is executed in another thread and very fast,
-	# it may not get latest changes. So we wait a couple of seconds before updating meta information.
-	time.sleep( 2 )
-
-	db, pool = pooler.get_db_and_pool(db_name)
-	cr = db.cursor()
-
-	# Ensure all ids still exist when data is actually updated:
-	# Given this function is called in another process there're chances
-	# the record might have been removed which would cause an 
-	# exception when browsing.
-	ids = pool.get('ir.attachment').search(cr, uid, [('id','in',ids)])
-	for attachment in pool.get('ir.attachment').browse(cr, uid, ids):
-		metainfo = pool.get('ir.attachment').extractMetaInfo( attachment.datas ) or ''
-		# We use SQL directly to update metainfo so last modification time doesn't change.
-		# This avoids messages in the GUI telling that the object has been modified in the
-		# meanwhile. After all, the field is readonly in the GUI so no conflicts can occur.
-		cr.execute("UPDATE ir_attachment SET metainfo=%s WHERE id=%s", (metainfo, attachment.id) )
-	cr.commit()
-	cr.close()
+# Jobs are stored in the database so they survive server restarts and
+# whatever the number of attachments created, only ExtractionPool.size
+# extractions run at the same time.
+class smart_attach_job(osv.osv):
+	_name = 'smart_attach.job'
+	_order = 'id'
+	_columns = {
+		'attachment_id': fields.many2one('ir.attachment', 'Attachment', required=True, ondelete='cascade', select=True),
+		'state': fields.selection([
+			('pending','Pending'),('processing','Processing'),
+			('done','Done'),('error','Error')], 'State', required=True, readonly=True, select=True),
+		'start_date': fields.datetime('Start Date', readonly=True),
+		'end_date': fields.datetime('End Date', readonly=True),
+		'error': fields.text('Error', readonly=True),
+	}
+	_defaults = {
+		'state': lambda *a: 'pending',
+	}
+	# Seconds finished jobs are kept for, which is the period get_stats()
+	# reports about.
+	statsWindow = 3600
+
+	# Queues text extraction of the given attachments. Pending jobs of
+	# the same attachments are replaced.
+	def enqueue(self, cr, uid, attachmentIds, context=None):
+		if not attachmentIds:
+			return True
+		cr.execute("DELETE FROM smart_attach_job WHERE attachment_id IN %s AND state='pending'", (tuple(attachmentIds),) )
+		for id in attachmentIds:
+			cr.execute("INSERT INTO smart_attach_job (attachment_id, state, create_uid, create_date) VALUES (%s, 'pending', %s, now())", (id, uid) )
+		ExtractionPool.instance(cr.dbname).wake()
+		return True
+
+	# Called by the scheduler so jobs queued before a server restart are
+	# processed even if no attachments are created afterwards. Finished
+	# jobs no longer needed by get_stats() are removed.
+	def process_jobs(self, cr, uid, context=None):
+		ExtractionPool.requeueStale(cr)
+		cr.execute("DELETE FROM smart_attach_job WHERE state IN ('done','error') AND end_date < now() - %s * INTERVAL '1 second'", (self.statsWindow,) )
+		ExtractionPool.instance(cr.dbname).wake()
+		return True
+
+	# Returns the number of jobs in each state and the number of files
+	# processed and the average time (in seconds) used per file in the last
+	# statsWindow seconds.
+	def get_stats(self, cr, uid, context=None):
+		stats = {
+			'pending': 0,
+			'processing': 0,
+			'done': 0,
+			'error': 0,
+		}
+		cr.execute("SELECT state, COUNT(*) FROM smart_attach_job GROUP BY state")
+		for state, count in cr.fetchall():
+			stats[state] = count
+		cr.execute("""
+			SELECT
+				COUNT(*),
+				AVG(EXTRACT(EPOCH FROM end_date - start_date))
+			FROM
+				smart_attach_job
+			WHERE
+				state IN ('done','error') AND
+				end_date > now() - %s * INTERVAL '1 second'
+			""", (self.statsWindow,))
+		row = cr.fetchone()
+		stats['processed_last_hour'] = row[0]
+		stats['average_time'] = float(row[1] or 0.0)
+		stats['workers'] = ExtractionPool.size
+		return stats
+
+smart_attach_job()
+
+class ExtractionPool(object):
+	"""
+	Fixed set of threads that process the pending jobs of a database.
+
+	The number of threads can be set with the 'smart_attach_workers'
+	configuration option. Threads are started the first time the pool of a
+	database is used and wait for new jobs when the queue is empty.
+	"""
+	size = max(1, int(tools.config.get('smart_attach_workers', 2)))
+	pollInterval = 5
+	# Seconds after which a job still being processed is considered to
+	# belong to a server that stopped and is processed again
+	staleTimeout = 3600
+	pools = {}
+	poolsLock = threading.Lock()
+
+	def __init__(self, dbName):
+		self.dbName = dbName
+		self.condition = threading.Condition()
+		self.signaled = False
+		self.threads = []
+
+	@staticmethod
+	def instance(dbName):
+		ExtractionPool.poolsLock.acquire()
+		try:
+			pool = ExtractionPool.pools.get(dbName)
+			if not pool:
+				pool = ExtractionPool(dbName)
+				ExtractionPool.pools[dbName] = pool
+				pool.start()
+			return pool
+		finally:
+			ExtractionPool.poolsLock.release()
+
+	# Sets back to pending the jobs that were being processed when their
+	# server stopped. Other servers (or processes) may be using the same
+	# database so only jobs started more than staleTimeout seconds ago are
+	# considered.
+	@staticmethod
+	def requeueStale(cr):
+		cr.execute("UPDATE smart_attach_job SET state='pending' WHERE state='processing' AND start_date < now() - %s * INTERVAL '1 second'", (ExtractionPool.staleTimeout,) )
+
+	def start(self):
+		db = pooler.get_db_only(self.dbName)
+		cr = db.cursor()
+		try:
+			ExtractionPool.requeueStale(cr)
+			cr.commit()
+		finally:
+			cr.close()
+		for x in range(ExtractionPool.size):
+			thread = threading.Thread(target=self.run)
+			thread.setDaemon(True)
+			thread.start()
+			self.threads.append(thread)
+
+	# Wakes the workers up. Note that jobs queued by the current transaction
+	# will only be visible once it's committed, which is why workers also
+	# check the queue every pollInterval seconds.
+	def wake(self):
+		self.condition.acquire()
+		try:
+			self.signaled = True
+			self.condition.notifyAll()
+		finally:
+			self.condition.release()
+
+	def wait(self):
+		self.condition.acquire()
+		try:
+			if not self.signaled:
+				self.condition.wait(ExtractionPool.pollInterval)
+			self.signaled = False
+		finally:
+			self.condition.release()
+
+	def run(self):
+		while True:
+			try:
+				while self.processNext():
+					pass
+			except Exception as e:
+				print("Error processing smart_attach jobs: %s" % e)
+			self.wait()
+
+	# Takes the oldest pending job and processes it. Returns False if
+	# there was no pending job.
+	def processNext(self):
+		db, pool = pooler.get_db_and_pool(self.dbName)
+		cr = db.cursor()
+		try:
+			# Rows being taken by other workers (of this or another server)
+			# are skipped so none of them waits for the others.
+			cr.execute("""
+			UPDATE
+				smart_attach_job
+			SET
+				state='processing',
+				start_date=now()
+			WHERE
+				id = (SELECT id FROM smart_attach_job WHERE state='pending' ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED)
+			RETURNING
+				id, attachment_id, create_uid
+			""")
+			row = cr.fetchone()
+			cr.commit()
+			if not row:
+				return False
+			jobId, attachmentId, uid = row
+			try:
+				updateMetaInfo(cr, pool, uid or 1, attachmentId)
+				cr.execute("UPDATE smart_attach_job SET state='done', end_date=now(), error=NULL WHERE id=%s", (jobId,) )
+			except Exception as e:
+				cr.rollback()
+				cr.execute("UPDATE smart_attach_job SET state='error', end_date=now(), error=%s WHERE id=%s", (str(e), jobId) )
+			cr.commit()
+			return True
+		finally:
+			cr.close()
 
+def updateMetaInfo(cr, pool, uid, id):
+	# Ensure the attachment still exists when data is actually updated:
+	# It might have been removed after the job was queued which would
+	# cause an exception when browsing.
+	attachment = pool.get('ir.attachment')
+	if not attachment.search(cr, uid, [('id','=',id)]):
+		return
+	record = attachment.browse(cr, uid, id)
+	metainfo = None
+	if record.metainfo_hash:
+		# Another job may have processed the same file in the meanwhile
+		cr.execute("SELECT metainfo FROM ir_attachment WHERE metainfo_hash=%s AND id != %s AND metainfo IS NOT NULL AND metainfo != %s LIMIT 1", (record.metainfo_hash, id, PROCESSING) )
+		row = cr.fetchone()
+		if row:
+			metainfo = row[0]
+	if metainfo is None:
+		metainfo = attachment.extractMetaInfo( record.datas ) or ''
+	# We use SQL directly to update metainfo so last modification time doesn't change.
+	# This avoids messages in the GUI telling that the object has been modified in the
+	# meanwhile. After all, the field is readonly in the GUI so no conflicts can occur.
+	cr.execute("UPDATE ir_attachment SET metainfo=%s WHERE id=%s", (metainfo, id) )
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark for RecordGroup id lookups.
+
+Loads 50k ids in a RecordGroup and runs 10k random lookups with
+recordById(), indexOfId() and indexOfRecord(). No server is needed.
+
+Usage: python3 tests/bench_record_group.py
+"""
+import random
+import sys
+import time
+
+sys.path.insert(0, '..')
+sys.path.insert(0, '.')
+
+from Koo.Model.Group import RecordGroup
+
+IDS = 50000
+LOOKUPS = 10000
+
+
+def main():
+    ids = list(range(1000, IDS + 1000))
+    random.shuffle(ids)
+
+    start = time.time()
+    group = RecordGroup('account.invoice.line', {'name': {'type': 'char'}})
+    group.load(ids)
+    # Loading again only appends the ids that aren't in the group yet.
+    group.load(ids[:IDS // 2] + [IDS + 1000])
+    loadTime = time.time() - start
+
+    wanted = [random.choice(ids) for x in range(LOOKUPS)]
+    start = time.time()
+    for ident in wanted:
+        record = group.recordById(ident)
+        assert group.indexOfId(ident) == group.indexOfRecord(record)
+    lookupTime = time.time() - start
+
+    print('load %d ids: %.3fs' % (IDS, loadTime))
+    print('%d random lookups: %.3fs' % (LOOKUPS, lookupTime))
+    # Free records while the group is still alive.
+    group.__del__()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+"""
+Memory benchmark for large record groups.
+
+Loads 100,000 ids with five fields into a RecordGroup, creates all the
+records and fills their values, reporting the resident memory (RSS) used by
+each step. It's compared with records as they were before: connecting their
+signals to the group and keeping a copy of the attrs of every field. Each
+case runs in its own process so memory freed by one doesn't hide the use of
+the other. No server is needed. Linux only, as RSS is read from /proc.
+
+Usage: python3 tests/bench_record_memory.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, '..')
+sys.path.insert(0, '.')
+
+from PyQt5.QtCore import QCoreApplication
+
+from Koo.Model.Group import RecordGroup
+
+RECORDS = 100000
+
+FIELDS = {
+    'name': {'type': 'char'},
+    'ref': {'type': 'char'},
+    'amount': {'type': 'float'},
+    'qty': {'type': 'integer'},
+    'partner_id': {'type': 'many2one', 'relation': 'res.partner'},
+}
+
+
+def rss():
+    """
+    Returns the resident memory of the process in MB.
+    """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def measure(baseline):
+    """
+    Prints the MB used by ids, records and values, and the seconds spent.
+    """
+    app = QCoreApplication(sys.argv)
+    group = RecordGroup('sale.order', FIELDS)
+    base = rss()
+    # Start at 1000 so no record has id 2, which Record.__del__ debugs.
+    group.load(list(range(1000, 1000 + RECORDS)))
+    ids = rss()
+    start = time.time()
+    for i in range(RECORDS):
+        record = group.recordByIndex(i)
+        if baseline:
+            # Groups connected to the signals of each record
+            record.recordChanged.connect(group.recordChanged)
+            record.recordModified.connect(group.recordModified)
+    created = rss()
+    for i in range(RECORDS):
+        record = group.recordByIndex(i)
+        record.set({
+            'name': 'Order %d' % i,
+            'ref': 'R%d' % i,
+            'amount': i * 1.5,
+            'qty': i,
+            'partner_id': False,
+        }, signal=False)
+        if baseline:
+            # Records kept a copy of the attrs of each field
+            for name, field in group.fieldObjects.items():
+                record._stateAttributes[name] = field.attrs.copy()
+    loaded = rss()
+    print("%.1f %.1f %.1f %.1f" % (ids - base, created - ids,
+                                   loaded - created, time.time() - start))
+    sys.stdout.flush()
+    # Skip tearing down 100,000 QObjects one by one.
+    os._exit(0)
+
+
+def run(mode):
+    output = subprocess.check_output([sys.executable, __file__, mode])
+    return [float(x) for x in output.split()]
+
+
+def main():
+    if len(sys.argv) > 1:
+        measure(sys.argv[1] == 'baseline')
+    before = run('baseline')
+    after = run('current')
+    print("%d records, %d fields" % (RECORDS, len(FIELDS)))
+    print("           before     after")
+    for i, name in enumerate(('ids', 'records', 'values')):
+        print("%-8s %7.1f MB %7.1f MB" % (name, before[i], after[i]))
+    print("%-8s %7.1f s  %7.1f s" % ('time', before[3], after[3]))
+
+
+if __name__ == '__main__':
+    main()
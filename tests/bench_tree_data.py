@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark for KooModel.data().
+
+Simulates repainting a list view with 40 columns (chars, floats, dates,
+selections and many2ones) and a colors expression, comparing the cached
+data() with computing every cell as the model did before. No server is
+needed.
+
+Usage: QT_QPA_PLATFORM=offscreen python3 tests/bench_tree_data.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, '..')
+sys.path.insert(0, '.')
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+
+from Koo.Common import Localization
+from Koo.Model.Group import RecordGroup
+from Koo.Model.KooModel import KooModel
+
+ROWS = 500
+COLUMNS = 40
+REPAINTS = 5
+ROLES = (Qt.DisplayRole, Qt.ForegroundRole, Qt.TextAlignmentRole)
+
+SELECTION = [('s%d' % i, 'State %d' % i) for i in range(30)]
+
+
+def fields():
+    result = {}
+    for i in range(COLUMNS):
+        kind = i % 5
+        if kind == 0:
+            result['f%d' % i] = {'type': 'char', 'string': 'F'}
+        elif kind == 1:
+            result['f%d' % i] = {'type': 'float', 'digits': (16, 2),
+                                 'string': 'F'}
+        elif kind == 2:
+            result['f%d' % i] = {'type': 'date', 'string': 'F'}
+        elif kind == 3:
+            result['f%d' % i] = {'type': 'selection', 'string': 'F',
+                                 'selection': SELECTION}
+        else:
+            result['f%d' % i] = {'type': 'integer', 'string': 'F'}
+    return result
+
+
+def values(row):
+    result = {}
+    for i in range(COLUMNS):
+        kind = i % 5
+        if kind == 0:
+            result['f%d' % i] = 'Text %d' % row
+        elif kind == 1:
+            result['f%d' % i] = row * 1234.5
+        elif kind == 2:
+            result['f%d' % i] = '2020-01-%02d' % (row % 28 + 1)
+        elif kind == 3:
+            result['f%d' % i] = SELECTION[row % 30][0]
+        else:
+            result['f%d' % i] = row
+    return result
+
+
+def repaint(model, data):
+    start = time.time()
+    for repeat in range(REPAINTS):
+        for row in range(ROWS):
+            for column in range(COLUMNS):
+                index = model.index(row, column)
+                for role in ROLES:
+                    data(index, role)
+    return (time.time() - start) / REPAINTS
+
+
+def main():
+    app = QApplication(sys.argv)
+    Localization.initializeTranslations()
+    definition = fields()
+    group = RecordGroup('sale.order', definition)
+    group.load(list(range(1000, 1000 + ROWS)))
+    for row in range(ROWS):
+        group.recordByIndex(row).set(values(row), signal=False)
+    model = KooModel()
+    model.setFields(definition)
+    model.setFieldsOrder(sorted(definition))
+    model.setColors([('red', "f3 == 's1' and f4 > 10")])
+    model.setRecordGroup(group)
+
+    before = repaint(model, model.computeData)
+    after = repaint(model, model.data)
+    print("%d rows, %d columns, %d roles" % (ROWS, COLUMNS, len(ROLES)))
+    print("uncached: %.1f ms per repaint" % (before * 1000))
+    print("cached:   %.1f ms per repaint" % (after * 1000))
+    print("speedup:  %.1fx" % (before / after))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
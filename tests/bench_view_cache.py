@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+"""
+Micro-benchmark for view cache hits.
+
+Stores a fields_view_get result with 300 fields in the cache and compares
+the latency of a cache hit with the previous implementation, which used
+str(args) as key and copy.deepcopy() on every hit. No server is needed.
+
+Usage: python3 tests/bench_view_cache.py
+"""
+import copy
+import sys
+import time
+
+sys.path.insert(0, '..')
+sys.path.insert(0, '.')
+
+from Koo.Rpc.Cache import ActionViewCache
+
+FIELDS = 300
+HITS = 200
+
+
+class DeepCopyCache:
+    """
+    View cache as it was implemented before frozen values.
+    """
+    def __init__(self):
+        self.cache = {}
+
+    def exists(self, obj, method, *args):
+        return (obj, method, str(args)) in self.cache
+
+    def get(self, obj, method, *args):
+        return copy.deepcopy(self.cache[(obj, method, str(args))])
+
+    def add(self, value, obj, method, *args):
+        self.cache[(obj, method, str(args))] = copy.deepcopy(value)
+
+
+def view():
+    # Use lists instead of tuples as returned by the server
+    fields = {}
+    arch = []
+    for i in range(FIELDS):
+        name = 'field_%d' % i
+        fields[name] = {
+            'type': 'selection' if i % 3 else 'many2one',
+            'string': 'Field %d' % i,
+            'help': 'Help text of field %d' % i,
+            'readonly': False,
+            'required': i % 5 == 0,
+            'states': {'done': [['readonly', True]]},
+            'selection': [['draft', 'Draft'], ['done', 'Done']],
+            'relation': 'res.partner',
+            'context': {},
+            'domain': [],
+        }
+        arch.append('<field name="%s"/>' % name)
+    return {
+        'arch': '<form string="Test">%s</form>' % ''.join(arch),
+        'fields': fields,
+        'toolbar': {'print': [], 'action': [], 'relate': []},
+        'view_id': 1,
+        'model': 'account.invoice',
+    }
+
+
+def measure(cache):
+    args = ('account.invoice', 'fields_view_get', False, 'form',
+            {'lang': 'en_US', 'tz': 'Europe/Madrid', 'active_id': 1})
+    cache.add(view(), '/object', 'execute', *args)
+    start = time.time()
+    for i in range(HITS):
+        if cache.exists('/object', 'execute', *args):
+            cache.get('/object', 'execute', *args)
+    return (time.time() - start) / HITS
+
+
+def main():
+    before = measure(DeepCopyCache())
+    after = measure(ActionViewCache())
+    print("%d fields, %d hits" % (FIELDS, HITS))
+    print("deepcopy: %.3f ms per hit" % (before * 1000))
+    print("frozen:   %.3f ms per hit" % (after * 1000))
+    print("speedup:  %.1fx" % (before / after))
+
+
+if __name__ == '__main__':
+    main()
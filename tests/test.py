@@ -1,4 +1,14 @@
+import os
+import pickle
+import socket
+import socketserver
+import tempfile
+import threading
+import time
 import unittest
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from unittest import mock
+from Koo.Rpc import Rpc
 from Koo.Model.Field import *
 from Koo.Model.Record import Record
 from Koo.Model.Group import RecordGroup
@@ -154,5 +164,1266 @@ class TestRecord(unittest.TestCase):
         rec.set({"name": "ok"})
         self.assertEqual(rec.missingFields(), [])
 
+    def test_state_attributes(self):
+        """
+        Tests attributes changed for a record override the field ones
+
+        :return: None
+        """
+        fields = {
+            "name": {"type": "char", "readonly": False, "required": True},
+        }
+        rg = RecordGroup("res.partner", fields)
+        rec = Record(10, rg)
+        rec.set({"name": "ok"})
+        self.assertFalse(rec.isFieldReadOnly("name"))
+        self.assertTrue(rec.isFieldRequired("name"))
+        # Nothing is stored for fields with their default attributes
+        self.assertFalse(rec.stateAttributes("name"))
+
+        rec.stateAttributes("name")["readonly"] = True
+        self.assertTrue(rec.isFieldReadOnly("name"))
+        self.assertTrue(rec.isFieldRequired("name"))
+
+        rec.updateStateAttributes()
+        self.assertFalse(rec.isFieldReadOnly("name"))
+        self.assertFalse(rec.stateAttributes("name"))
+
+    def test_group_notified(self):
+        """
+        Tests the group is notified of changes in its records
+
+        :return: None
+        """
+        rg = RecordGroup("res.partner", {"name": {"type": "char"}})
+        rg.load([10, 20])
+        rec = rg.recordByIndex(0)
+        changed = []
+        modified = []
+        rg.recordChangedSignal.connect(changed.append)
+        rg.modified.connect(lambda: modified.append(True))
+
+        rec.set({"name": "ok"}, signal=False)
+        self.assertEqual(changed, [rec])
+        self.assertEqual(modified, [])
+        rec.setValue("name", "changed")
+        self.assertIn(rec, changed)
+        self.assertTrue(modified)
+
+        # Removed records don't notify the group anymore
+        rg.removeRecord(rec)
+        del changed[:]
+        del modified[:]
+        rec.set({"name": "ok"})
+        self.assertEqual(changed, [])
+        self.assertEqual(modified, [])
+
+
+class TestRecordGroup(unittest.TestCase):
+    def test_index_lookups(self):
+        """
+        Tests id and record lookups after loading, adding and removing
+
+        :return: None
+        """
+        rg = RecordGroup("res.partner", {"name": {"type": "char"}})
+        rg.load([10, 20, 30])
+        self.assertEqual(rg.indexOfId(20), 1)
+        self.assertEqual(rg.indexOfId(40), -1)
+
+        # Loading existing ids doesn't duplicate them
+        rg.load([20, 40])
+        self.assertEqual(rg.ids(), [10, 20, 30, 40])
+
+        rec = rg.recordById(30)
+        self.assertEqual(rec.id, 30)
+        self.assertEqual(rg.indexOfRecord(rec), 2)
+        self.assertTrue(rg.recordExists(rec))
+
+        rg.load([1, 2], addOnTop=True)
+        self.assertEqual(rg.ids(), [2, 1, 10, 20, 30, 40])
+        self.assertEqual(rg.indexOfRecord(rec), 4)
+
+        rg.removeRecords([rg.recordById(1), rec])
+        self.assertEqual(rg.ids(), [2, 10, 20, 40])
+        self.assertEqual(rg.indexOfId(40), 3)
+        self.assertFalse(rg.recordExists(rec))
+        self.assertEqual(rg.removedRecords, [1, 30])
+
+    def test_index_id_change(self):
+        """
+        Tests a record can be found after its id changes, as when it's saved
+
+        :return: None
+        """
+        rg = RecordGroup("res.partner", {"name": {"type": "char"}})
+        rg.load([1])
+        rec = Record(None, rg, new=True)
+        rg.add(rec)
+        rec.id = 5
+        self.assertIs(rg.recordById(5), rec)
+        self.assertEqual(rg.indexOfId(5), 1)
+
+        rg.clear()
+        self.assertEqual(rg.indexOfId(1), -1)
+        self.assertIsNone(rg.recordById(5))
+
+    def test_search_window(self):
+        """
+        Tests ids are fetched in windows when a search limit is set
+
+        :return: None
+        """
+        serverIds = [7, 6, 5, 4, 3]
+
+        class FakeProxy(object):
+            def search_count(self, domain, context):
+                return len(serverIds)
+
+        def searchIds(service, order, offset=0, limit=None):
+            if limit is None:
+                limit = 2
+            if not limit:
+                return serverIds[offset:]
+            return serverIds[offset:offset + limit]
+
+        rg = RecordGroup("res.partner", {"name": {"type": "char"}})
+        rg.rpc = FakeProxy()
+        rg.searchIds = searchIds
+        rg.setSearchLimit(2)
+        rg.load(serverIds[:2])
+        rg.setSearchWindow(serverIds[:2], ('execute', False))
+        self.assertEqual(rg.count(), 2)
+        self.assertEqual(rg.totalCount(), 5)
+        self.assertTrue(rg.canFetchMore())
+
+        # Models are told where rows will be inserted before they are
+        signals = []
+        rg.recordsAboutToBeInserted.connect(
+            lambda start, end: signals.append(('about', start, end,
+                                               len(rg.records))))
+        rg.recordsInserted.connect(
+            lambda start, end: signals.append(('inserted', start, end,
+                                               len(rg.records))))
+        rg.fetchMore()
+        self.assertEqual(rg.ids(), [7, 6, 5, 4])
+        self.assertEqual(signals, [('about', 2, 3, 2), ('inserted', 2, 3, 4)])
+        rg.fetchAll()
+        self.assertEqual(rg.ids(), serverIds)
+        self.assertEqual(signals[2:], [('about', 4, 4, 4),
+                                       ('inserted', 4, 4, 5)])
+        self.assertFalse(rg.canFetchMore())
+        self.assertEqual(rg.totalCount(), 5)
+
+    def test_aggregates_query(self):
+        """
+        Tests the domain used to compute aggregates on the server
+
+        :return: None
+        """
+        rg = RecordGroup("account.invoice", {"amount": {"type": "float"}})
+        rg.setDomain([("state", "=", "open")])
+        rg.load([10, 20, 30])
+        # Groups not loaded from a search can't use server aggregates
+        self.assertIsNone(rg.aggregatesQuery())
+
+        rg.setSearchWindow([10, 20, 30], ("execute", False))
+        self.assertEqual(rg.aggregatesQuery(), ([("state", "=", "open")], []))
+
+        modified = rg.recordById(20)
+        modified.set({"amount": 5.0}, modified=True)
+        new = Record(None, rg, new=True)
+        rg.add(new)
+        rg.removeRecord(rg.recordById(30))
+        domain, records = rg.aggregatesQuery()
+        self.assertEqual(domain, [("state", "=", "open"),
+                                  ("id", "not in", [30, 20])])
+        self.assertEqual(records, [modified, new])
+
+    def test_chunked_loading(self):
+        """
+        Tests records are loaded in chunks, both blocking and in background
+
+        :return: None
+        """
+        reads = []
+
+        class FakeProxy(object):
+            def read(self, ids, fields, context):
+                reads.append(list(ids))
+                return [{'id': x, 'name': 'Name %d' % x} for x in ids]
+
+        def callAsync(callback, obj, method, *args, **kwargs):
+            values = FakeProxy().read(*args[2:])
+            call = mock.Mock()
+            pending.append(lambda: callback(values, None))
+            return call
+
+        rg = RecordGroup("res.partner", {"name": {"type": "char"}})
+        rg.rpc = FakeProxy()
+        rg.loadChunkSize = 2
+        rg.load([10, 11, 12, 13, 14])
+        progress = []
+        rg.loadProgress.connect(lambda x, y: progress.append((x, y)))
+        rg.ensureAllLoaded()
+        self.assertEqual(reads, [[10, 11], [12, 13], [14]])
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+        self.assertEqual(rg.recordById(14).value('name'), 'Name 14')
+
+        del reads[:]
+        del progress[:]
+        pending = []
+        loaded = []
+        finished = []
+        rg.load([20, 21, 22, 23])
+        rg.recordsLoaded.connect(lambda x: loaded.append([r.id for r in x]))
+        rg.loadFinished.connect(finished.append)
+        with mock.patch.object(Rpc.session, 'callAsync', callAsync):
+            self.assertTrue(rg.loadAllInBackground())
+            self.assertTrue(rg.isLoading())
+            pending.pop(0)()
+            self.assertEqual(loaded, [[20, 21]])
+            self.assertEqual(progress, [(2, 4)])
+            pending.pop(0)()
+        self.assertEqual(loaded, [[20, 21], [22, 23]])
+        self.assertEqual(finished, [True])
+        self.assertFalse(rg.isLoading())
+        self.assertFalse(rg.loadAllInBackground())
+
+        # Cancel after the first chunk
+        rg.load([30, 31, 32])
+        with mock.patch.object(Rpc.session, 'callAsync', callAsync):
+            rg.loadAllInBackground()
+            pending.pop(0)()
+            rg.cancelLoading()
+        self.assertEqual(finished, [True, False])
+        self.assertEqual(rg.unloadedIds(), [32])
+
+    def test_batched_names(self):
+        """
+        Tests many2one names are resolved with one name_get per relation
+
+        :return: None
+        """
+        calls = []
+
+        class FakeProxy(object):
+            def __init__(self, model):
+                self.model = model
+
+            def name_get(self, ids, context):
+                calls.append((self.model, sorted(ids)))
+                return [(x, 'Name %d' % x) for x in ids if x != 99]
+
+        fields = {
+            "partner_id": {"type": "many2one", "relation": "res.partner"},
+            "user_id": {"type": "many2one", "relation": "res.users"},
+        }
+        Rpc.session.nameCache.clear()
+        rg = RecordGroup("account.invoice", fields)
+        rg.load([1, 2, 3])
+        with mock.patch('Koo.Model.Group.RpcProxy', FakeProxy):
+            for ident, partner in ((1, 10), (2, 11), (3, 99)):
+                rg.recordById(ident).set({
+                    "partner_id": partner,
+                    "user_id": 1,
+                })
+            self.assertEqual(calls, [])
+            record = rg.recordById(1)
+            record._loaded = True
+            self.assertEqual(record.value("partner_id"), "Name 10")
+            self.assertEqual(sorted(calls), [
+                ("res.partner", [10, 11, 99]),
+                ("res.users", [1]),
+            ])
+            self.assertEqual(rg.recordById(2).value("partner_id"), "Name 11")
+            self.assertEqual(len(calls), 2)
+            # Ids without name are asked again and kept
+            self.assertFalse(rg.recordById(3).value("partner_id"))
+            self.assertEqual(calls[-1], ("res.partner", [99]))
+            self.assertEqual(rg.recordById(3).values["partner_id"], [99, None])
+
+            # Names not queued in this group are fetched too
+            rg.recordById(2).values["partner_id"] = [12, None]
+            self.assertEqual(rg.recordById(2).value("partner_id"), "Name 12")
+            self.assertEqual(calls[-1], ("res.partner", [12]))
+
+            rg.recordById(2).set({"partner_id": "13"})
+            self.assertEqual(rg.recordById(2).values["partner_id"], [13, None])
+            rg.recordById(2).set({"partner_id": "abc"})
+            self.assertFalse(rg.recordById(2).values["partner_id"])
+
+            # Setting the same id doesn't change the value even if its name
+            # is known by one side only
+            field = rg.fieldObjects["partner_id"]
+            record = rg.recordById(1)
+            with mock.patch.object(field, 'changed') as changed:
+                field.set_client(record, 10)
+                self.assertFalse(changed.called)
+                field.set_client(record, 11)
+                self.assertTrue(changed.called)
+
+        # Names are cached in the session and dropped on write
+        self.assertEqual(rg.queueName("res.users", 1), [1, "Name 1"])
+        Rpc.session.nameCache.invalidate("res.users")
+        self.assertEqual(rg.queueName("res.users", 1), [1, None])
+        Rpc.session.nameCache.clear()
+
+        # Only the most recently used names of each model are kept
+        cache = Rpc.NameCache(maxSize=2)
+        cache.add("res.partner", [(10, "A"), (11, "B")])
+        cache.add("res.users", [(10, "C")])
+        self.assertEqual(cache.get("res.partner", 10), "A")
+        cache.add("res.partner", [(12, "D")])
+        self.assertTrue(cache.exists("res.partner", 10))
+        self.assertFalse(cache.exists("res.partner", 11))
+        self.assertTrue(cache.exists("res.partner", 12))
+        self.assertTrue(cache.exists("res.users", 10))
+
+
+class TestKooModel(unittest.TestCase):
+    def test_data_cache(self):
+        """
+        Tests displayed values are cached until their record changes
+
+        :return: None
+        """
+        from PyQt5.QtCore import Qt
+        from Koo.Model.KooModel import KooModel
+        fields = {
+            "name": {"type": "char", "string": "Name"},
+            "state": {"type": "selection", "string": "State",
+                      "selection": [("draft", "Draft"), ("done", "Done")]},
+            "amount": {"type": "float", "string": "Amount",
+                       "digits": (16, 3)},
+        }
+        rg = RecordGroup("res.partner", fields)
+        rg.load([10, 20])
+        for ident in (10, 20):
+            rg.recordById(ident).set({"name": "Name %d" % ident,
+                                      "state": "draft", "amount": 1.5},
+                                     signal=False)
+        model = KooModel()
+        model.setFields(fields)
+        model.setFieldsOrder(["name", "state", "amount"])
+        model.setRecordGroup(rg)
+
+        def display(row, column):
+            return model.data(model.index(row, column), Qt.EditRole).value()
+
+        self.assertEqual(display(0, 0), "Name 10")
+        self.assertEqual(display(0, 1), "Draft")
+        self.assertEqual(display(0, 2), "1.500")
+        self.assertEqual(display(1, 1), "Draft")
+        record = rg.recordById(10)
+        self.assertIn(("state", Qt.EditRole), model.dataCache[record])
+
+        # Changing a record only discards its own values
+        record.setValue("state", "done")
+        self.assertNotIn(record, model.dataCache)
+        self.assertIn(rg.recordById(20), model.dataCache)
+        self.assertEqual(display(0, 1), "Done")
+        self.assertEqual(display(1, 1), "Draft")
+
+        self.assertEqual(model.selectionLabel("state", "done"), "Done")
+        self.assertIsNone(model.selectionLabel("state", "cancel"))
+        self.assertIsNone(model.selectionLabel("state", [1]))
+
+        # Values loaded without notifying each record are not kept
+        changed = []
+        model.dataChanged.connect(
+            lambda left, right: changed.append((left.row(), right.row())))
+        class FakeProxy(object):
+            def read(self, ids, fields, context):
+                return [{"id": x, "name": "Other"} for x in ids]
+
+        display(1, 0)
+        other = rg.recordById(20)
+        other._loaded = False
+        other.values.pop("name")
+        rg.rpc = FakeProxy()
+        rg.ensureRecordLoaded(other)
+        self.assertNotIn(other, model.dataCache)
+        self.assertIn((1, 1), changed)
+        self.assertEqual(display(1, 0), "Other")
+
+        # Colors are computed again when the context changes
+        model.data(model.index(0, 0), Qt.ForegroundRole)
+        self.assertIn(Qt.ForegroundRole, model.dataCache[record])
+        rg.setContext({"lang": "ca_ES"})
+        self.assertNotIn(Qt.ForegroundRole, model.dataCache[record])
+        self.assertIn(("state", Qt.EditRole), model.dataCache[record])
+
+        rg.removeRecord(rg.recordById(20))
+        self.assertEqual(model.dataCache, {})
+
+    def test_grouped_model(self):
+        """
+        Tests group boundaries are kept up to date
+
+        :return: None
+        """
+        from Koo.Model.KooModel import KooModel, KooGroupedModel
+        fields = {"name": {"type": "char", "string": "Name"}}
+        rg = RecordGroup("res.partner", fields)
+        names = ["a", "a", "b", "c", "c", "c"]
+        rg.load(list(range(10, 10 + len(names))))
+        for row, name in enumerate(names):
+            rg.recordByIndex(row).set({"name": name}, signal=False)
+        model = KooModel()
+        model.setFields(fields)
+        model.setRecordGroup(rg)
+        proxy = KooGroupedModel()
+        proxy.setSourceModel(model)
+        self.assertEqual(proxy.starts, [0, 2, 3])
+        self.assertEqual(proxy.rowCount(), 3)
+        self.assertEqual(proxy.mapFromSource(model.index(4, 0)).row(), 2)
+        self.assertEqual(proxy.mapToSource(proxy.index(1, 0)).row(), 2)
+
+        # Changing a value splits or joins groups
+        rg.recordByIndex(1).setValue("name", "z")
+        self.assertEqual(proxy.starts, [0, 1, 2, 3])
+        rg.recordByIndex(1).setValue("name", "b")
+        self.assertEqual(proxy.starts, [0, 1, 3])
+
+        rg.removeRecord(rg.recordByIndex(2))
+        self.assertEqual(proxy.starts, [0, 1, 2])
+        rg.create(default=False, position=1)
+        self.assertEqual(proxy.starts, [0, 1, 2, 3])
+        rg.recordByIndex(1).setValue("name", "c")
+        self.assertEqual(proxy.starts, [0, 1, 2, 3])
+
+        # Groups computed by the server don't need records to be read
+        ids = rg.ids()
+        proxy.setGroups([(ids[0], 0), (ids[1], 1), (ids[2], 2), (ids[3], 3),
+                         (ids[4], 3), (ids[5], 3)])
+        self.assertEqual(proxy.starts, [0, 1, 2, 3])
+        proxy.setGroups([(1, 0)])
+        self.assertEqual(proxy.starts, [0, 1, 2, 3])
+
+        # Views are told when boundaries change
+        layouts = []
+        proxy.layoutChanged.connect(lambda: layouts.append(proxy.rowCount()))
+        rg.recordByIndex(2).setValue("name", "c")
+        self.assertEqual(layouts, [2])
+        rg.recordByIndex(2).setValue("name", "c")
+        rg.recordByIndex(3).setValue("name", "e")
+        self.assertEqual(layouts, [2, 4])
+
+        # Unloaded search results are grouped by the server
+        rg = RecordGroup("res.partner", fields)
+        rg.load([20, 21, 22, 23])
+        rg._searchArgs = ('/koo', 'name')
+        calls = []
+
+        def call(obj, method, *args):
+            calls.append((obj, method) + args)
+            return [(20, 0), (21, 0), (22, 1), (23, 2)]
+
+        model = KooModel()
+        model.setFields(fields)
+        model.setRecordGroup(rg)
+        with mock.patch.object(Rpc.session, 'call', call):
+            proxy.setSourceModel(model)
+        self.assertEqual(proxy.starts, [0, 2, 3])
+        self.assertEqual(calls[0][:3], ('/koo', 'search', 'res.partner'))
+        self.assertEqual(calls[0][-3:], ({}, False, 'name'))
+        self.assertEqual(calls[0][6], 'name')
+        self.assertEqual(rg.unloadedIds(), [20, 21, 22, 23])
+
+
+class TestCalendar(unittest.TestCase):
+    def test_data_source(self):
+        """
+        Tests calendar records are fetched, cached and prefetched by month
+
+        :return: None
+        """
+        import gettext
+        from PyQt5.QtCore import QDate
+        # View modules register themselves with translated names
+        gettext.install("koo")
+        from Koo.View.Calendar.Calendar import CalendarDataSource
+        events = {
+            10: "2024-01-31 10:00:00", 11: "2024-02-01 09:00:00",
+            12: "2024-02-14 12:00:00", 13: "2024-03-02 08:00:00",
+            14: "2024-02-14 16:00:00",
+        }
+        searches = []
+
+        def search(domain):
+            searches.append(domain[-2][2])
+            return [x for x, date in sorted(events.items())
+                    if domain[-2][2] <= date < domain[-1][2]]
+
+        def read(ids):
+            return [{"id": x, "date": events[x], "name": "Event %d" % x}
+                    for x in ids]
+
+        class FakeProxy(object):
+            def search(self, domain, offset, limit, order, context):
+                return search(domain)
+
+            def read(self, ids, fields, context):
+                return read(ids)
+
+        pending = []
+
+        def callAsync(callback, obj, method, *args, **kwargs):
+            function = search if args[1] == "search" else read
+            pending.append(lambda: callback(function(args[2]), None))
+            return mock.Mock()
+
+        fields = {"date": {"type": "datetime"}, "name": {"type": "char"}}
+        rg = RecordGroup("crm.meeting", fields)
+        rg.rpc = FakeProxy()
+        rg.setDomain([("user_id", "=", 1)])
+        rg.load([12, 20])
+        rg.setSearchWindow([12, 20], ("execute", False))
+
+        source = CalendarDataSource(maxPeriods=3)
+        source.setGroup(rg, "date")
+        self.assertTrue(source.isAvailable())
+        loaded = []
+        source.loaded.connect(lambda: loaded.append(True))
+        with mock.patch.object(Rpc.session, "callAsync", callAsync):
+            # Periods not in the cache are fetched without waiting
+            days = source.rowsByDay(QDate(2024, 2, 1), QDate(2024, 2, 29))
+            self.assertEqual(days, {})
+            self.assertEqual(rg.ids(), [12, 20])
+            while not loaded:
+                pending.pop(0)()
+            days = source.rowsByDay(QDate(2024, 2, 1), QDate(2024, 2, 29))
+        self.assertEqual(searches, ["2024-02-01", "2024-03-01", "2024-01-01"])
+        # Records of the month are added to the group and loaded
+        self.assertEqual(rg.ids(), [12, 20, 11, 14])
+        self.assertEqual(rg.recordById(12).value("name"), "Event 12")
+        self.assertEqual(days, {"2024-02-01": [2], "2024-02-14": [0, 3]})
+
+        # Next and previous months are prefetched in the background
+        with mock.patch.object(Rpc.session, "callAsync", callAsync):
+            while pending:
+                pending.pop(0)()
+            # Prefetched periods are not being shown
+            self.assertEqual(loaded, [True])
+            days = source.rowsByDay(QDate(2024, 2, 26), QDate(2024, 3, 3))
+            self.assertEqual(searches[3:], [])
+            self.assertEqual(days, {"2024-03-02": [4]})
+            while pending:
+                pending.pop(0)()
+        self.assertEqual(searches[3:], ["2024-04-01"])
+
+        # Least recently used months are discarded
+        self.assertEqual(list(source._periods.keys()),
+                         [(2024, 2), (2024, 3), (2024, 4)])
+
+        # Records of months no longer shown are removed from the group,
+        # but not those it had before
+        days = source.rowsByDay(QDate(2024, 4, 1), QDate(2024, 4, 30))
+        self.assertEqual(days, {})
+        self.assertEqual(rg.ids(), [12, 20])
+        self.assertEqual(rg.removedRecords, [])
+        self.assertEqual(len(source._periods), 3)
+        days = source.rowsByDay(QDate(2024, 2, 1), QDate(2024, 2, 29))
+        self.assertEqual(rg.ids(), [12, 20, 11, 14])
+
+        # The modified value of a record is used, and modifying a record
+        # discards the cache
+        rg.recordById(12).setValue("date", "2024-02-20 12:00:00")
+        self.assertEqual(len(source._periods), 0)
+        source.prefetch = False
+        with mock.patch.object(Rpc.session, "callAsync", callAsync):
+            source.rowsByDay(QDate(2024, 2, 1), QDate(2024, 2, 29))
+            while pending:
+                pending.pop(0)()
+        days = source.rowsByDay(QDate(2024, 2, 1), QDate(2024, 2, 29))
+        self.assertEqual(days, {"2024-02-01": [2], "2024-02-14": [3],
+                                "2024-02-20": [0]})
+
+        # Groups not loaded from a search use the records they have
+        rg.clear()
+        self.assertFalse(source.isAvailable())
+
+
+class TestCompletion(unittest.TestCase):
+    def test_completion_source(self):
+        """
+        Tests many2one names are searched with a limit and results shared
+
+        :return: None
+        """
+        import gettext
+        from PyQt5.QtCore import QCoreApplication
+        gettext.install("koo")
+        from Koo.Fields.ManyToOne.Completion import CompletionSource
+        app = QCoreApplication.instance() or QCoreApplication([])
+        calls = []
+        pending = []
+
+        def callAsync(callback, obj, method, *args, **kwargs):
+            calls.append(args[2:])
+            names = [(10, "[A1] Agrolait"), (11, "Axelor")]
+            pending.append(lambda: callback(names, None))
+            return mock.Mock()
+
+        source = CompletionSource.instance("res.partner")
+        self.assertIs(source, CompletionSource.instance("res.partner"))
+        self.assertIsNot(source, CompletionSource.instance("res.users"))
+        source.limit = 2
+        completed = []
+        source.completed.connect(completed.append)
+        with mock.patch.object(Rpc.session, "callAsync", callAsync):
+            # Only the last text typed is searched
+            source.complete("a", [("active", "=", True)])
+            source.complete("ax", [("active", "=", True)])
+            self.assertTrue(source.timer.isActive())
+            source.timer.stop()
+            source.query()
+            pending.pop(0)()
+        self.assertEqual(calls, [("ax", [("active", "=", True)], "ilike",
+                                  {}, 2)])
+        self.assertEqual(completed, ["ax"])
+        self.assertEqual(source.model.rowCount(), 2)
+        self.assertEqual(source.model.index(0, 0).data(), "Agrolait")
+        self.assertEqual(
+            source.model.index(0, 0).data(CompletionSource.IdRole), 10)
+
+        # Cached results are used without waiting
+        source.model.clear()
+        source.complete("ax", [("active", "=", True)])
+        self.assertFalse(source.timer.isActive())
+        self.assertEqual(completed, ["ax", "ax"])
+        self.assertEqual(source.model.rowCount(), 2)
+        self.assertEqual(len(calls), 1)
+
+        source.maxEntries = 1
+        source.store("b", [])
+        self.assertEqual(list(source.cache.keys()), ["b"])
+
+
+class TestReport(unittest.TestCase):
+    def test_report_job(self):
+        """
+        Tests reports are polled asynchronously waiting longer each time
+
+        :return: None
+        """
+        import gettext
+        from PyQt5.QtCore import QCoreApplication
+        gettext.install("koo")
+        from Koo.Actions.Actions import ReportJob, ReportManager
+        app = QCoreApplication.instance() or QCoreApplication([])
+        calls = []
+        pending = []
+        states = [False, False, True]
+
+        def executeAsync(callback, obj, method, *args, **kwargs):
+            calls.append(method)
+            if method == 'report':
+                result = 7
+            else:
+                result = {'state': states.pop(0), 'result': 'eA==',
+                          'format': 'pdf'}
+            pending.append(lambda: callback(result, None))
+            return mock.Mock()
+
+        delays = []
+        printed = []
+        manager = ReportManager()
+        counts = []
+        manager.jobsChanged.connect(counts.append)
+        data = {'model': 'sale.order', 'ids': [10], 'form': {'copies': 1}}
+        job = ReportJob('sale.order', data)
+        # Changes made after the report was requested are not used
+        data['form']['copies'] = 2
+        self.assertEqual(job.datas['form'], {'copies': 1})
+        with mock.patch.object(Rpc.session, 'executeAsync', executeAsync), \
+                mock.patch('Koo.Actions.Actions.QTimer.singleShot',
+                           lambda delay, f: (delays.append(delay),
+                                             pending.append(f))), \
+                mock.patch('Koo.Actions.Actions.Printer.printData',
+                           lambda *args: printed.append(args)):
+            manager.add(job)
+            self.assertEqual(manager.count(), 1)
+            while pending:
+                pending.pop(0)()
+        self.assertEqual(calls, ['report', 'report_get', 'report_get',
+                                 'report_get'])
+        self.assertEqual(delays, [250, 375])
+        self.assertEqual(printed[0][1:], ('sale.order', [10]))
+        self.assertEqual(counts, [1, 0])
+
+    def test_write_data(self):
+        """
+        Tests report data is decoded in chunks
+
+        :return: None
+        """
+        import base64
+        import io
+        import zlib
+        import gettext
+        gettext.install("koo")
+        from Koo.Printer import Printer
+        content = bytes(range(256)) * 40
+        encoded = base64.encodebytes(content).decode()
+        fp = io.BytesIO()
+        Printer.writeData(fp, encoded, chunkSize=10)
+        self.assertEqual(fp.getvalue(), content)
+
+        encoded = base64.b64encode(zlib.compress(content)).decode()
+        fp = io.BytesIO()
+        Printer.writeData(fp, encoded, 'zlib', chunkSize=7)
+        self.assertEqual(fp.getvalue(), content)
+
+
+class TestCache(unittest.TestCase):
+    def test_persistent_view_cache(self):
+        """
+        Tests views are kept on disk while the server stamp doesn't change
+
+        :return: None
+        """
+        fd, path = tempfile.mkstemp('.sqlite')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        scope = ('http://localhost:8069', 'db', 1, 'en_US')
+        args = ('res.partner', 'fields_view_get', False, 'form', {})
+        view = {'arch': '<form/>', 'fields': {'name': {'type': 'char'}},
+                'selection': [('draft', 'Draft')], 'toolbar': {1: (2, 3)}}
+
+        cache = Rpc.PersistentViewCache(path)
+        self.assertTrue(cache.open(scope, 'stamp1'))
+        self.assertFalse(cache.exists('/object', 'execute', *args))
+        cache.add(view, '/object', 'execute', *args)
+        # Other calls are not stored
+        cache.add([1], '/object', 'execute', 'res.partner', 'search', [])
+        cache.close()
+
+        cache = Rpc.PersistentViewCache(path)
+        self.assertTrue(cache.open(scope, 'stamp1'))
+        self.assertTrue(cache.exists('/object', 'execute', *args))
+        self.assertEqual(cache.get('/object', 'execute', *args), view)
+        self.assertFalse(cache.exists('/object', 'execute', 'res.partner',
+                                      'search', []))
+        cache.close()
+
+        # Other users don't share entries
+        cache = Rpc.PersistentViewCache(path)
+        cache.open(scope[:2] + (2, 'en_US'), 'stamp1')
+        self.assertFalse(cache.exists('/object', 'execute', *args))
+        cache.close()
+
+        # A new stamp discards entries
+        cache = Rpc.PersistentViewCache(path)
+        cache.open(scope, 'stamp2')
+        self.assertFalse(cache.exists('/object', 'execute', *args))
+        cache.close()
+
+    def test_expression_cache(self):
+        """
+        Tests expressions are compiled once and only use referenced fields
+
+        :return: None
+        """
+        cache = Rpc.ExpressionCache(maxSize=2)
+        code, names = cache.compile("[x for x in lines if x > amount]")
+        self.assertEqual(names, {"lines", "amount"})
+        self.assertIs(cache.compile("[x for x in lines if x > amount]")[0],
+                      code)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(eval(code, {"lines": [1, 5], "amount": 2}), [5])
+        self.assertRaises(SyntaxError, cache.compile, "state ==")
+
+        rg = RecordGroup("res.partner", {"name": {"type": "char"},
+                                         "state": {"type": "char"}})
+        rec = Record(10, rg)
+        rec.set({"name": "ok", "state": "draft"})
+        read = []
+        field = rg.fieldObjects["name"]
+        original = field.get
+        with mock.patch.object(field, "get", lambda *args, **kwargs:
+                               read.append(True) or original(*args, **kwargs)):
+            self.assertTrue(rec.evaluateExpression("state == 'draft'"))
+            self.assertEqual(read, [])
+            self.assertTrue(rec.evaluateExpression("name == 'ok' and id == 10"))
+            self.assertEqual(read, [True])
+
+    def test_view_cache_copies(self):
+        """
+        Tests cached values can't be altered by callers
+
+        :return: None
+        """
+        cache = Rpc.ActionViewCache()
+        view = {'arch': '<form/>', 'fields': {'name': {'type': 'char'}},
+                'toolbar': {'action': []}}
+        cache.add(view, '/object', 'execute', 'res.partner',
+                  'fields_view_get', False, 'form', {'lang': 'en_US',
+                                                     'tz': False})
+        view['fields']['name']['type'] = 'text'
+
+        # Contexts with the same items give the same key
+        args = ('res.partner', 'fields_view_get', False, 'form',
+                {'tz': False, 'lang': 'en_US'})
+        self.assertTrue(cache.exists('/object', 'execute', *args))
+        value = cache.get('/object', 'execute', *args)
+        self.assertEqual(value['fields']['name']['type'], 'char')
+        value['toolbar']['action'].append({'name': 'save'})
+        value = cache.get('/object', 'execute', *args)
+        self.assertEqual(value['toolbar']['action'], [])
+
+    def test_view_settings(self):
+        """
+        Tests view settings are loaded at once and stored in batches
+
+        :return: None
+        """
+        from PyQt5.QtCore import QCoreApplication
+        from Koo.Common.ViewSettings import ViewSettings
+        app = QCoreApplication.instance() or QCoreApplication([])
+        calls = []
+
+        def call(obj, method, model, function, *args):
+            calls.append((function,) + args)
+            if function == 'get_user_settings':
+                return [(1, 'one'), (2, False)]
+            return True
+
+        ViewSettings.clear()
+        with mock.patch.object(Rpc.session, 'call', call):
+            self.assertEqual(ViewSettings.load(1), 'one')
+            self.assertIsNone(ViewSettings.load(2))
+            self.assertIsNone(ViewSettings.load(3))
+            self.assertEqual(calls, [('get_user_settings',)])
+
+            # Unchanged settings are not stored
+            ViewSettings.store(1, 'one')
+            ViewSettings.store(1, 'two')
+            ViewSettings.store(3, 'three')
+            ViewSettings.store(1, 'four')
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(ViewSettings.load(1), 'four')
+            ViewSettings.flush()
+            self.assertEqual(calls[1], ('set_user_settings',
+                                        [(1, 'four'), (3, 'three')]))
+            ViewSettings.flush()
+            self.assertEqual(len(calls), 2)
+
+        # Transient errors keep the settings so they're sent again later
+        def failing(obj, method, model, function, *args):
+            calls.append((function,) + args)
+            raise Rpc.RpcServerException('KeyError', 'Traceback...')
+
+        ViewSettings.store(3, 'five')
+        with mock.patch.object(Rpc.session, 'call', failing):
+            ViewSettings.flush()
+        self.assertTrue(ViewSettings.hasSettingsModule)
+        self.assertTrue(ViewSettings.flushScheduled)
+        self.assertEqual(ViewSettings.pending, {3: 'five'})
+        with mock.patch.object(Rpc.session, 'call', call):
+            ViewSettings.flush()
+        self.assertEqual(calls[-1], ('set_user_settings', [(3, 'five')]))
+
+        # Settings are not sent again if the koo module is missing
+        def missing(obj, method, model, function, *args):
+            calls.append((function,) + args)
+            raise Rpc.RpcServerException(
+                "warning -- Object Error\n\nObject nan.koo.view.settings "
+                "doesn't exist", '')
+
+        ViewSettings.store(3, 'six')
+        with mock.patch.object(Rpc.session, 'call', missing):
+            ViewSettings.flush()
+        self.assertFalse(ViewSettings.hasSettingsModule)
+        self.assertEqual(ViewSettings.pending, {})
+        ViewSettings.clear()
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/xmlrpc/common',)
+
+
+class ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    # Keep-alive connections must not block the server shutdown
+    daemon_threads = True
+    block_on_close = False
+
+
+class TestConnection(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingXMLRPCServer(
+            ('127.0.0.1', 0), KeepAliveRequestHandler, logRequests=False,
+            allow_none=True)
+        self.server.register_function(lambda *args: list(args), 'echo')
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def test_keep_alive(self):
+        """
+        Tests XML-RPC calls reuse the connections of the pool
+
+        :return: None
+        """
+        connection = Rpc.createConnection(self.url)
+        for i in range(3):
+            self.assertEqual(connection.call('/common', 'echo', i, None),
+                             [i, None])
+        self.assertEqual(connection.pool.created, 1)
+
+        connection.connect('db', 1, 'secret')
+        connection.authorized = True
+        clone = connection.clone()
+        self.assertIs(clone.pool, connection.pool)
+        self.assertEqual(clone.call('/common', 'echo'), ['db', 1, 'secret'])
+        self.assertEqual(connection.pool.created, 1)
+
+        self.assertRaises(Rpc.RpcServerException, connection.call,
+                          '/common', 'missing')
+        connection.close()
+        self.assertEqual(connection.pool.idle, [])
+
+    def test_socket(self):
+        """
+        Tests net-rpc calls keep the socket open and reconnect when the
+        server closes it
+
+        :return: None
+        """
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        self.addCleanup(server.close)
+        accepted = []
+
+        def receive(client, size):
+            data = b''
+            while len(data) < size:
+                try:
+                    chunk = client.recv(size - len(data))
+                except OSError:
+                    # Closed by the test
+                    return None
+                if not chunk:
+                    return None
+                data += chunk
+            return data
+
+        def serve():
+            while True:
+                try:
+                    client, address = server.accept()
+                except OSError:
+                    return
+                accepted.append(client)
+                header = receive(client, 9)
+                while header:
+                    message = pickle.loads(receive(client, int(header[:8])))
+                    # Reply with a large value to fill the receive buffer
+                    reply = pickle.dumps([[message[0], b'x' * 100000], None],
+                                         2)
+                    client.sendall(b'%8d0' % len(reply) + reply)
+                    header = receive(client, 9)
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+        url = 'socket://127.0.0.1:%d' % server.getsockname()[1]
+        connection = Rpc.createConnection(url)
+        for i in range(3):
+            result = connection.call('/common', 'echo', i)
+            self.assertEqual(result[0], ('common', 'echo', i))
+            self.assertEqual(len(result[1]), 100000)
+        self.assertEqual(len(accepted), 1)
+
+        # The server closes the socket
+        accepted[0].shutdown(socket.SHUT_RDWR)
+        accepted[0].close()
+        result = connection.call('/common', 'echo', 4)
+        self.assertEqual(result[0], ('common', 'echo', 4))
+        self.assertEqual(len(accepted), 2)
+        connection.close()
+
+    def test_socket_no_resend(self):
+        """
+        Tests net-rpc calls are not sent again once the server may have
+        received them
+
+        :return: None
+        """
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(5)
+        self.addCleanup(server.close)
+        messages = []
+
+        def serve():
+            while True:
+                try:
+                    client, address = server.accept()
+                except OSError:
+                    return
+                while True:
+                    header = client.recv(9)
+                    if not header:
+                        break
+                    size = int(header[:8])
+                    data = b''
+                    while len(data) < size:
+                        data += client.recv(size - len(data))
+                    message = pickle.loads(data)[0]
+                    messages.append(message[1])
+                    if message[1] == 'close':
+                        # Fail after receiving the call
+                        client.close()
+                        break
+                    if message[1] == 'echo':
+                        reply = pickle.dumps([message, None], 2)
+                        client.sendall(b'%8d0' % len(reply) + reply)
+                    # Otherwise never reply
+
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+        url = 'socket://127.0.0.1:%d' % server.getsockname()[1]
+        connection = Rpc.createConnection(url)
+        connection.call('/object', 'echo')
+        with self.assertRaises(Rpc.RpcProtocolException):
+            connection.call('/object', 'close')
+        self.assertEqual(messages, ['echo', 'close'])
+
+        connection.call('/object', 'echo')
+        connection.local.socket.sock.settimeout(0.2)
+        with self.assertRaises(Rpc.RpcProtocolException):
+            connection.call('/object', 'timeout')
+        self.assertEqual(messages, ['echo', 'close', 'echo', 'timeout'])
+        connection.close()
+
+    def test_unsupported_errors(self):
+        """
+        Tests server errors that mean a method can't be used are told apart
+        from transient ones
+
+        :return: None
+        """
+        error = Rpc.RpcServerException(
+            'warning -- ValidateError\n\nField name can not be aggregated', '')
+        self.assertFalse(error.isUnsupported('aggregate'))
+        error = Rpc.RpcServerException("KeyError: 'Method not found: aggregate'",
+                                       'Traceback...')
+        self.assertTrue(error.isUnsupported('aggregate'))
+        self.assertFalse(error.isUnsupported('aggregate_many'))
+        self.assertFalse(error.isUnsupported('execute_many'))
+        error = Rpc.RpcServerException(
+            'KeyError', "Traceback...\nKeyError: 'partner_id'")
+        self.assertFalse(error.isUnsupported('aggregate'))
+        error = Rpc.RpcServerException(
+            "AttributeError: 'nan.koo.view.settings' object has no attribute "
+            "'get_user_settings'", 'Traceback...')
+        self.assertTrue(error.isUnsupported('get_user_settings'))
+        self.assertFalse(error.isUnsupported('set_user_settings'))
+        error = Rpc.RpcServerException(
+            "warning -- Object Error\n\nObject nan.koo.view.settings "
+            "doesn't exist", '')
+        self.assertTrue(error.isUnsupported('get_user_settings',
+                                            'nan.koo.view.settings'))
+        self.assertFalse(error.isUnsupported('get_user_settings',
+                                             'res.partner'))
+        error = Rpc.RpcServerException('timed out', 'Traceback...')
+        self.assertFalse(error.isUnsupported('aggregate'))
+
+    def test_call_many(self):
+        """
+        Tests several calls are sent in a single round trip
+
+        :return: None
+        """
+        class FakeConnection(object):
+            def __init__(self, batch):
+                self.batch = batch
+                self.calls = []
+
+            def call(self, obj, method, *args):
+                self.calls.append((obj, method))
+                if obj == '/koo':
+                    if self.batch == 'error':
+                        raise Rpc.RpcServerException(
+                            'KeyError', "Traceback...\nKeyError: 'name'")
+                    if not self.batch:
+                        raise Rpc.RpcServerException(
+                            "KeyError: 'Method not found: execute_many'", '')
+                    return [{'result': [x[0], x[1]]} if x[1] != 'unlink'
+                            else {'exception': 'warning -- Error\n\nNo',
+                                  'traceback': ''} for x in args[0]]
+                if args[1] == 'unlink':
+                    raise Rpc.RpcServerException('warning -- Error\n\nNo',
+                                                 '')
+                return [args[0], args[1]]
+
+        calls = [
+            ('res.partner', 'fields_view_get', (False, 'form', {})),
+            ('res.partner', 'read', ([1], ['name'])),
+            ('res.partner', 'unlink', ([1],)),
+        ]
+        for batch in (True, False, 'error'):
+            session = Rpc.Session()
+            session.open = True
+            session.cache = Rpc.ActionViewCache()
+            session.connection = FakeConnection(batch)
+            results = session.callMany(calls)
+            self.assertEqual(results[0], ['res.partner', 'fields_view_get'])
+            self.assertEqual(results[1], ['res.partner', 'read'])
+            self.assertIsInstance(results[2], Rpc.RpcServerException)
+            self.assertEqual(results[2].info, 'Error')
+            if batch == 'error':
+                # Other errors don't disable batching for later calls
+                self.assertEqual(len(session.connection.calls), 4)
+                self.assertTrue(session.batchAvailable)
+            elif batch:
+                self.assertEqual(session.connection.calls,
+                                 [('/koo', 'execute_many')])
+            else:
+                self.assertEqual(len(session.connection.calls), 4)
+                self.assertFalse(session.batchAvailable)
+
+            # The view is now in the cache
+            session.connection.calls = []
+            results = session.callMany(calls[:1])
+            self.assertEqual(results[0], ['res.partner', 'fields_view_get'])
+            self.assertEqual(session.connection.calls, [])
+
+    def test_async_calls(self):
+        """
+        Tests asynchronous calls are run by priority in a bounded pool
+
+        :return: None
+        """
+        from PyQt5.QtCore import QCoreApplication
+        app = QCoreApplication.instance() or QCoreApplication([])
+        blocker = threading.Event()
+
+        class FakeConnection(object):
+            calls = []
+
+            def clone(self):
+                return self
+
+            def call(self, obj, method, *args):
+                if method == 'block':
+                    blocker.wait(5)
+                self.calls.append(method)
+                return method
+
+        session = Rpc.Session()
+        session.open = True
+        session.connection = FakeConnection()
+        session.callExecutor = Rpc.SessionCallExecutor(session, 1)
+        results = []
+
+        def callback(value, exception):
+            results.append(value)
+
+        first = session.callAsync(callback, '/object', 'block')
+        while not first.isRunning():
+            time.sleep(0.01)
+        low = session.callAsync(callback, '/object', 'low',
+                                priority=Rpc.AsynchronousSessionCall.LowPriority)
+        cancelled = session.callAsync(callback, '/object', 'cancelled')
+        session.callAsync(callback, '/object', 'high',
+                          priority=Rpc.AsynchronousSessionCall.HighPriority)
+        cancelled.cancel()
+        blocker.set()
+        self.assertTrue(low.wait(5))
+        for i in range(100):
+            if len(results) == 3:
+                break
+            app.processEvents()
+        self.assertEqual(FakeConnection.calls, ['block', 'high', 'low'])
+        self.assertEqual(results, ['block', 'high', 'low'])
+
+        metrics = session.executor().metrics()
+        self.assertEqual(metrics['workers'], 1)
+        self.assertEqual(metrics['completed'], 3)
+        self.assertEqual(metrics['cancelled'], 1)
+        self.assertEqual(metrics['queued'], 0)
+        self.assertEqual(session.executor().calls, set())
+        session.executor().shutdown()
+
+
+class TestSubscriber(unittest.TestCase):
+    def test_channel(self):
+        """
+        Tests all subscribers of a session share a single channel
+
+        :return: None
+        """
+        from PyQt5.QtCore import QCoreApplication
+        app = QCoreApplication.instance() or QCoreApplication([])
+        events = [[['updated_model:res.partner', [1, 2]],
+                   ['updated_model:res.request', False]]]
+
+        class FakeSession(object):
+            open = True
+            url = databaseName = uid = password = None
+            calls = []
+
+            def copy(self):
+                return self
+
+            def call(self, obj, method, *args):
+                self.calls.append((method,) + args)
+                if method == 'listen':
+                    if events:
+                        return events.pop()
+                    time.sleep(0.05)
+                    return []
+                return True
+
+            def callAsync(self, callback, obj, method, *args):
+                callback(self.call(obj, method, *args), None)
+
+        session = FakeSession()
+        partners = Rpc.Subscriber(session)
+        requests = Rpc.Subscriber(session)
+        self.assertIs(partners.channel, requests.channel)
+        received = []
+        partners.publishedIds.connect(lambda ids: received.append(ids))
+        requests.subscribe('updated_model:res.request',
+                           lambda: received.append('request'))
+        partners.subscribe('updated_model:res.partner')
+        def subscribes():
+            return [x for x in session.calls if x[0] == 'subscribe']
+
+        for i in range(200):
+            if len(received) == 2 and subscribes():
+                break
+            app.processEvents()
+            time.sleep(0.01)
+        self.assertEqual(sorted(received, key=str), [[1, 2], 'request'])
+
+        # Both subscriptions are sent in a single call
+        self.assertEqual(len(subscribes()), 1)
+        self.assertEqual(subscribes()[-1][2], 1)
+        self.assertEqual(sorted(subscribes()[-1][3]),
+                         ['updated_model:res.partner',
+                          'updated_model:res.request'])
+        partners.unsubscribe()
+        requests.unsubscribe()
+        for i in range(200):
+            if len(subscribes()) == 2:
+                break
+            app.processEvents()
+            time.sleep(0.01)
+        self.assertEqual(subscribes()[-1][2], 2)
+        self.assertEqual(subscribes()[-1][3], [])
+        partners.channel.stop()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file